@@ -1,17 +1,19 @@
 # Ye Guoquan, A0188947A
 from typing import Dict, Tuple
+import ast
 from lex import Lexer
 from parse import Parser
 from gen import Checker
 from reg import RegisterAllocator
 import sys
 from ir3 import *
+from visitor import Dispatch
 
 class ArmGenException(Exception):
     pass
 
 class ClassStackInfo:
-    def __init__(self, cname : str):
+    def __init__(self, cname : ast.TypeId):
         self.cname = cname
         self.fields = {}
         self.offset = 0
@@ -67,18 +69,41 @@ class Assembly:
 
 
 class ArmGen:
+    # type(stmt) dispatch of the code of a statement
+    stmtHandlers = Dispatch()
+
     def __init__(self, program: Program3):
         self.program = program
         self.stringList = program.stringList
         self.dataTable = {}
         self.classTable = {}
         self.assembly = Assembly()
+        self.exitTag = None # exit label of the method being generated
 
-    def defaultType(self, type: str):
-        if type == "String" or type == "Int" or type == "Void" or type == "Bool":
+    def defaultType(self, type: ast.TypeId):
+        if type == ast.STRING_TYPE or type == ast.INT_TYPE or type == ast.VOID_TYPE or type == ast.BOOL_TYPE:
             return True
         return False
 
+    # loads an operand into register target by its kind, ip is used as scratch for fields
+    def ldrOperand(self, target : str, operand : Operand, varTable : Dict[str, Tuple[str, int]], regMap : Dict[str, str]):
+        if isinstance(operand, IntConst):
+            self.assembly.append(f"   mov   {target}, #{operand}")
+        elif isinstance(operand, StrConst):
+            self.assembly.append(f"   ldr   {target}, ={self.dataTable[operand]} + 0")
+        elif isinstance(operand, BoolConst):
+            self.assembly.append(f"   mov   {target}, #{int(operand.value)}")
+        elif isinstance(operand, NullConst):
+            self.assembly.append(f"   mov   {target}, #0")
+        elif isinstance(operand, Field) and operand.obj is None:
+            self.assembly.ldrGlobal(target, operand.field, varTable, regMap, self.classTable)
+        elif isinstance(operand, Field):
+            offset = self.classTable[varTable[operand.obj][0]].getOffset(operand.field)
+            self.assembly.ldr("ip", operand.obj, varTable, regMap)
+            self.assembly.append(f"   ldr   {target}, [ip,#-{offset}]")
+        else:
+            self.assembly.ldr(target, operand, varTable, regMap)
+
     def genArm(self):
         self.buildDataTable()
         self.buildClassTable()
@@ -135,10 +160,10 @@ class ArmGen:
                 # arguments are immediately saved so that a1-4 can be used as scratch registers
                 self.assembly.str(f"a{i+1}", arg.id, varTable, regMap)
         
-        exitTag = f"{method.id}" + "_exit"
-        self.genBlock(varTable, method.body, regMap, exitTag)
+        self.exitTag = f"{method.id}" + "_exit"
+        self.genBlock(varTable, method.body, regMap)
 
-        self.assembly.append(exitTag + ":")
+        self.assembly.append(self.exitTag + ":")
         self.assembly.append("   mov   sp, fp")
         self.assembly.append("   ldmfd   sp!,{fp,pc,v1,v2,v3,v4,v5}")
 
@@ -146,7 +171,9 @@ class ArmGen:
     # add all arguments and variables into local table
     def buildLocalTable(self, method : CMethod3) -> Dict[str, Tuple[str, int]] :
         varTable = {}
-        offset = 0
+        # fp points at the saved registers, the slots start below them and every variable gets one
+        # however often it is assigned, within the len(varTable)*4 bytes of the frame
+        offset = 4
         
         for arg in method.formals:
             varTable[arg.id] = (arg.type, offset)
@@ -155,78 +182,55 @@ class ArmGen:
         block = method.body
         # I forgot whether argname = varname is allowed, just assume not allowed
         for var in block.varDecls:
-            varTable[var.id] = (var.type, offset)
-            offset += 4
+            if var.id not in varTable:
+                varTable[var.id] = (var.type, offset)
+                offset += 4
         for stmt in block.stmts:
-            if isinstance(stmt, TypeAssign3):
+            if isinstance(stmt, TypeAssign3) and stmt.id not in varTable:
                 varTable[stmt.id] = (stmt.type, offset)
                 offset += 4 
-            elif isinstance(stmt, BinaryOp3):
+            elif isinstance(stmt, BinaryOp3) and stmt.target not in varTable:
                 varTable[stmt.target] = (stmt.type, offset)
                 offset += 4
         return varTable
 
-    def genBlock(self, varTable : Dict[str, Tuple[str, int]], block : Block3, regMap : Dict[str, str], exitTag : str):
+    def genBlock(self, varTable : Dict[str, Tuple[str, int]], block : Block3, regMap : Dict[str, str]):
         for stmt in block.stmts:
-            if isinstance(stmt, Label3):
-                self.assembly.append(f".{stmt.label}:")
-            elif isinstance(stmt, Goto3):
-                self.assembly.append(f"   b   .{stmt.label}")
-            elif isinstance(stmt, IfGoto3):
-                self.genIfGoto(varTable, stmt, regMap)
-            elif isinstance(stmt, TypeAssignCall3):
-                self.genTypeAssignCall(varTable, stmt, regMap)
-            elif isinstance(stmt, TypeAssignNew3):
-                self.genTypeAssignNew(varTable, stmt, regMap)
-            elif isinstance(stmt, TypeAssignAtomAccess3):
-                self.genTypeAssignAtomAccess(varTable, stmt, regMap)
-            elif isinstance(stmt, TypeAssign3):
-                self.genTypeAssign(varTable, stmt, regMap)
-            elif isinstance(stmt, Assign3):
-                self.genAssign(varTable, stmt, regMap)
-            elif isinstance(stmt, BinaryOp3):
-                self.genBinaryOp(varTable, stmt, regMap)
-            elif isinstance(stmt, UnaryOp3):
-                self.genUnaryOp(varTable, stmt, regMap)
-            elif isinstance(stmt, Return3):
-                self.genReturn(varTable, stmt, regMap, exitTag)
-            elif isinstance(stmt, Println3):
-                self.genPrintln(varTable, stmt, regMap)
-            elif isinstance(stmt, Readln3):
-                self.genReadln(varTable, stmt, regMap)
-            else:
-                raise ArmGenException(f"{stmt} Not supported")
+            self.stmtHandlers[type(stmt)](self, varTable, stmt, regMap)
 
-    def genReturn(self, varTable : Dict[str, Tuple[str, int]], stmt : Println3, regMap : Dict[str, str], exitTag : str):
+    @stmtHandlers.register(Stmt3)
+    def genUnsupported(self, varTable : Dict[str, Tuple[str, int]], stmt : Stmt3, regMap : Dict[str, str]):
+        raise ArmGenException(f"{stmt} Not supported")
+
+    @stmtHandlers.register(Label3)
+    def genLabel(self, varTable : Dict[str, Tuple[str, int]], stmt : Label3, regMap : Dict[str, str]):
+        self.assembly.append(f".{stmt.label}:")
+
+    @stmtHandlers.register(Goto3)
+    def genGoto(self, varTable : Dict[str, Tuple[str, int]], stmt : Goto3, regMap : Dict[str, str]):
+        self.assembly.append(f"   b   .{stmt.label}")
+
+    @stmtHandlers.register(Return3)
+    def genReturn(self, varTable : Dict[str, Tuple[str, int]], stmt : Println3, regMap : Dict[str, str]):
         if stmt.id:
-            if stmt.id.isdigit():
-                self.assembly.append(f"   mov   a1, #{stmt.id}")
-            elif stmt.id in self.dataTable:
-                self.assembly.append(f"   ldr   a1, ={self.dataTable[stmt.id]} + 0")
-            elif stmt.id == "true":
-                self.assembly.append(f"   mov   a1, #1")
-            elif stmt.id == "false":
-                self.assembly.append(f"   mov   a1, #0")
-            elif stmt.id in varTable:
-                self.assembly.ldr("a1", stmt.id, varTable, regMap)
-            else:
-                self.assembly.ldrGlobal("a1", stmt.id, varTable, regMap, self.classTable)
-        self.assembly.append(f"   b   {exitTag}")
+            self.ldrOperand("a1", stmt.id, varTable, regMap)
+        self.assembly.append(f"   b   {self.exitTag}")
 
+    @stmtHandlers.register(Println3)
     def genPrintln(self, varTable : Dict[str, Tuple[str, int]], stmt : Println3, regMap : Dict[str, str]):
         self.assembly.append("   stmfd   sp!,{v6, v7}")
-        if stmt.id in self.dataTable: # must be string
-            self.assembly.append(f"   ldr   a2, ={self.dataTable[stmt.id]} + 0")
+        if isinstance(stmt.id, StrConst):
+            self.ldrOperand("a2", stmt.id, varTable, regMap)
             self.assembly.append(f"   ldr   a1, =LC1 + 0")
-        elif stmt.id.isdigit():
-            self.assembly.append(f"   mov   a2, #{stmt.id}")
+        elif isinstance(stmt.id, IntConst):
+            self.ldrOperand("a2", stmt.id, varTable, regMap)
             self.assembly.append(f"   ldr   a1, =LC0 + 0")
         elif stmt.id in varTable:
             (type, offset) = varTable[stmt.id]
             self.assembly.ldr("a2", stmt.id, varTable, regMap)
-            if type == "Int" or type == "Bool":
+            if type == ast.INT_TYPE or type == ast.BOOL_TYPE:
                 self.assembly.append(f"   ldr   a1, =LC0 + 0")
-            elif type == "String":
+            elif type == ast.STRING_TYPE:
                 self.assembly.append(f"   ldr   a1, =LC1 + 0")
             else:
                 raise ArmGenException("print only support Int and String")
@@ -235,11 +239,12 @@ class ArmGen:
         self.assembly.append("   bl   printf")
         self.assembly.append("   ldmfd   sp!,{v6, v7}")
 
+    @stmtHandlers.register(Readln3)
     def genReadln(self, varTable : Dict[str, Tuple[str, int]], stmt : Readln3, regMap : Dict[str, str]):
         self.assembly.append("   stmfd   sp!,{v6, v7}")
         if stmt.id in varTable:
             (type, offset) = varTable[stmt.id]
-            if type == "Int":
+            if type == ast.INT_TYPE:
                 self.assembly.append(f"   ldr   a2, =LC3 + 0")
                 self.assembly.append(f"   ldr   a1, =LC2 + 0")
             else:
@@ -252,32 +257,21 @@ class ArmGen:
         self.assembly.append(f"   ldr   a1, [a1]")
         self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(IfGoto3)
     def genIfGoto(self, varTable : Dict[str, Tuple[str, int]], stmt : IfGoto3, regMap : Dict[str, str]):
         if stmt.cond in varTable:
-            assert varTable[stmt.cond][0] == "Bool"
-            self.assembly.ldr("a1", stmt.cond, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a1", stmt.cond, varTable, regMap, self.classTable)
+            assert varTable[stmt.cond][0] == ast.BOOL_TYPE
+        self.ldrOperand("a1", stmt.cond, varTable, regMap)
         self.assembly.append(f"   cmp   a1, #0")
         self.assembly.append(f"   bgt   .{stmt.label}")
 
 
+    @stmtHandlers.register(TypeAssign3)
     def genTypeAssign(self, varTable : Dict[str, Tuple[str, int]], stmt : TypeAssign3, regMap : Dict[str, str]):
-        if stmt.value in self.dataTable:
-            self.assembly.append(f"   ldr   a1, ={self.dataTable[stmt.value]} + 0")
-        elif stmt.value.isdigit():
-            self.assembly.append(f"   mov   a1, #{stmt.value}")
-        elif stmt.value == "true":
-            self.assembly.append(f"   mov   a1, #1")
-        elif stmt.value == "false":
-            self.assembly.append(f"   mov   a1, #0")
-        elif (stmt.value in varTable): # local variable
-            self.assembly.ldr("a1", stmt.value, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a1", stmt.value, varTable, regMap, self.classTable)
-
+        self.ldrOperand("a1", stmt.value, varTable, regMap)
         self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(TypeAssignNew3)
     def genTypeAssignNew(self, varTable : Dict[str, Tuple[str, int]], stmt : TypeAssignNew3, regMap : Dict[str, str]):
         classInfo = self.classTable[stmt.cname]
         size = classInfo.getSize()
@@ -285,33 +279,24 @@ class ArmGen:
         self.assembly.append(f"   bl   malloc")
         self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(TypeAssignCall3)
     def genTypeAssignCall(self, varTable : Dict[str, Tuple[str, int]], stmt : TypeAssignCall3, regMap : Dict[str, str]):
 
         for i,arg in enumerate(stmt.args):
             if i >= 4:
                 break
             else:
-                if arg.isdigit():
-                    self.assembly.append(f"   mov   a{i+1}, #{arg}")
-                elif arg in self.dataTable:
-                    self.assembly.append(f"   ldr   a{i+1}, ={self.dataTable[arg]} + 0")
-                else:
-                    self.assembly.ldr(f"a{i+1}", arg, varTable, regMap)
+                self.ldrOperand(f"a{i+1}", arg, varTable, regMap)
 
         if stmt.call.split("_")[0] == "this":
             cname = varTable["this"][0]
-            label = cname + "_" + "_".join(stmt.call.split("_")[1:])
+            label = str(cname) + "_" + "_".join(stmt.call.split("_")[1:])
         else:
             label = stmt.call
 
         self.assembly.append("   stmfd   sp!,{v6, v7}") # caller save
         for i,arg in enumerate(stmt.args[4:][::-1]): # save the rest of args to stack in reverse order
-            if arg.isdigit():
-                self.assembly.append(f"   mov   ip, #{arg}")
-            elif arg in self.dataTable:
-                self.assembly.append(f"   ldr   ip, ={self.dataTable[arg]} + 0")
-            else:
-                self.assembly.ldr("ip", arg, varTable, regMap)
+            self.ldrOperand("ip", arg, varTable, regMap)
             self.assembly.append(f"   str   ip, [sp,#-{i*4}]")
         if len(stmt.args) > 4:
             self.assembly.append(f"   sub   sp, sp, #{(len(stmt.args)-4)*4}")
@@ -323,6 +308,7 @@ class ArmGen:
         self.assembly.append("   ldmfd   sp!,{v6, v7}")
         self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(TypeAssignAtomAccess3)
     def genTypeAssignAtomAccess(self, varTable : Dict[str, Tuple[str, int]], stmt : TypeAssignAtomAccess3, regMap : Dict[str, str]):
         cname = varTable[stmt.obj][0]
         offset = self.classTable[cname].getOffset(stmt.field)
@@ -330,56 +316,26 @@ class ArmGen:
         self.assembly.append(f"   ldr   a1, [a2,#-{offset}]")
         self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(Assign3)
     def genAssign(self, varTable : Dict[str, Tuple[str, int]], stmt : Assign3, regMap : Dict[str, str]):
-        if stmt.result.isdigit():
-            self.assembly.append(f"   mov   a1, #{stmt.result}")
-        elif stmt.result in self.dataTable:
-            self.assembly.append(f"   ldr   a1, ={self.dataTable[stmt.result]} + 0")
-        elif stmt.result == "true":
-            self.assembly.append(f"   mov   a1, #1")
-        elif stmt.result == "false":
-            self.assembly.append(f"   mov   a1, #0")
-        elif stmt.result in varTable:
-            self.assembly.ldr("a1", stmt.result, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a1", stmt.result, varTable, regMap, self.classTable)
+        self.ldrOperand("a1", stmt.result, varTable, regMap)
 
-        if "." in stmt.id:
-            (obj, field) = stmt.id.split(".")
+        if isinstance(stmt.id, Field) and stmt.id.obj is None:
+            self.assembly.strGlobal("a1", stmt.id.field, varTable, regMap, self.classTable)
+        elif isinstance(stmt.id, Field):
+            (obj, field) = (stmt.id.obj, stmt.id.field)
             if obj in varTable:
                 self.assembly.ldr("a2", obj, varTable, regMap)
                 self.assembly.append(f"   str   a1, [a2,#-{self.classTable[varTable[obj][0]].getOffset(field)}]")
-        elif stmt.id in varTable:
-            self.assembly.str("a1", stmt.id, varTable, regMap)
         else:
-            self.assembly.strGlobal("a1", stmt.id, varTable, regMap, self.classTable)
+            self.assembly.str("a1", stmt.id, varTable, regMap)
 
+    @stmtHandlers.register(BinaryOp3)
     def genBinaryOp(self, varTable : Dict[str, Tuple[str, int]], stmt : BinaryOp3, regMap : Dict[str, str]):
-        if stmt.lhs.isdigit():
-            self.assembly.append(f"   mov   a1, #{stmt.lhs}")
-        elif stmt.lhs in self.dataTable:
+        if isinstance(stmt.lhs, StrConst) or isinstance(stmt.rhs, StrConst):
             raise ArmGenException("string operation not supported")
-        elif stmt.lhs == "true":
-            self.assembly.append(f"   mov   a1, #1")
-        elif stmt.lhs == "false":
-            self.assembly.append(f"   mov   a1, #0")
-        elif stmt.lhs in varTable:
-            self.assembly.ldr("a1", stmt.lhs, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a1", stmt.lhs, varTable, regMap, self.classTable)
-
-        if stmt.rhs.isdigit():
-            self.assembly.append(f"   mov   a3, #{stmt.rhs}")
-        elif stmt.rhs in self.dataTable:
-            raise ArmGenException("string operation not supported")
-        elif stmt.rhs == "true":
-            self.assembly.append(f"   mov   a3, #1")
-        elif stmt.rhs == "false":
-            self.assembly.append(f"   mov   a3, #0")
-        elif stmt.rhs in varTable:
-            self.assembly.ldr("a3", stmt.rhs, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a3", stmt.rhs, varTable, regMap, self.classTable)
+        self.ldrOperand("a1", stmt.lhs, varTable, regMap)
+        self.ldrOperand("a3", stmt.rhs, varTable, regMap)
 
         if stmt.op == "+":
             self.assembly.append(f"   add   a4, a1, a3")
@@ -411,14 +367,9 @@ class ArmGen:
         self.assembly.str("a4", stmt.target, varTable, regMap)
 
 
+    @stmtHandlers.register(UnaryOp3)
     def genUnaryOp(self, varTable : Dict[str, Tuple[str, int]], stmt : UnaryOp3, regMap : Dict[str, str]):
-        if stmt.operand.isdigit():
-            self.assembly.append(f"   mov   a1, #{stmt.operand}")
-        elif stmt.operand in varTable:
-            self.assembly.ldr("a1", stmt.operand, varTable, regMap)
-        else:
-            self.assembly.ldrGlobal("a1", stmt.operand, varTable, regMap, self.classTable)
-
+        self.ldrOperand("a1", stmt.operand, varTable, regMap)
         self.assembly.append(f"   rsb   a1, a1, #0")
 
         if stmt.target in varTable:
@@ -1,33 +1,211 @@
 # Ye Guoquan, A0188947A
-from dataclasses import dataclass
-from lex import TokenInfo, TokenType
-from typing import List, Optional, Set, Dict
+from dataclasses import dataclass, field
+from lex import TokenView, TokenType, SymbolTable
+from typing import List, Optional, Set, Dict, Tuple, Iterator, Union
 
 
 # Abstract classes
 
+# annotations the Checker sets on nodes after parsing
+ANNOTATION_SLOTS = ('annotated_type', 'methodInfo')
+
+
+class TypeId(int):
+    # the small integer id of a type in its TypeTable, compared and hashed as that int. It prints as the
+    # type name, so the IR3 and the assembly that carry it read as before
+
+    def __new__(cls, id: int, name: str):
+        self = super().__new__(cls, id)
+        self.name = name
+        return self
+
+    def __reduce__(self):
+        return (TypeId, (int(self), self.name))
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def __format__(self, spec: str) -> str:
+        return format(self.name, spec)
+
+
+# the builtin types at fixed ids, the class types of a compilation follow them
+INT_TYPE = TypeId(0, "Int")
+BOOL_TYPE = TypeId(1, "Bool")
+STRING_TYPE = TypeId(2, "String")
+VOID_TYPE = TypeId(3, "Void")
+NULL_TYPE = TypeId(4, "Null")
+# type of an expression that failed to check, accepted by and accepting every type so that an error
+# is reported once instead of again by every check that depends on it
+ERROR_TYPE = TypeId(5, "<error>")
+BUILTIN_TYPES = [INT_TYPE, BOOL_TYPE, STRING_TYPE, VOID_TYPE, NULL_TYPE, ERROR_TYPE]
+
+
+class TypeTable:
+    # one TypeId per type of a compilation, looked up by the symbol id of the type name. Every type keeps
+    # the set of types assignable to it as a bit set: itself, and null unless it is Int or Bool
+
+    def __init__(self, symbols: SymbolTable):
+        self.symbols = symbols
+        self.types: List[TypeId] = []
+        self.accepts: List[int] = []
+        self.by_symbol: Dict[int, TypeId] = {}
+        for type in BUILTIN_TYPES:
+            self.add(type)
+            if type not in [NULL_TYPE, ERROR_TYPE]:
+                self.by_symbol[symbols.intern(type.name)] = type
+        self.accepts[ERROR_TYPE] = -1
+
+    def add(self, type: TypeId) -> TypeId:
+        self.types.append(type)
+        accepts = (1 << type) | (1 << ERROR_TYPE)
+        if type not in [INT_TYPE, BOOL_TYPE]:
+            accepts |= 1 << NULL_TYPE
+        self.accepts.append(accepts)
+        return type
+
+    def of_symbol(self, symbol: int) -> TypeId:
+        type = self.by_symbol.get(symbol)
+        if type is None:
+            type = self.by_symbol[symbol] = self.add(TypeId(len(self.types), self.symbols.name(symbol)))
+        return type
+
+    def of_name(self, name: str) -> TypeId:
+        return self.of_symbol(self.symbols.intern(name))
+
+    # the type of a name without adding one, None for a name that is not a type of the table
+    def lookup(self, name: str) -> Optional[TypeId]:
+        symbol = self.symbols.ids.get(name)
+        return None if symbol is None else self.by_symbol.get(symbol)
+
+    def assignable(self, source: TypeId, target: TypeId) -> bool:
+        return (self.accepts[target] >> source) & 1 == 1
+
+    # the bit set of types, for one_of
+    @staticmethod
+    def set_of(types: List[TypeId]) -> int:
+        return sum(1 << type for type in set(types)) | (1 << ERROR_TYPE)
+
+    @staticmethod
+    def one_of(type: TypeId, types: int) -> bool:
+        return (types >> type) & 1 == 1
+
+
+# the fields of a node class that hold nodes or lists of nodes, in reverse order for the stack of nodes()
+CHILD_FIELDS: Dict[type, Tuple[str, ...]] = {}
+
+
+def child_fields(node_type: type) -> Tuple[str, ...]:
+    fields = getattr(node_type, '__dataclass_fields__', {}).values()
+    return tuple(reversed([field.name for field in fields if field.type not in [TokenView, SymbolTable, TypeTable, str, int]]))
+
+
 class ASTNode():
-    pass
+    # every node class declares __slots__, including those of the annotations the Checker adds,
+    # so that no node carries a __dict__
+    __slots__ = ()
+
+    # pickled as the constructor arguments and the annotations that are set, for the AST cache of compile.py
+    def __reduce__(self):
+        args = tuple(getattr(self, name) for name in getattr(self, '__dataclass_fields__', ()))
+        annotations = {slot: getattr(self, slot) for slot in ANNOTATION_SLOTS if hasattr(self, slot)}
+        return (type(self), args, (None, annotations) if annotations else None)
+
+    # the node and the nodes under it in preorder, the same order for a node and its pickled copy
+    def nodes(self) -> Iterator['ASTNode']:
+        work = [self]
+        while work:
+            node = work.pop()
+            if type(node) is list:
+                work.extend(reversed(node))
+                continue
+            yield node
+            names = CHILD_FIELDS.get(type(node))
+            if names is None:
+                names = CHILD_FIELDS[type(node)] = child_fields(type(node))
+            for name in names:
+                child = getattr(node, name)
+                if child is not None:
+                    work.append(child)
+
+    def first_token(self) -> Optional[TokenView]:
+        work = [self]
+        while work:
+            node = work.pop()
+            if isinstance(node, TokenView):
+                return node
+            if isinstance(node, ASTNode):
+                work.extend(reversed([getattr(node, name) for name in getattr(node, '__dataclass_fields__', ())]))
+            elif isinstance(node, list):
+                work.extend(reversed(node))
+        return None
+
+    # line of the first token in the node, for the diagnostics of the Checker
+    def first_line(self) -> Optional[int]:
+        token = self.first_token()
+        return token.line_num if token is not None else None
+
+    # the text of the node as strings and the nodes under it, nodes with a __str__ of their own are leaves
+    def pieces(self) -> List[Union[str, 'ASTNode']]:
+        raise NotImplementedError
+
+    # expanded with a stack of its own, the diagnostics and method digests of the Checker print the
+    # deepest expressions
+    def __str__(self) -> str:
+        text = []
+        work = [self]
+        while work:
+            item = work.pop()
+            if isinstance(item, ASTNode) and type(item).__str__ is ASTNode.__str__:
+                work.extend(reversed(item.pieces()))
+            else:
+                text.append(str(item))
+        return "".join(text)
+
+
+def joined(nodes: List[ASTNode], separator: str) -> List[Union[str, ASTNode]]:
+    pieces = []
+    for (i, node) in enumerate(nodes):
+        if i > 0:
+            pieces.append(separator)
+        pieces.append(node)
+    return pieces
 
 @dataclass(frozen=False)
 class MethodInfo():
     name: str
-    args: List[str]
-    ret_type: str
+    args: List[TypeId]
+    ret_type: TypeId
+    symbol: int = field(default=None, compare=False)
 
 
 @dataclass(frozen=False)
 class ClassInfo():
-    name: str
-    fields: Dict[str, str]
-    methods: Dict[str, List[MethodInfo]]
+    name: TypeId
+    fields: Dict[int, TypeId]  # keyed by symbol id
+    methods: Dict[int, List[MethodInfo]]
+    # the overloads of methods keyed by (symbol id, arity, argument types) and by (symbol id, arity)
+    dispatch: Dict[Tuple[int, int, Tuple[TypeId, ...]], List[MethodInfo]] = field(default=None, repr=False, compare=False)
+    arities: Dict[Tuple[int, int], List[MethodInfo]] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.dispatch = {}
+        self.arities = {}
+        for (symbol, infos) in self.methods.items():
+            for info in infos:
+                self.dispatch.setdefault((symbol, len(info.args), tuple(info.args)), []).append(info)
+                self.arities.setdefault((symbol, len(info.args)), []).append(info)
 
 # -----------------------------------------------------------------------------------------------
 # Declaration
 # -----------------------------------------------------------------------------------------------
 @dataclass(frozen=False)
 class Type(ASTNode):
-    type: TokenInfo
+    __slots__ = ('type',)
+    type: TokenView
 
     @staticmethod
     def valid_types() -> Set[TokenType]:
@@ -43,12 +221,16 @@ class Type(ASTNode):
     def get_name(self) -> str:
         return self.type.value
 
+    def get_symbol(self) -> int:
+        return self.type.symbol
+
 
 # -----------------------------------------------------------------------------------------------
 # Operators
 # -----------------------------------------------------------------------------------------------
 class Operator(ASTNode):
-    operator: TokenInfo
+    __slots__ = ('operator',)
+    operator: TokenView
 
     def __str__(self) -> str:
         return f"{self.operator.value}"
@@ -59,65 +241,68 @@ class Operator(ASTNode):
 
 @dataclass(frozen=False)
 class BinaryOperator(Operator):
-    operator: TokenInfo
+    __slots__ = ()
+    operator: TokenView
 
 
 @dataclass(frozen=False)
 class RelativeOperator(BinaryOperator):
-    operator: TokenInfo
+    __slots__ = ()
+    operator: TokenView
 
 
 @dataclass(frozen=False)
 class UnaryOperator(Operator):
-    operator: TokenInfo
+    __slots__ = ()
+    operator: TokenView
 
 
 # -----------------------------------------------------------------------------------------------
 # Expression
 # -----------------------------------------------------------------------------------------------
 class Expr(ASTNode):
-    annotated_type : str
-    def annotate_type(self, type : str):
+    __slots__ = ('annotated_type',)
+    annotated_type : TypeId
+    def annotate_type(self, type : TypeId):
         self.annotated_type = type
 
-    def get_type(self) -> str:
+    def get_type(self) -> TypeId:
         return self.annotated_type
 
 
 @dataclass(frozen=False)
 class UnaryOp(Expr):
+    __slots__ = ('operator', 'repeat', 'operand')
     operator: UnaryOperator
     repeat: int
     operand: Expr # can only be bool, int or atom
 
-    def __str__(self) -> str:
-        pprint = ""
-        for i in range(self.repeat):
-            pprint += "(" + str(self.operator) + ")"
-        pprint += str(self.operand)
-        return pprint
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["(", self.operator, ")"] * self.repeat + [self.operand]
 
 
 @dataclass(frozen=False)
 class BinaryOp(Expr):
+    __slots__ = ('left_operand', 'operator', 'right_operand')
     left_operand: Expr
     operator: BinaryOperator
     right_operand: Expr
 
-    def __str__(self) -> str:
-        return f"({self.left_operand} {self.operator} {self.right_operand})"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["(", self.left_operand, " ", self.operator, " ", self.right_operand, ")"]
 
 
 # -----------------------------------------------------------------------------------------------
 # Atoms
 # -----------------------------------------------------------------------------------------------
 class Atom(Expr):
-    pass
+    __slots__ = ()
 
 
 @dataclass(frozen=False)
 class Identifier(Atom):
-    identifier: TokenInfo
+    __slots__ = ('identifier',)
+    identifier: TokenView
 
     def __str__(self) -> str:
         return f"{self.identifier.value}"
@@ -125,20 +310,26 @@ class Identifier(Atom):
     def get_name(self) -> str:
         return self.identifier.value
 
+    def get_symbol(self) -> int:
+        return self.identifier.symbol
+
 
 class This(Atom):
+    __slots__ = ()
     def __str__(self) -> str:
         return "this"
 
 
 class Null(Atom):
+    __slots__ = ()
     def __str__(self) -> str:
         return "null"
 
 
 @dataclass(frozen=False)
 class NewClass(Atom):
-    class_name: TokenInfo
+    __slots__ = ('class_name',)
+    class_name: TokenView
 
     def __post_init__(self):
         assert self.class_name.token_type == TokenType.TOKEN_CNAME
@@ -149,14 +340,18 @@ class NewClass(Atom):
     def get_name(self) -> str:
         return self.class_name.value
 
+    def get_symbol(self) -> int:
+        return self.class_name.symbol
+
 
 @dataclass(frozen=False)  # Field access
 class AtomAccess(Atom):
+    __slots__ = ('lhs', 'rhs')
     lhs: Atom
     rhs: Identifier
 
-    def __str__(self) -> str:
-        return f"({self.lhs}.{self.rhs})"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["(", self.lhs, ".", self.rhs, ")"]
 
     def get_obj_name(self) -> str:
         return str(self.lhs)
@@ -167,19 +362,21 @@ class AtomAccess(Atom):
 
 @dataclass(frozen=False)  # Expression interpreted as Atom
 class AtomExpr(Atom):
+    __slots__ = ('expr',)
     expr: Expr
 
-    def __str__(self) -> str:
-        return f"({self.expr})"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["(", self.expr, ")"]
 
 
 @dataclass(frozen=False)  # Function call in an expression
 class AtomCall(Atom):
+    __slots__ = ('call', 'args', 'methodInfo')
     call: Atom
     args: List[Expr]
 
-    def __str__(self) -> str:
-        return f"{self.call}(" + ", ".join(map(str, self.args)) + ")"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.call, "("] + joined(self.args, ", ") + [")"]
 
     def annotate_callInfo(self, methodInfo : MethodInfo):
         self.methodInfo = methodInfo
@@ -194,7 +391,8 @@ class AtomCall(Atom):
 # -----------------------------------------------------------------------------------------------
 @dataclass(frozen=False)
 class Literal(Expr):
-    literal: TokenInfo
+    __slots__ = ('literal',)
+    literal: TokenView
 
     def __str__(self) -> str:
         return f"{self.literal.value}"
@@ -205,43 +403,47 @@ class Literal(Expr):
 
 @dataclass(frozen=False)
 class String(Literal):
-    literal: TokenInfo
+    __slots__ = ()
+    literal: TokenView
 
-    def get_type(self) -> str:
-        return "String"
+    def get_type(self) -> TypeId:
+        return STRING_TYPE
 
 
 @dataclass(frozen=False)
 class Boolean(Literal):
-    literal: TokenInfo
+    __slots__ = ()
+    literal: TokenView
 
-    def get_type(self) -> str:
-        return "Bool"
+    def get_type(self) -> TypeId:
+        return BOOL_TYPE
 
 
 @dataclass(frozen=False)
 class Integer(Literal):
-    literal: TokenInfo
+    __slots__ = ()
+    literal: TokenView
 
-    def get_type(self) -> str:
-        return "Int"
+    def get_type(self) -> TypeId:
+        return INT_TYPE
 
 
 # -----------------------------------------------------------------------------------------------
 # Statements
 # -----------------------------------------------------------------------------------------------
 class Statement(ASTNode):
-    pass
+    __slots__ = ()
 
 
 # Declarations
 @dataclass(frozen=False)
 class VarDecl(ASTNode):
+    __slots__ = ('type', 'identifier')
     type: Type
     identifier: Identifier
 
-    def __str__(self) -> str:
-        return f"{self.type} {self.identifier};"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.type, " ", self.identifier, ";"]
 
     def get_type(self) -> str:
         return self.type.get_name()
@@ -249,77 +451,88 @@ class VarDecl(ASTNode):
     def get_name(self) -> str:
         return self.identifier.get_name()
 
+    def get_symbol(self) -> int:
+        return self.identifier.get_symbol()
+
 
 @dataclass(frozen=False)
 class Block(ASTNode):
+    __slots__ = ('vars', 'stmts')
     vars: List[VarDecl]
     stmts: List[Statement]
 
-    def __str__(self) -> str:
-        return "{\n" + "\n".join(map(str, self.vars)) + "\n".join(map(str, self.stmts)) + "\n"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["{\n"] + joined(self.vars, "\n") + joined(self.stmts, "\n") + ["\n"]
 
 
 @dataclass(frozen=False)
 class IfThenElse(Statement):
+    __slots__ = ('cond', 'true_branch', 'false_branch')
     cond: Expr
     true_branch: Block
     false_branch: Block
 
-    def __str__(self) -> str:
-        return f"if ({self.cond}) {self.true_branch} {self.false_branch}"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["if (", self.cond, ") ", self.true_branch, " ", self.false_branch]
 
 
 @dataclass(frozen=False)
 class While(Statement):
+    __slots__ = ('cond', 'body')
     cond: Expr
     body: Block
 
-    def __str__(self) -> str:
-        return f"while ({self.cond}) {self.body}"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["while (", self.cond, ") ", self.body]
 
 
 @dataclass(frozen=False)
 class Return(Statement):
+    __slots__ = ('ret_expr',)
     ret_expr: Optional[Expr]
 
-    def __str__(self) -> str:
+    def pieces(self) -> List[Union[str, ASTNode]]:
         if self.ret_expr is None:
-            return "return;"
+            return ["return;"]
         else:
-            return f"return {self.ret_expr};"
+            return ["return ", self.ret_expr, ";"]
 
 
 @dataclass(frozen=False)
 class Readln(Statement):
+    __slots__ = ('identifier',)
     identifier: Identifier
 
-    def __str__(self) -> str:
-        return f"readln({self.identifier});"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["readln(", self.identifier, ");"]
 
 
 @dataclass(frozen=False)
 class Println(Statement):
+    __slots__ = ('expr',)
     expr: Expr
 
-    def __str__(self) -> str:
-        return f"println({self.expr});"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["println(", self.expr, ");"]
 
 
 @dataclass(frozen=False)
 class Assignment(Statement):
+    __slots__ = ('lhs', 'rhs')
     lhs: Atom
     rhs: Expr
 
-    def __str__(self) -> str:
-        return f"{self.lhs} = {self.rhs};"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.lhs, " = ", self.rhs, ";"]
 
 
 @dataclass(frozen=False)
 class MethodCall(Statement):
+    __slots__ = ('call',)
     call: AtomCall
 
-    def __str__(self) -> str:
-        return f"{self.call};"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.call, ";"]
 
 
 # -----------------------------------------------------------------------------------------------
@@ -327,50 +540,57 @@ class MethodCall(Statement):
 # -----------------------------------------------------------------------------------------------
 @dataclass(frozen=False)
 class Formal(ASTNode):
+    __slots__ = ('type', 'identifier')
     type: Type
     identifier: Identifier
 
-    def __str__(self) -> str:
-        return f"{self.type} {self.identifier}"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.type, " ", self.identifier]
 
     def get_name(self) -> str:
         return self.identifier.get_name()
 
+    def get_symbol(self) -> int:
+        return self.identifier.get_symbol()
+
     def get_type(self) -> str:
         return self.type.get_name()
 
 
 @dataclass(frozen=False)
 class Method(ASTNode):
+    __slots__ = ('ret_type', 'name', 'formals', 'body')
     ret_type: Type
     name: Identifier
     formals: List[Formal]
     body: Block
 
-    def __str__(self) -> str:
-        return f"{self.ret_type} {self.name}(" + ", ".join(map(str, self.formals)) + f") {self.body}"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.ret_type, " ", self.name, "("] + joined(self.formals, ", ") + [") ", self.body]
 
 
 # class
 @dataclass(frozen=False)
 class Class(ASTNode):
+    __slots__ = ('class_type', 'fields', 'methods')
     class_type: Type
     fields: List[VarDecl]
     methods: List[Method]
 
-    def __str__(self) -> str:
-        return f"class {self.class_type}" + "{\n" + \
-               "\n".join(map(str, self.fields)) + "\n".join(map(str, self.methods)) \
-               + "\n}"
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return ["class ", self.class_type, "{\n"] + joined(self.fields, "\n") + joined(self.methods, "\n") + ["\n}"]
 
     def get_name(self) -> str:
         return self.class_type.get_name()
 
 
+# a single instance, left with a __dict__ as the field options of symbols need a class attribute
 @dataclass(frozen=False)
 class Program(ASTNode):
     main_class: Class
     classes: List[Class]
+    symbols: SymbolTable = field(default=None, repr=False, compare=False)  # shared by all stages
+    types: TypeTable = field(default=None, repr=False, compare=False)  # set by the Checker
 
-    def __str__(self) -> str:
-        return f"{self.main_class}" + "\n".join(map(str, self.classes))
+    def pieces(self) -> List[Union[str, ASTNode]]:
+        return [self.main_class] + joined(self.classes, "\n")
@@ -0,0 +1,432 @@
+# Ye Guoquan, A0188947A
+import time
+import argparse
+import tracemalloc
+import contextlib
+import tempfile
+import ast
+from lex import Lexer, TokenInfo
+from parse import Parser, parse_parallel, class_boundaries
+from gen import Checker, check_parallel
+from ir3 import IR3, dumpIR3, dumpIR3Text, loadIR3
+from optimize import Optimizer
+from ssa import SSAMethod
+from arm import ArmGen
+from reg import RegisterAllocator
+from cache import ASTCache, MethodCache
+import os
+
+
+# synthetic JLite program with one main class and `classes` small classes
+def generate_program(classes: int) -> str:
+    source = ['class Main {\n  Void main() {\n    Int x;\n    x = 1;\n    println(x);\n    return;\n  }\n}\n']
+    for i in range(classes):
+        source.append(f'''class C{i} {{
+  Int a;
+  Bool b;
+  /* class {i} */
+  Int m{i}(Int p, Int q) {{
+    Int r;
+    // body
+    r = p * q + a - {i};
+    if (r > q && b) {{
+      r = r + 1;
+    }} else {{
+      r = r - 1;
+    }}
+    while (r < 100) {{
+      r = r + p;
+    }}
+    println("value");
+    return r;
+  }}
+}}
+''')
+    return ''.join(source)
+
+
+# tracing slows allocation down, so time and memory are taken from separate runs
+# the time is the best of `runs` runs
+def measure(fn, runs: int = 1):
+    elapsed = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, memory
+
+
+def report(name: str, elapsed: float, memory: int = None):
+    if memory is None:
+        print(f'{name:<40} {elapsed:8.3f}s')
+    else:
+        print(f'{name:<40} {elapsed:8.3f}s {memory / 2**20:10.1f} MiB')
+
+
+# packed TokenStore against one TokenInfo object per token
+def bench_tokens(source_code: str):
+    def lex_packed():
+        lexer = Lexer(source_code)
+        for _ in lexer.generate_tokens(skip_comments=False):
+            pass
+        return lexer.store
+    store, elapsed, memory = measure(lex_packed)
+    report(f'TokenStore ({len(store)} tokens)', elapsed, memory)
+
+    def lex_objects():
+        return [TokenInfo(token.line_num, token.token_type, token.value) for token in store]
+    _, elapsed, memory = measure(lex_objects)
+    report(f'TokenInfo list ({len(store)} tokens)', elapsed, memory)
+
+
+# 1 MiB line comment, nested block comment and string literal, through both lexer engines
+def bench_scanners(source_code: str):
+    size = 1 << 20
+    text = ('lorem ipsum dolor sit amet ' * (size // 27 + 1))[:size]
+    inputs = {
+        'comment': '// ' + text + '\nclass',
+        'multicomment': '/* ' + text.replace('sit', '\n/* sit */') + ' */ class',
+        'string': '"' + text.replace('sit', '\\"') + '" class',
+    }
+    for name, source in inputs.items():
+        for legacy in [False, True]:
+            _, elapsed, _ = measure(lambda: Lexer(source, legacy).get_all_tokens())
+            report(f'{name} ({"legacy" if legacy else "table"})', elapsed)
+
+
+# a one character edit in the middle of the program, relexed against lexed from scratch
+def bench_relex(source_code: str):
+    lexer = Lexer(source_code)
+    lexer.get_all_tokens()
+    offset = source_code.index('\n', len(source_code) // 2)
+    edited = source_code[:offset] + ' ' + source_code[offset:]
+    _, elapsed, _ = measure(lambda: Lexer(edited).get_all_tokens())
+    report('full lex', elapsed)
+    _, elapsed, _ = measure(lambda: lexer.relex(offset, 0, ' '))
+    report('relex', elapsed)
+    _, elapsed, _ = measure(lambda: lexer.relex(offset, 0, '/* edit */'))
+    report('relex, inserted comment', elapsed)
+
+
+# parse time of one expression as its nesting depth and its number of terms grow, longest_of is only run where it finishes
+def bench_expressions(source_code: str):
+    def parse(expression: str, legacy: bool):
+        source = f'class Main {{\n  Void main() {{\n    x = {expression};\n    return;\n  }}\n}}\n'
+        return lambda: Parser(Lexer(source), legacy).parse()
+    for depth in [4, 8, 16, 32, 64, 128]:
+        expression = 'a'
+        for i in range(depth):
+            expression = f'({expression} + {i}) * b'
+        for legacy in [False, True] if depth <= 8 else [False]:
+            _, elapsed, _ = measure(parse(expression, legacy))
+            report(f'depth {depth} ({"longest_of" if legacy else "climbing"})', elapsed)
+    for terms in [250, 500, 1000, 2000]:
+        expression = ' + '.join(f'a{i} * {i} - b' for i in range(terms))
+        for legacy in [False, True]:
+            _, elapsed, _ = measure(parse(expression, legacy))
+            report(f'{terms} terms ({"longest_of" if legacy else "climbing"})', elapsed)
+
+
+# the longest_of parser with and without a packrat memo, on the program and on a nested expression
+def bench_packrat(source_code: str):
+    nested = 'a'
+    for i in range(8):
+        nested = f'({nested} + {i}) * b'
+    inputs = {
+        'program': source_code,
+        'depth 8': f'class Main {{\n  Void main() {{\n    x = {nested};\n    return;\n  }}\n}}\n',
+    }
+    for name, source in inputs.items():
+        for packrat in [0, 1 << 16]:
+            _, elapsed, memory = measure(lambda: Parser(Lexer(source), True, packrat).parse())
+            report(f'{name} ({"packrat" if packrat else "no memo"})', elapsed, memory)
+            if packrat:
+                parser = Parser(Lexer(source), True, packrat)
+                parser.parse()
+                print(f'  {parser.memo}')
+
+
+# machine generated shapes nested `depth` levels deep, through every stage up to IR3
+def bench_nesting(source_code: str, depth: int = 10000):
+    def program(body: str) -> str:
+        return f'class Main {{\n  Void main() {{\n    Int x;\n    A a;\n{body}\n    return;\n  }}\n}}\n' \
+               f'class A {{\n  Int f(Int p) {{\n    return p;\n  }}\n}}\n'
+    inputs = {
+        'parentheses': program('x = ' + '(' * depth + 'x' + ')' * depth + ';'),
+        'operator chain': program('x = ' + ' + '.join(['x'] * depth) + ';'),
+        'call arguments': program('x = ' + 'a.f(' * depth + 'x' + ')' * depth + ';'),
+        'if/while': program('if (x < 1) { while (x < 1) { ' * (depth // 2) + 'x = 1;' + ' } } else { x = 2; }' * (depth // 2)),
+    }
+    for name, source in inputs.items():
+        tree, elapsed, _ = measure(lambda: Parser(Lexer(source)).parse())
+        report(f'{name} parse', elapsed)
+        _, elapsed, _ = measure(lambda: Checker().check(tree))
+        report(f'{name} check', elapsed)
+        _, elapsed, _ = measure(lambda: IR3(tree).generateIR3())
+        report(f'{name} IR3', elapsed)
+
+
+# IR3 generation time of arithmetic chains and nested if/while blocks as they grow, each doubling in size
+# should about double the time
+def bench_lowering(source_code: str):
+    def program(body: str) -> str:
+        return f'class Main {{\n  Void main() {{\n    Int x;\n    Int y;\n{body}\n    return;\n  }}\n}}\n'
+    for size in [1000, 2000, 4000, 8000]:
+        inputs = {
+            'left chain': program('x = ' + ' + '.join(f'x * {i}' for i in range(size)) + ';'),
+            'right chain': program('x = ' + ''.join(f'(x - {i}) * (' for i in range(size)) + 'y' + ')' * size + ';'),
+            'if/while': program('if (x < y) { while (y < x) { x = x + 1; ' * (size // 2) + 'y = 1;'
+                                + ' } } else { y = x - 1; }' * (size // 2)),
+        }
+        for name, source in inputs.items():
+            tree = Parser(Lexer(source)).parse()
+            Checker().check(tree)
+            _, elapsed, _ = measure(lambda: IR3(tree).generateIR3(), 3)
+            report(f'{name} {size} IR3', elapsed)
+
+
+# the node classes as plain dataclasses, a subclass that does not declare __slots__ gets a __dict__ again.
+# Only the parser's isinstance checks hold for these, so they are not run through the later stages
+@contextlib.contextmanager
+def dict_nodes():
+    classes = {name: cls for name, cls in vars(ast).items() if isinstance(cls, type) and issubclass(cls, ast.ASTNode)}
+    for name, cls in classes.items():
+        setattr(ast, name, type(name, (cls,), {}))
+    try:
+        yield
+    finally:
+        for name, cls in classes.items():
+            setattr(ast, name, cls)
+
+
+# build time and resident size of the AST with slotted nodes and with nodes that have a __dict__
+def bench_ast(source_code: str):
+    _, elapsed, memory = measure(lambda: Parser(Lexer(source_code)).parse())
+    report('__slots__ nodes', elapsed, memory)
+    with dict_nodes():
+        _, elapsed, memory = measure(lambda: Parser(Lexer(source_code)).parse())
+    report('__dict__ nodes', elapsed, memory)
+
+
+# lexing, parsing and checking the program against hashing it and loading its typed AST from the cache
+def bench_cache(source_code: str):
+    def compile_tree():
+        tree = Parser(Lexer(source_code)).parse()
+        Checker().check(tree)
+        return tree
+    tree, elapsed, memory = measure(compile_tree)
+    report('lex, parse and check', elapsed, memory)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ASTCache(directory, 1 << 30)
+        key = cache.key(source_code)
+        data, elapsed, _ = measure(lambda: cache.dump(tree))
+        _, elapsed_store, _ = measure(lambda: cache.store(key, data))
+        report(f'dump and store ({len(data) / 2**20:.1f} MiB)', elapsed + elapsed_store)
+        _, elapsed, memory = measure(lambda: cache.load(cache.read(cache.key(source_code))))
+        report('hash, read and load', elapsed, memory)
+
+
+# the sequential parser against the class pre-scan and parse_parallel with a growing number of workers
+def bench_parallel(source_code: str):
+    _, elapsed, _ = measure(lambda: Parser(Lexer(source_code)).parse())
+    report('sequential', elapsed)
+    lexer = Lexer(source_code)
+    lexer.get_all_tokens()
+    boundaries, elapsed, _ = measure(lambda: class_boundaries(lexer.store))
+    report(f'pre-scan ({len(boundaries)} classes)', elapsed)
+    for jobs in [1, 2, 4, 8]:
+        _, elapsed, _ = measure(lambda: parse_parallel(Lexer(source_code), jobs))
+        report(f'{jobs} workers', elapsed)
+
+
+# the serial checker against check_parallel with a growing number of workers, each on its own parse
+def bench_checking(source_code: str):
+    for jobs in [0, 1, 2, 4, 8]:
+        tree = Parser(Lexer(source_code)).parse()
+        start = time.perf_counter()
+        if jobs:
+            check_parallel(tree, jobs)
+        else:
+            Checker().check(tree)
+        report(f'{jobs} workers' if jobs else 'serial', time.perf_counter() - start)
+        del tree
+
+
+# a full check of the program with one method edited against a check that reuses the cached results of the
+# other methods, the incremental time includes loading and saving the cache
+def bench_incremental(source_code: str):
+    offset = source_code.index('r = r + 1;', len(source_code) // 2)
+    edited = source_code[:offset] + 'r = r + 2;' + source_code[offset + len('r = r + 1;'):]
+    tree = Parser(Lexer(edited)).parse()
+    start = time.perf_counter()
+    Checker().check(tree)
+    report('full check', time.perf_counter() - start)
+    with tempfile.TemporaryDirectory() as directory:
+        source_file = os.path.join(directory, 'program.j')
+        methods = MethodCache(directory, source_file)
+        Checker(None, methods).check(Parser(Lexer(source_code)).parse())
+        methods.save()
+        tree = Parser(Lexer(edited)).parse()
+        start = time.perf_counter()
+        methods = MethodCache(directory, source_file)
+        Checker(None, methods).check(tree)
+        methods.save()
+        elapsed = time.perf_counter() - start
+        checked = sum(1 for (key, entry) in methods.updated.items() if methods.entries.get(key) is not entry)
+        report(f'incremental ({checked} of {len(methods.updated)} checked)', elapsed)
+
+
+# best of three times of each stage of compile.py, the code generator is timed on the unoptimized program
+# as compile.py compiles it without -O
+def bench_stages(source_code: str):
+    _, elapsed, _ = measure(lambda: Lexer(source_code).get_all_tokens(), 3)
+    report('lex', elapsed)
+    tree, elapsed, _ = measure(lambda: Parser(Lexer(source_code)).parse(), 3)
+    report('parse', elapsed)
+    _, elapsed, _ = measure(lambda: Checker().check(tree), 3)
+    report('check', elapsed)
+    program, elapsed, _ = measure(lambda: IR3(tree).generateIR3(), 3)
+    report('IR3', elapsed)
+    # the optimizer rewrites its input, every run gets its own
+    programs = [IR3(tree).generateIR3() for _ in range(4)]
+    _, elapsed, _ = measure(lambda: Optimizer(programs.pop()).optimize(), 3)
+    report('optimize', elapsed)
+    _, elapsed, _ = measure(lambda: ArmGen(program).genArm(), 3)
+    report('ARM', elapsed)
+
+
+# time and memory of the IR3 of a generated program of over 100k instructions, and the time of the
+# optimizer and the register allocator on it
+def bench_instructions(source_code: str, classes: int = 2500):
+    tree = Parser(Lexer(generate_program(classes))).parse()
+    Checker().check(tree)
+    program, elapsed, memory = measure(lambda: IR3(tree).generateIR3())
+    count = sum(len(method.body.stmts) for method in program.cMethod3List)
+    report(f'IR3 ({count} instructions)', elapsed, memory)
+    programs = [IR3(tree).generateIR3() for _ in range(4)]
+    _, elapsed, _ = measure(lambda: Optimizer(programs.pop()).optimize(), 3)
+    report('optimize', elapsed)
+    _, elapsed, _ = measure(lambda: [RegisterAllocator(method) for method in program.cMethod3List], 3)
+    report('register allocation', elapsed)
+
+
+# size, write and read time of the IR3 in both formats, against the front end that compiling from
+# the source runs instead of reading it
+def bench_serialization(source_code: str):
+    def front_end():
+        tree = Parser(Lexer(source_code)).parse()
+        Checker().check(tree)
+        return IR3(tree).generateIR3()
+    program, elapsed, _ = measure(front_end)
+    count = sum(len(method.body.stmts) for method in program.cMethod3List)
+    report(f'front end ({count} instructions)', elapsed)
+    for (name, dump) in [('binary', dumpIR3), ('text', lambda program: dumpIR3Text(program).encode())]:
+        data, elapsed, _ = measure(lambda: dump(program), 3)
+        report(f'write {name} ({len(data) / 2**20:.1f} MiB)', elapsed)
+        _, elapsed, memory = measure(lambda: loadIR3(data), 3)
+        report(f'read {name}', elapsed, memory)
+
+
+# SSA construction, optimization and destruction of one method of `blocks` if and while statements,
+# against the block-local optimizer, and the register allocator and the code generator with and without it
+def bench_ssa(source_code: str, blocks: int = 2000):
+    source = ['class Main {\n  Void main() {\n    Int a;\n    Int b;\n    Int c;\n    Bool p;\n    a = 1;\n    b = 2;\n    c = 3;\n']
+    for i in range(blocks):
+        if i % 2:
+            source.append(f'    while (a < {i}) {{\n      a = a + b;\n      b = b - 1;\n    }}\n')
+        else:
+            source.append(f'    p = c > {i};\n    if (p) {{\n      c = a + {i};\n      b = 2;\n    }} else {{\n      c = c * 2;\n    }}\n')
+    source.append('    println(a);\n    println(b);\n    println(c);\n    return;\n  }\n}\n')
+    tree = Parser(Lexer(''.join(source))).parse()
+    Checker().check(tree)
+    # construction renames the statements of its method and the passes rewrite them, every run gets its own
+    def methods(count: int):
+        return [IR3(tree).generateIR3().cMethod3List[0] for _ in range(count)]
+    fresh = methods(2)
+    count = len(fresh[0].body.stmts)
+    ssa, elapsed, memory = measure(lambda: SSAMethod(fresh.pop()))
+    phis = sum(len(block.phis) for block in ssa.blocks)
+    report(f'construct ({count} instructions, {len(ssa.blocks)} blocks, {phis} phis)', elapsed, memory)
+    fresh = [SSAMethod(method) for method in methods(4)]
+    def passes():
+        ssa = fresh.pop()
+        ssa.propagateConstants()
+        ssa.propagateCopies()
+        ssa.eliminateDeadCode()
+        return ssa
+    _, elapsed, _ = measure(passes, 3)
+    report('optimize in SSA form', elapsed)
+    fresh = [SSAMethod(method) for method in methods(4)]
+    passed = [passes() for _ in range(4)]
+    optimized, elapsed, _ = measure(lambda: passed.pop().destruct(), 3)
+    report(f'destruct ({len(optimized.body.stmts)} instructions)', elapsed)
+    _, elapsed, _ = measure(lambda: RegisterAllocator(optimized), 3)
+    report('register allocation after SSA', elapsed)
+    program = IR3(tree).generateIR3()
+    program.cMethod3List = [optimized]
+    assembly, elapsed, _ = measure(lambda: ArmGen(program).genArm())
+    report(f'ARM after SSA ({len(assembly.assembly)} lines)', elapsed)
+    method = methods(1)[0]
+    _, elapsed, _ = measure(lambda: RegisterAllocator(method), 3)
+    report(f'register allocation without it ({count} instructions)', elapsed)
+    program = IR3(tree).generateIR3()
+    assembly, elapsed, _ = measure(lambda: ArmGen(program).genArm())
+    report(f'ARM without it ({len(assembly.assembly)} lines)', elapsed)
+    programs = [IR3(tree).generateIR3() for _ in range(4)]
+    program, elapsed, _ = measure(lambda: Optimizer(programs.pop()).optimize(), 3)
+    report(f'block-local optimizer ({len(program.cMethod3List[0].body.stmts)} instructions)', elapsed)
+
+# type checking of nested calls to a method with `overloads` overloads, one per parameter class
+def bench_overloads(source_code: str, overloads: int = 500, calls: int = 2000):
+    source = ['class Main {\n  Void main() {\n    A a;\n    Int x;\n']
+    for i in range(calls):
+        source.append(f'    x = a.f(a.f(new B{i % overloads}()), a.f(new B{(i * 7) % overloads}()));\n')
+    source.append('    return;\n  }\n}\nclass A {\n  Int f(Int p, Int q) { return p; }\n')
+    for i in range(overloads):
+        source.append(f'  Int f(B{i} o) {{ return {i}; }}\n')
+    source.append('}\n')
+    source += [f'class B{i} {{\n  Int v;\n}}\n' for i in range(overloads)]
+    tree = Parser(Lexer(''.join(source))).parse()
+    _, elapsed, _ = measure(lambda: Checker().check(tree), 3)
+    report(f'check ({overloads} overloads, {calls * 3} calls)', elapsed)
+
+
+BENCHMARKS = {
+    'tokens': bench_tokens,
+    'scanners': bench_scanners,
+    'relex': bench_relex,
+    'expressions': bench_expressions,
+    'packrat': bench_packrat,
+    'nesting': bench_nesting,
+    'lowering': bench_lowering,
+    'ast': bench_ast,
+    'cache': bench_cache,
+    'parallel': bench_parallel,
+    'checking': bench_checking,
+    'incremental': bench_incremental,
+    'stages': bench_stages,
+    'overloads': bench_overloads,
+    'instructions': bench_instructions,
+    'serialization': bench_serialization,
+    'ssa': bench_ssa,
+}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('benchmark', choices=list(BENCHMARKS) + ['all'])
+    argparser.add_argument('input', nargs='?', help='input file, a generated program is used if omitted')
+    argparser.add_argument('--classes', type=int, default=2000, help='size of the generated program')
+    args = argparser.parse_args()
+    if args.input:
+        with open(args.input) as f:
+            source_code = f.read()
+    else:
+        source_code = generate_program(args.classes)
+    for name in BENCHMARKS if args.benchmark == 'all' else [args.benchmark]:
+        print(f'== {name}')
+        BENCHMARKS[name](source_code)
@@ -0,0 +1,175 @@
+# Ye Guoquan, A0188947A
+import os
+import gc
+import io
+import pickle
+import hashlib
+import tempfile
+import contextlib
+import ast
+from dataclasses import dataclass
+from typing import Optional, Union, Dict, Tuple, Any
+
+# modules whose code decides the typed AST a source compiles to
+FRONT_END_MODULES = ['lex.py', 'parse.py', 'ast.py', 'gen.py', 'visitor.py']
+
+
+# hash of the front end sources, so that a changed compiler never reads the entries of an older one
+def compiler_version() -> str:
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in FRONT_END_MODULES:
+        with open(os.path.join(directory, module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# (un)pickling allocates one object per node and nothing cyclic is freed on the way,
+# so the collections the allocations trigger would only walk the growing tree again and again
+@contextlib.contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class CacheUnpickler(pickle.Unpickler):
+    # only the classes of typed ASTs, tokens, method entries and diagnostics are loaded, so that a
+    # cache directory shared between builds cannot make the compiler run other code
+    allowed = {("ast", name) for (name, value) in vars(ast).items() if isinstance(value, type)
+               and issubclass(value, (ast.ASTNode, ast.TypeId, ast.TypeTable, ast.MethodInfo, ast.ClassInfo))} | \
+              {("lex", name) for name in ["SymbolTable", "TokenStore", "TokenView", "TokenInfo", "TokenType"]} | \
+              {("array", "array"), ("array", "_array_reconstructor"), ("cache", "MethodEntry"),
+               ("diagnostics", "Diagnostic")}
+
+    def find_class(self, module: str, name: str):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f"{module}.{name} is not part of a cache entry")
+        return super().find_class(module, name)
+
+
+# data is written to a temporary file that replaces the old one in a single rename,
+# so concurrent compilations never read a partial file
+def replace_file(path: str, data: bytes) -> None:
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class ASTCache:
+    # typed ASTs of compiled sources, one pickle per source content and compiler version. The least
+    # recently used entries are evicted once the entries in the directory add up to more than max_bytes
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = compiler_version()
+        os.makedirs(directory, exist_ok=True)
+
+    # a mapped source keeps byte offsets in its tokens, so it is cached apart from the same source read as text
+    def key(self, source_code: Union[str, bytes]) -> str:
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(b'text' if isinstance(source_code, str) else b'bytes')
+        digest.update(source_code.encode() if isinstance(source_code, str) else source_code)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.ast')
+
+    # the serialized entry of key, None on a miss
+    def read(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # the modification time orders the eviction
+        except FileNotFoundError:
+            return None
+        return data
+
+    def load(self, data: bytes) -> Optional[ast.Program]:
+        try:
+            with paused_gc():
+                return CacheUnpickler(io.BytesIO(data)).load()
+        except Exception:
+            return None  # an entry written by an incompatible interpreter or not by the compiler counts as a miss
+
+    # None if the tree is nested too deeply to be pickled, it is then not cached
+    def dump(self, program: ast.Program) -> Optional[bytes]:
+        try:
+            with paused_gc():
+                return pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return None
+
+    def store(self, key: str, data: bytes) -> None:
+        replace_file(self.path(key), data)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(('.ast', '.methods')):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # evicted by a concurrent compilation
+            total -= size
+
+
+@dataclass
+class MethodEntry:
+    digest: str  # of the method's source text
+    dependencies: Dict[Tuple[str, ...], Any]  # the signatures the method looked up and their values
+    annotations: bytes
+    isOK: bool
+
+
+class MethodCache:
+    # the check results of the methods of one source file from its last compilation, keyed by
+    # (class name, method name, parameter types). The Checker reads entries and puts the results of
+    # the current compilation, which save writes over the old ones. The file is evicted with the ASTs
+
+    def __init__(self, directory: str, source_file: str):
+        self.version = compiler_version()
+        name = hashlib.sha256(os.path.abspath(source_file).encode()).hexdigest()
+        self.path = os.path.join(directory, name + '.methods')
+        os.makedirs(directory, exist_ok=True)
+        self.entries: Dict[Tuple[str, str, Tuple[str, ...]], MethodEntry] = self.load()
+        self.updated: Dict[Tuple[str, str, Tuple[str, ...]], MethodEntry] = {}
+
+    def load(self) -> Dict[Tuple[str, str, Tuple[str, ...]], MethodEntry]:
+        try:
+            with open(self.path, 'rb') as f:
+                with paused_gc():
+                    (version, entries) = CacheUnpickler(f).load()
+        except Exception:
+            return {}  # missing, partial, written by an incompatible interpreter or not by the compiler
+        return entries if version == self.version else {}
+
+    def get(self, key: Tuple[str, str, Tuple[str, ...]]) -> Optional[MethodEntry]:
+        return self.entries.get(key)
+
+    def put(self, key: Tuple[str, str, Tuple[str, ...]], entry: MethodEntry) -> None:
+        self.updated[key] = entry
+
+    def save(self) -> None:
+        with paused_gc():
+            data = pickle.dumps((self.version, self.updated), pickle.HIGHEST_PROTOCOL)
+        replace_file(self.path, data)
@@ -2,29 +2,91 @@
 import sys
 import argparse
 from typing import Dict, Tuple
-from lex import Lexer
-from parse import Parser
-from gen import Checker
-from ir3 import IR3
+from lex import Lexer, map_source
+from parse import Parser, parse_parallel
+from gen import Checker, check_parallel
+from ir3 import IR3, Program3, IR3Exception, dumpIR3, dumpIR3Text, loadIR3
 from arm import ArmGen
 from optimize import Optimizer
+from ssa import SSAOptimizer
+from cache import ASTCache, MethodCache
+from diagnostics import Diagnostics, exit_on_errors
+
+
+# lexes, parses and checks the input, or takes its typed AST from the cache, and generates its IR3
+def front_end(args: argparse.Namespace) -> Program3:
+    source_file = args.input
+    if args.mmap:
+        source_code = map_source(source_file)
+    else:
+        with open(source_file) as f:
+            source_code = f.read()
+    cache = ASTCache(args.cache_dir, args.cache_size << 20) if args.cache_dir and args.cache != 'bypass' else None
+    astree = None
+    if cache is not None:
+        key = cache.key(source_code)
+        cached = cache.read(key)
+        if cached is not None and args.cache == 'use':
+            astree = cache.load(cached)
+    if astree is None:
+        diagnostics = Diagnostics()
+        lexer = Lexer(source_code, args.legacy_lexer, diagnostics=diagnostics)
+        if args.jobs > 1:
+            astree = parse_parallel(lexer, args.jobs, args.legacy_parser, diagnostics=diagnostics)
+        else:
+            parser = Parser(lexer, args.legacy_parser, diagnostics=diagnostics)
+            astree = parser.parse()
+        exit_on_errors(diagnostics)
+        if args.jobs > 1:
+            exit_on_errors(check_parallel(astree, args.jobs, diagnostics))
+        else:
+            # an edited source only gets its changed methods checked again, verify checks all of them
+            methods = MethodCache(args.cache_dir, source_file) if cache is not None and args.cache == 'use' else None
+            exit_on_errors(Checker(diagnostics, methods).check(astree))
+            if methods is not None:
+                methods.save()
+        if cache is not None:
+            data = cache.dump(astree)
+            if args.cache == 'verify' and cached is not None and data != cached:
+                print(f"{source_file}: cached AST differs from the compiled one, replacing it", file=sys.stderr)
+            if data is not None and data != cached:
+                cache.store(key, data)
+    return IR3(astree).generateIR3()
 
 
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser()
     argparser.add_argument('input', help='input file')
     argparser.add_argument('-O', '--optimize', help='optimize program', action='store_true')
+    argparser.add_argument('--ssa', help='optimize the methods in SSA form instead of block by block', action='store_true')
+    argparser.add_argument('--legacy-lexer', help='use the character-by-character lexer', action='store_true')
+    argparser.add_argument('--legacy-parser', help='parse expressions by trying every alternative', action='store_true')
+    argparser.add_argument('--mmap', help='lex the memory-mapped bytes of the input file', action='store_true')
+    argparser.add_argument('-j', '--jobs', help='parse and check the classes in this many worker processes', type=int, default=1)
+    argparser.add_argument('--cache-dir', help='reuse the typed AST of an unchanged source from this directory')
+    argparser.add_argument('--cache', help='use the cache, compile without it, or compile and check the cached AST',
+                           choices=['use', 'bypass', 'verify'], default='use')
+    argparser.add_argument('--cache-size', help='size cap of the cache directory in MiB', type=int, default=256)
+    argparser.add_argument('--emit-ir3', help='write the unoptimized IR3 to this file instead of generating assembly')
+    argparser.add_argument('--ir3-format', help='format of the IR3 written by --emit-ir3', choices=['binary', 'text'], default='binary')
+    argparser.add_argument('--from-ir3', help='the input is IR3 written by --emit-ir3, only the optimizer and the code generator run',
+                           action='store_true')
     args = argparser.parse_args()
-    source_file = args.input
-    with open(source_file) as f:
-        source_code = f.read()
-    lexer = Lexer(source_code)
-    parser = Parser(lexer)
-    astree = parser.parse()
-    checker = Checker().check(astree)
-    IR3 = IR3(astree).generateIR3()
-    if args.optimize:
-    	assembly = ArmGen(Optimizer(IR3).optimize()).genArm()
+    if args.from_ir3:
+        try:
+            with open(args.input, 'rb') as f:
+                program = loadIR3(f.read())
+        except IR3Exception as e:
+            sys.exit(f"{args.input}: {e}")
+    else:
+        program = front_end(args)
+    if args.emit_ir3:
+        data = dumpIR3(program) if args.ir3_format == 'binary' else dumpIR3Text(program).encode()
+        with open(args.emit_ir3, 'wb') as f:
+            f.write(data)
+    elif args.ssa:
+        ArmGen(SSAOptimizer(program).optimize()).genArm().print()
+    elif args.optimize:
+        ArmGen(Optimizer(program).optimize()).genArm().print()
     else:
-    	assembly = ArmGen(IR3).genArm()
-    assembly.print()
+        ArmGen(program).genArm().print()
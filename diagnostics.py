@@ -0,0 +1,50 @@
+# Ye Guoquan, A0188947A
+from typing import List, Optional, Iterator, NamedTuple
+import re
+import sys
+
+
+# a NamedTuple rather than a dataclass: lex.py imports this module before the local ast.py is loaded, and
+# the dataclasses module of Python 3.13 imports inspect, which would import the local ast.py halfway
+class Diagnostic(NamedTuple):
+    stage: str  # 'lex', 'parse' or 'check'
+    message: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class Diagnostics:
+    # errors the Lexer, Parser and Checker report instead of raising on the first one, in the order they are found
+
+    def __init__(self):
+        self.items: List[Diagnostic] = []
+
+    def report(self, stage: str, message: str, line: Optional[int] = None, column: Optional[int] = None) -> None:
+        self.items.append(Diagnostic(stage, message, line, column))
+
+    # the items from start on in source order, for stages that find their errors out of order. Errors
+    # without a column come after those with one on the same line, as the parser reports after the lexer
+    def sort(self, start: int = 0) -> None:
+        self.items[start:] = sorted(self.items[start:], key=lambda item: (
+            sys.maxsize if item.line is None else item.line, sys.maxsize if item.column is None else item.column))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Diagnostic]:
+        return iter(self.items)
+
+
+# prints the reported errors and exits, as the command line compilers do after a stage with errors
+# the line is added to the messages that do not name it themselves, as those of the Checker
+def exit_on_errors(diagnostics: Diagnostics) -> None:
+    if len(diagnostics):
+        for diagnostic in diagnostics:
+            if diagnostic.line is not None and not re.search(rf'\bline {diagnostic.line}\b', diagnostic.message):
+                print(f"{diagnostic} at line {diagnostic.line}")
+            else:
+                print(diagnostic)
+        sys.exit(1)
@@ -1,382 +1,655 @@
 # Ye Guoquan, A0188947A
-from dataclasses import dataclass
 import ast
-from typing import List, Dict
-from lex import Lexer
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Any, Optional
+from lex import Lexer, SymbolTable, TokenView, SYMBOL_THIS, SYMBOL_RETURN
+from diagnostics import Diagnostics, exit_on_errors
 from parse import Parser
 from ir3 import IR3
 from optimize import Optimizer
+from visitor import Dispatch
+from cache import paused_gc, MethodCache, MethodEntry, CacheUnpickler
+from concurrent.futures import ProcessPoolExecutor
+import pickle
+import hashlib
+import io
 import sys
 import argparse
 
 
-class TypeCheckException():
-    def __init__(self, msg):
-        print(msg)
-        exit(1)
+# work items of type_check_block besides the statements themselves
+BLOCK_ENTER = 0
+BLOCK_EXIT = 1
+IF_EXIT = 2
+STATEMENT = 3
 
+# the types println and readln accept, as a bit set of their TypeTable ids
+PRINTABLE = ast.TypeTable.set_of([ast.INT_TYPE, ast.BOOL_TYPE, ast.STRING_TYPE])
 
-class TypeEnv:
-    def __init__(self):
-        self.classDes : Dict[str, ast.ClassInfo] = {}
-        self.localEnv : Dict[str, List[str]] = {}
-        self.localMethod : Dict[str, List[ast.MethodInfo]] = {}
 
-    def addClass(self, c: ast.Class):
+class TypeCheckException(Exception):
+    pass
+
+
+class TypeEnv:
+    # local scopes are keyed by the symbol ids the lexer interned, names are only looked up for errors
+    # and types are the TypeIds of the program's TypeTable
+    def __init__(self, symbols : SymbolTable, types : ast.TypeTable, diagnostics : Diagnostics):
+        self.symbols = symbols
+        self.types = types
+        self.diagnostics = diagnostics
+        self.classDes : Dict[ast.TypeId, ast.ClassInfo] = {}
+        self.localEnv : Dict[int, List[ast.TypeId]] = {}
+        self.localMethod : Dict[int, List[ast.MethodInfo]] = {}
+        self.summaries : Dict[ast.TypeId, tuple] = {}
+
+    # the current value of a signature a method depends on: ('class', c) is the whole signature of class c,
+    # ('field', c, f) the type of its field f and ('methods', c, m) the signatures of its overloads of m.
+    # Names are used instead of symbol ids, which are only valid within one compilation
+    def dependency(self, dependency: Tuple[str, ...]) -> Any:
+        classInfo = self.classDes.get(self.types.lookup(dependency[1]))
+        if classInfo is None:
+            return None
+        if classInfo.name not in self.summaries:
+            fields = {self.symbols.name(symbol): str(type) for (symbol, type) in classInfo.fields.items()}
+            methods = {self.symbols.name(symbol): tuple((tuple(map(str, info.args)), str(info.ret_type)) for info in infos)
+                       for (symbol, infos) in classInfo.methods.items()}
+            self.summaries[classInfo.name] = (fields, methods)
+        (fields, methods) = self.summaries[classInfo.name]
+        if dependency[0] == 'field':
+            return fields.get(dependency[2])
+        elif dependency[0] == 'methods':
+            return methods.get(dependency[2])
+        return (tuple(fields.items()), tuple(methods.items()))
+
+    def addClass(self, c: ast.Class) -> ast.ClassInfo:
         classInfo = self.sig_from_class(c)
         self.classDes[classInfo.name] = classInfo
+        return classInfo
 
-    def addLocal(self, var: str, type: str):
+    def addLocal(self, var: int, type: ast.TypeId):
         if var in self.localEnv:
             # overwrite previous declaration
             self.localEnv[var].append(type)
         else:
             self.localEnv[var] = [type]
 
-    def addLocalMethod(self, method: str, infos: List[ast.MethodInfo]):
+    def addLocalMethod(self, method: int, infos: List[ast.MethodInfo], node: ast.Class):
         for info in infos:
             if method in self.localMethod:
                 method_sigs = self.localMethod[method]
                 if info in method_sigs:
-                    TypeCheckException(f"addLocalMethod(): method name clash in '{method}'")
+                    self.clash(f"addLocalMethod(): method name clash in '{self.symbols.name(method)}'", node)
                 else:
                     self.localMethod[method].append(info)
             else:
                 self.localMethod[method] = [info]
 
-    def removeLocal(self, var: str):
+    def removeLocal(self, var: int):
         self.localEnv[var].pop()
         if len(self.localEnv[var]) == 0:
             del self.localEnv[var]
 
-    def removeLocalMethod(self, method: str):
+    def removeLocalMethod(self, method: int):
         self.localMethod[method].pop()
         if len(self.localMethod[method]) == 0:
             del self.localMethod[method]
 
-    def getLocal(self, name: str) -> str:
+    def getLocal(self, name: int) -> ast.TypeId:
         if name in self.localEnv:
             return self.localEnv[name][-1]  # return the last entry, treat like a stack
-        TypeCheckException(f"getLocal(): var '{name}' unresolved")
+        raise TypeCheckException(f"getLocal(): var '{self.symbols.name(name)}' unresolved")
 
-    def getClass(self, name: str) -> ast.ClassInfo:
+    def getClass(self, name: ast.TypeId) -> ast.ClassInfo:
         if name in self.classDes:
             return self.classDes[name]
-        TypeCheckException(f"getClass(): class '{name}' unresolved")
+        raise TypeCheckException(f"getClass(): class '{name}' unresolved")
 
-    def getLocalMethod(self, method : str) -> ast.MethodInfo:
+    def getLocalMethod(self, method : int) -> ast.MethodInfo:
         if method in self.localMethod:
             return self.localMethod[method]
-        TypeCheckException(f"getLocalMethod(): method '{method}' unresolved")
+        raise TypeCheckException(f"getLocalMethod(): method '{self.symbols.name(method)}' unresolved")
 
-    def distinct(self, names : List[str]):
-        seen = []
-        for i in names:
+    # the declarations of nodes may not share a name with each other nor with the names already declared
+    def distinct(self, nodes : List[ast.ASTNode], declared : List[str] = []):
+        seen = set(declared)
+        for node in nodes:
+            i = node.get_name()
             if i in seen:
-                TypeCheckException(f"distinct(): name clash in '{i}'")
-            seen.append(i)
+                self.clash(f"distinct(): name clash in '{i}'", node)
+            seen.add(i)
+
+    # a clashing declaration is reported and checking goes on with the declaration that comes last
+    def clash(self, message: str, node: ast.ASTNode):
+        self.diagnostics.report('check', message, node.first_line())
+
+    # the TypeId of a declared type
+    def getType(self, node : ast.Type) -> ast.TypeId:
+        return self.types.of_symbol(node.get_symbol())
 
     def sig_from_class(self, node : ast.Class) -> ast.ClassInfo:
-        class_name = node.class_type.get_name()
-        field_sigs: Dict[str, str] = {}
+        class_name = self.getType(node.class_type)
+        field_sigs: Dict[int, ast.TypeId] = {}
         for field in node.fields:
-            if field.get_name() in field_sigs:
-                TypeCheckException(f"sig_from_class(): in class '{class_name}', fileds name clash for '{field.get_name()}'")
-            field_sigs[field.get_name()] = field.get_type()
-        method_sigs: Dict[str, List[ast.MethodInfo]] = {}
+            if field.get_symbol() in field_sigs:
+                self.clash(f"sig_from_class(): in class '{class_name}', fileds name clash for '{field.get_name()}'", field)
+            field_sigs[field.get_symbol()] = self.getType(field.type)
+        method_sigs: Dict[int, List[ast.MethodInfo]] = {}
         for method in node.methods:
-            if method.name.get_name() in method_sigs:
-                method_sigs[method.name.get_name()].append(self.sig_from_method(method))
+            if method.name.get_symbol() in method_sigs:
+                method_sigs[method.name.get_symbol()].append(self.sig_from_method(method))
             else:
-                method_sigs[method.name.get_name()] = [self.sig_from_method(method)]
+                method_sigs[method.name.get_symbol()] = [self.sig_from_method(method)]
         return ast.ClassInfo(class_name, field_sigs, method_sigs)
 
 
     def sig_from_method(self, node : ast.Method) -> ast.MethodInfo:
-        self.distinct([i.get_name() for i in node.formals])
-        args = [i.get_type() for i in node.formals]
-        return ast.MethodInfo(node.name.get_name(), args, node.ret_type.get_name())
+        self.distinct(node.formals)
+        args = [self.getType(i.type) for i in node.formals]
+        return ast.MethodInfo(node.name.get_name(), args, self.getType(node.ret_type), node.name.get_symbol())
 
 
 class Checker:
-    def check(self, astRoot : ast.ASTNode):
-        env = TypeEnv()
+    # type(node) dispatch of the statements in a block, the statements other than if and while,
+    # the children of an expression and the type of an expression node
+    block_handlers = Dispatch()
+    statement_handlers = Dispatch()
+    operand_handlers = Dispatch()
+    node_handlers = Dispatch()
+
+    # type errors are reported to diagnostics, a statement with an error is skipped and the rest of its
+    # method is checked, check returns the sink for the caller to decide whether the program compiles.
+    # With a MethodCache, a method is only checked if it changed since the compilation that cached it
+    def __init__(self, diagnostics : Diagnostics = None, methods : MethodCache = None):
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+        self.methods = methods
+        # the dependencies of the method being checked for the cache and their values
+        self.dependencies : Optional[Dict[Tuple[str, ...], Any]] = None
+
+    def check(self, astRoot : ast.ASTNode) -> Diagnostics:
+        astRoot.types = ast.TypeTable(astRoot.symbols)
+        env = TypeEnv(astRoot.symbols, astRoot.types, self.diagnostics)
+        self.types = astRoot.types
         self.astRoot = astRoot
         self.type_check_program(env, self.astRoot)
+        return self.diagnostics
+
+    def recover(self, e: TypeCheckException, node : ast.ASTNode) -> ast.TypeId:
+        self.diagnostics.report('check', str(e), node.first_line())
+        return ast.ERROR_TYPE
 
-    def validate(self, type1: str, type2: str, node : ast.ASTNode):
-        if type1 != type2 and (type1 != "Null" or type2 in ["Int", "Bool"]):
-            TypeCheckException(f"validate(): expect type '{type2}' but obtain '{type1}' near '{node}'")
+    def validate(self, type1: ast.TypeId, type2: ast.TypeId, node : ast.ASTNode):
+        if not self.types.assignable(type1, type2):
+            raise TypeCheckException(f"validate(): expect type '{type2}' but obtain '{type1}' near '{node}'")
 
-    def validateOneOf(self, type: str, table: List[str], node : ast.ASTNode):
-        if not type in table:
-            TypeCheckException(f"validateOneOf(): expect '{table}' but obtain '{type}' near '{node}'")
+    # table is a bit set of TypeTable.set_of
+    def validateOneOf(self, type: ast.TypeId, table: int, node : ast.ASTNode):
+        if not ast.TypeTable.one_of(type, table):
+            names = [str(i) for i in self.types.types if ast.TypeTable.one_of(i, table) and i != ast.ERROR_TYPE]
+            raise TypeCheckException(f"validateOneOf(): expect '{names}' but obtain '{type}' near '{node}'")
 
     def assertion(self, boolean: bool, node : ast.ASTNode):
         if not boolean:
-            TypeCheckException(f"assertion(): unexpected error near '{node}'")
-
-    def distinct(self, names : List[str]):
-        seen = []
-        for i in names:
-            if i in seen:
-                TypeCheckException(f"distinct(): name clash in '{i}'")
-            seen.append(i)
+            raise TypeCheckException(f"assertion(): unexpected error near '{node}'")
 
+    # every class is checked, also after one that fails, so that all of their errors are reported
     def type_check_program(self, env: TypeEnv, node: ast.Program) -> bool:
-        self.distinct([node.main_class.get_name()] + [i.get_name() for i in node.classes],)
-        env.addClass(node.main_class)
-        for i in node.classes:
-            env.addClass(i)
-
-        isOK = self.type_check_class(env, node.main_class)
-        for i in node.classes:
-            isOK = isOK and self.type_check_class(env, i)
+        classInfos = self.type_check_signatures(env, node)
+        if self.methods is not None:
+            self.places = InfoPickler.places(env.classDes)
+            self.infos = InfoUnpickler.infos(env.classDes)
+            self.digests = method_digests(node)
+        isOK = True
+        for (i, classInfo) in zip([node.main_class] + node.classes, classInfos):
+            isOK = self.type_check_class(env, i, classInfo) and isOK
         return isOK
 
-    def type_check_class(self, env: TypeEnv, node: ast.Class) -> bool:
-        classInfo = env.sig_from_class(node)
-        env.addLocal("this", classInfo.name)
+    # the signatures of all classes, the bodies are only checked against them and not against each other
+    def type_check_signatures(self, env: TypeEnv, node: ast.Program) -> List[ast.ClassInfo]:
+        env.distinct([node.main_class] + node.classes)
+        return [env.addClass(i) for i in [node.main_class] + node.classes]
+
+    def type_check_class(self, env: TypeEnv, node: ast.Class, classInfo: ast.ClassInfo) -> bool:
+        env.addLocal(SYMBOL_THIS, classInfo.name)
         for name in classInfo.fields:
             env.addLocal(name, classInfo.fields[name])
         for name in classInfo.methods:
-            env.addLocalMethod(name, classInfo.methods[name])
+            env.addLocalMethod(name, classInfo.methods[name], node)
 
         isOK = True
         for method in node.methods:
-            isOK = isOK and self.type_check_method(env, method)
+            isOK = self.type_check_method(env, method) and isOK
 
-        env.removeLocal("this")
+        env.removeLocal(SYMBOL_THIS)
         for name in classInfo.fields:
             env.removeLocal(name)
         for name in classInfo.methods:
             env.removeLocalMethod(name)
         return isOK
 
+    # the annotations of a cached method are reused if its text and the values of its dependencies are
+    # unchanged, otherwise it is checked and cached again unless it has errors
     def type_check_method(self, env: TypeEnv, node: ast.Method) -> bool:
-        # add envs
-        methodInfo = env.sig_from_method(node)
+        if self.methods is None:
+            return self.type_check_method_body(env, node)
+        className = str(env.getLocal(SYMBOL_THIS))
+        key = (className, node.name.get_name(), tuple(formal.get_type() for formal in node.formals))
+        digest = self.digests.get(id(node)) or hashlib.sha256(str(node).encode()).hexdigest()
+        entry = self.methods.get(key)
+        if entry is not None and entry.digest == digest and \
+                all(env.dependency(dependency) == value for (dependency, value) in entry.dependencies.items()):
+            with paused_gc():
+                annotate(node, InfoUnpickler(io.BytesIO(entry.annotations), self.infos, env.types).load())
+            self.methods.put(key, entry)
+            return entry.isOK
+        self.dependencies = {('class', className): env.dependency(('class', className))}
+        errors = len(self.diagnostics)
+        isOK = self.type_check_method_body(env, node)
+        if len(self.diagnostics) == errors:
+            data = io.BytesIO()
+            with paused_gc():
+                InfoPickler(data, self.places).dump(annotations_of(node))
+            self.methods.put(key, MethodEntry(digest, self.dependencies, data.getvalue(), isOK))
+        self.dependencies = None
+        return isOK
+
+    def depend(self, env: TypeEnv, dependency: Tuple[str, ...]):
+        if self.dependencies is not None:
+            self.dependencies[dependency] = env.dependency(dependency)
+
+    def type_check_method_body(self, env: TypeEnv, node: ast.Method) -> bool:
+        # add envs, the formals are checked to be distinct with the signature of the class
+        ret_type = env.getType(node.ret_type)
         for formal in node.formals:
-            env.addLocal(formal.get_name(), formal.get_type())
-        env.addLocal("return", methodInfo.ret_type)
+            env.addLocal(formal.get_symbol(), env.getType(formal.type))
+        env.addLocal(SYMBOL_RETURN, ret_type)
         formals = [i.get_name() for i in node.formals]
-        self.distinct(formals)
 
         # type check
         type = self.type_check_block(env, node.body, formals)
 
         # clear envs
         for formal in node.formals:
-            env.removeLocal(formal.get_name())
-        env.removeLocal("return")
-
-        return type == methodInfo.ret_type
-
-    def type_check_block(self, env: TypeEnv, node: ast.Block, formals : List[str] = []) -> str:
-        # don't allow declarations in block to have the same name although not in specification
-        self.distinct([i.get_name() for i in node.vars] + formals)
-        for var in node.vars:
-            env.addLocal(var.get_name(), var.get_type())
-
-        for stmts in node.stmts[:-1]:
-            self.type_check_statement(env, stmts)
-
-        last_type = self.type_check_statement(env, node.stmts[-1])
-
-        for var in node.vars:
-            env.removeLocal(var.get_name())
-        return last_type
-
-    def type_check_statement(self, env: TypeEnv, node: ast.Statement) -> str:
-        if isinstance(node, ast.IfThenElse):
-            return self.type_check_ifThenElse(env, node)
-        elif isinstance(node, ast.While):
-            return self.type_check_while(env, node)
-        elif isinstance(node, ast.Return):
-            return self.type_check_return(env, node)
-        elif isinstance(node, ast.Assignment):
-            return self.type_check_assignment(env, node)
-        elif isinstance(node, ast.MethodCall):
-            return self.type_check_methodCall(env, node)
-        elif isinstance(node, ast.Readln):
-            return self.type_check_readln(env, node)
-        elif isinstance(node, ast.Println):
-            return self.type_check_println(env, node)
-        else:
-            self.assertion(False, node)
-
-    def type_check_ifThenElse(self, env: TypeEnv, node: ast.IfThenElse) -> str:
-        self.validate(self.type_check_expr(env, node.cond), "Bool", node)
-        if_type = self.type_check_block(env, node.true_branch)
-        else_type = self.type_check_block(env, node.false_branch)
-        self.validate(if_type, else_type, node)
-        return else_type
-
-    def type_check_while(self, env: TypeEnv, node: ast.While) -> str:
-        self.validate(self.type_check_expr(env, node.cond), "Bool", node)
-        return self.type_check_block(env, node.body)
-
-    def type_check_return(self, env: TypeEnv, node: ast.Return) -> str:
+            env.removeLocal(formal.get_symbol())
+        env.removeLocal(SYMBOL_RETURN)
+
+        return type == ret_type
+
+    # nested blocks are checked with an explicit stack of work items instead of recursing, the type of
+    # every finished block and statement is pushed on types
+    def type_check_block(self, env: TypeEnv, node: ast.Block, formals : List[str] = []) -> ast.TypeId:
+        types : List[ast.TypeId] = []
+        work : List[tuple] = [(BLOCK_ENTER, node, formals)]
+        while work:
+            (action, node, arg) = work.pop()
+            if action == BLOCK_ENTER:
+                # don't allow declarations in block to have the same name although not in specification
+                env.distinct(node.vars, arg)
+                for var in node.vars:
+                    env.addLocal(var.get_symbol(), env.getType(var.type))
+                work.append((BLOCK_EXIT, node, len(types)))
+                for stmt in reversed(node.stmts):
+                    work.append((STATEMENT, stmt, None))
+            elif action == BLOCK_EXIT:
+                # the type of a block is the type of its last statement
+                last_type = types[-1]
+                del types[arg:]
+                for var in node.vars:
+                    env.removeLocal(var.get_symbol())
+                types.append(last_type)
+            elif action == IF_EXIT:
+                else_type = types.pop()
+                if_type = types.pop()
+                try:
+                    self.validate(if_type, else_type, node)
+                except TypeCheckException as e:
+                    self.recover(e, node)
+                types.append(else_type)
+            else:
+                self.block_handlers[type(node)](self, env, node, work, types)
+        return types.pop()
+
+    @block_handlers.register(ast.IfThenElse)
+    def type_check_ifThenElse(self, env: TypeEnv, node: ast.IfThenElse, work: List[tuple], types: List[ast.TypeId]):
+        work.append((IF_EXIT, node, None))
+        work.append((BLOCK_ENTER, node.false_branch, []))
+        work.append((BLOCK_ENTER, node.true_branch, []))
+        self.type_check_condition(env, node)
+
+    # the type of a loop is the type of its body
+    @block_handlers.register(ast.While)
+    def type_check_while(self, env: TypeEnv, node: ast.While, work: List[tuple], types: List[ast.TypeId]):
+        work.append((BLOCK_ENTER, node.body, []))
+        self.type_check_condition(env, node)
+
+    # the branches of a statement with a wrong condition are still checked
+    def type_check_condition(self, env: TypeEnv, node: ast.Statement):
+        try:
+            self.validate(self.type_check_expr(env, node.cond), ast.BOOL_TYPE, node)
+        except TypeCheckException as e:
+            self.recover(e, node.cond)
+
+    @block_handlers.register(ast.Statement)
+    def type_check_simple_statement(self, env: TypeEnv, node: ast.Statement, work: List[tuple], types: List[ast.TypeId]):
+        try:
+            types.append(self.statement_handlers[type(node)](self, env, node))
+        except TypeCheckException as e:
+            types.append(self.recover(e, node))
+
+    @statement_handlers.register(ast.Statement)
+    @node_handlers.register(ast.ASTNode)
+    def type_check_unexpected(self, env: TypeEnv, node: ast.ASTNode, *operand_types: List[ast.TypeId]):
+        self.assertion(False, node)
+
+    @statement_handlers.register(ast.Return)
+    def type_check_return(self, env: TypeEnv, node: ast.Return) -> ast.TypeId:
         if node.ret_expr == None:
-            return "Void"
+            return ast.VOID_TYPE
         else:
-            self.validate(self.type_check_expr(env, node.ret_expr), env.getLocal("return"), node)
-        return env.getLocal("return")
+            self.validate(self.type_check_expr(env, node.ret_expr), env.getLocal(SYMBOL_RETURN), node)
+        return env.getLocal(SYMBOL_RETURN)
 
-    def type_check_readln(self, env: TypeEnv, node: ast.Readln) -> str:
-        self.validateOneOf(env.getLocal(node.identifier.get_name()), ["Int", "Bool", "String"], node)
-        return "Void"
+    @statement_handlers.register(ast.Readln)
+    def type_check_readln(self, env: TypeEnv, node: ast.Readln) -> ast.TypeId:
+        self.validateOneOf(env.getLocal(node.identifier.get_symbol()), PRINTABLE, node)
+        return ast.VOID_TYPE
 
-    def type_check_println(self, env: TypeEnv, node: ast.Println) -> str:
-        self.validateOneOf(self.type_check_expr(env, node.expr), ["Int", "Bool", "String"], node)
-        return "Void"
+    @statement_handlers.register(ast.Println)
+    def type_check_println(self, env: TypeEnv, node: ast.Println) -> ast.TypeId:
+        self.validateOneOf(self.type_check_expr(env, node.expr), PRINTABLE, node)
+        return ast.VOID_TYPE
 
-    def type_check_assignment(self, env: TypeEnv, node: ast.Assignment) -> str:
+    @statement_handlers.register(ast.Assignment)
+    def type_check_assignment(self, env: TypeEnv, node: ast.Assignment) -> ast.TypeId:
         atom_type = self.type_check_atom(env, node.lhs)
         expr_type = self.type_check_expr(env, node.rhs)
         self.validate(expr_type, atom_type, node)
-        return "Void"
+        return ast.VOID_TYPE
 
-    def type_check_methodCall(self, env: TypeEnv, node: ast.MethodCall) -> str:
-        return self.type_check_atomCall(env, node.call)
+    @statement_handlers.register(ast.MethodCall)
+    def type_check_methodCall(self, env: TypeEnv, node: ast.MethodCall) -> ast.TypeId:
+        return self.type_check_atom(env, node.call)
 
     # only three cases: BinaryOp, UnaryOp (where int, bool atom included), or String
-    def type_check_expr(self, env: TypeEnv, node: ast.Expr) -> str:
-        if isinstance(node, ast.BinaryOp):
-            type = self.type_check_binaryOp(env, node)
-        elif isinstance(node, ast.UnaryOp):
-            type = self.type_check_unaryOp(env, node)
-        elif isinstance(node, ast.String):
-            type = "String"
-        elif isinstance(node, ast.Atom):
-            type = self.type_check_atom(env, node)
-        else:
-            self.assertion(False, node)
-        node.annotate_type(type)
-        return type
+    # the tree is checked bottom-up with an explicit stack, every node is annotated with its type
+    def type_check_expr(self, env: TypeEnv, node: ast.Expr) -> ast.TypeId:
+        types : List[ast.TypeId] = []
+        work : List[Tuple[ast.Expr, bool]] = [(node, False)]
+        while work:
+            (node, visited) = work.pop()
+            operands = self.operand_handlers[type(node)](self, node)
+            if not visited and operands:
+                work.append((node, True))
+                for operand in reversed(operands):
+                    work.append((operand, False))
+                continue
+            operand_types = types[len(types) - len(operands):]
+            del types[len(types) - len(operands):]
+            node_type = self.node_handlers[type(node)](self, env, node, operand_types)
+            node.annotate_type(node_type)
+            types.append(node_type)
+        return types.pop()
+
+    def type_check_atom(self, env: TypeEnv, node: ast.Atom) -> ast.TypeId:
+        return self.type_check_expr(env, node)
+
+    # the children of an expression whose types its own type is derived from
+    @operand_handlers.register(ast.ASTNode)
+    def no_operands(self, node: ast.Expr) -> List[ast.Expr]:
+        return []
+
+    @operand_handlers.register(ast.BinaryOp)
+    def binaryOp_operands(self, node: ast.BinaryOp) -> List[ast.Expr]:
+        return [node.left_operand, node.right_operand]
+
+    @operand_handlers.register(ast.UnaryOp)
+    def unaryOp_operands(self, node: ast.UnaryOp) -> List[ast.Expr]:
+        if isinstance(node.operand, ast.Integer) or isinstance(node.operand, ast.Boolean):
+            return []
+        return [node.operand]
+
+    @operand_handlers.register(ast.AtomAccess)
+    def atomAccess_operands(self, node: ast.AtomAccess) -> List[ast.Expr]:
+        return [node.lhs]
+
+    @operand_handlers.register(ast.AtomExpr)
+    def atomExpr_operands(self, node: ast.AtomExpr) -> List[ast.Expr]:
+        return [node.expr]
+
+    @operand_handlers.register(ast.AtomCall)
+    def atomCall_operands(self, node: ast.AtomCall) -> List[ast.Expr]:
+        if isinstance(node.call, ast.Identifier) or isinstance(node.call, ast.This):
+            return node.args
+        return [node.call.lhs] + node.args
 
-    def type_check_unaryOp(self, env: TypeEnv, node: ast.UnaryOp) -> str:
-        if isinstance(node.operand, ast.Integer):
-            type = "Int"
-        elif isinstance(node.operand, ast.Boolean):
-            type = "Bool"
-        else:
-            type =  self.type_check_atom(env, node.operand)
-        node.annotate_type(type)
-        return type    
-
-    def type_check_binaryOp(self, env: TypeEnv, node: ast.BinaryOp) -> str:
-        # somehow this is right associative, but doesn't affect calculation, ignore for now
-        if isinstance(node.left_operand, ast.BinaryOp):
-            lhs = self.type_check_binaryOp(env, node.left_operand)
-        elif isinstance(node.left_operand, ast.UnaryOp):
-            lhs = self.type_check_unaryOp(env, node.left_operand)
-        elif isinstance(node.left_operand, ast.String):
-            lhs = "String"
-        elif isinstance(node.left_operand, ast.Atom):
-            lhs = self.type_check_atom(env, node.left_operand)
-        else:
-            self.assertion(False, node)
+    @node_handlers.register(ast.String)
+    def type_check_string(self, env: TypeEnv, node: ast.String, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return ast.STRING_TYPE
 
-        if isinstance(node.right_operand, ast.BinaryOp):
-            rhs = self.type_check_binaryOp(env, node.right_operand)
-        elif isinstance(node.right_operand, ast.UnaryOp):
-            rhs = self.type_check_unaryOp(env, node.right_operand)
-        elif isinstance(node.right_operand, ast.String):
-            rhs = "String"
-        elif isinstance(node.right_operand, ast.Atom):
-            rhs = self.type_check_atom(env, node.right_operand)
-        else:
-            self.assertion(False, node)
+    @node_handlers.register(ast.Identifier)
+    def type_check_identifier(self, env: TypeEnv, node: ast.Identifier, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return env.getLocal(node.get_symbol())
 
-        if isinstance(node.operator, ast.RelativeOperator):
-            self.validate(lhs, "Int", node)
-            self.validate(rhs, "Int", node)
-            type = "Bool"
-        else:
-            self.validate(lhs, rhs, node)
-            type = rhs
-        node.annotate_type(type)
-        return type
+    @node_handlers.register(ast.NewClass)
+    def type_check_newClass(self, env: TypeEnv, node: ast.NewClass, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return env.types.of_symbol(node.get_symbol())
 
-    def type_check_atom(self, env: TypeEnv, node: ast.Atom) -> str:
-        if isinstance(node, ast.Identifier):
-            type = env.getLocal(node.get_name())
-        elif isinstance(node, ast.NewClass):
-            type =  node.get_name()
-        elif isinstance(node, ast.AtomAccess):
-            type =  self.type_check_atomAccess(env, node)
-        elif isinstance(node, ast.AtomExpr):
-            type =  self.type_check_expr(env, node.expr)
-        elif isinstance(node, ast.AtomCall):
-            type =  self.type_check_atomCall(env, node)
-        elif isinstance(node, ast.This):
-            type =  env.getLocal("this")
-        elif isinstance(node, ast.Null):
-            type =  "Null"
-        else:
-            self.assertion(False, node)
-        node.annotate_type(type)
-        return type
+    @node_handlers.register(ast.AtomExpr)
+    def type_check_atomExpr(self, env: TypeEnv, node: ast.AtomExpr, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return operand_types[0]
+
+    @node_handlers.register(ast.This)
+    def type_check_this(self, env: TypeEnv, node: ast.This, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return env.getLocal(SYMBOL_THIS)
+
+    @node_handlers.register(ast.Null)
+    def type_check_null(self, env: TypeEnv, node: ast.Null, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        return ast.NULL_TYPE
+
+    @node_handlers.register(ast.UnaryOp)
+    def type_check_unaryOp(self, env: TypeEnv, node: ast.UnaryOp, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        if isinstance(node.operand, ast.Integer):
+            return ast.INT_TYPE
+        elif isinstance(node.operand, ast.Boolean):
+            return ast.BOOL_TYPE
+        return operand_types[0]
 
-    def type_check_atomAccess(self, env: TypeEnv, node: ast.AtomAccess) -> str:
-        classname = self.type_check_atom(env, node.lhs)
-        classInfo = env.getClass(classname)
-        if node.rhs.get_name() in classInfo.fields:
-            type = classInfo.fields[node.rhs.get_name()]
+    @node_handlers.register(ast.BinaryOp)
+    def type_check_binaryOp(self, env: TypeEnv, node: ast.BinaryOp, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        (lhs, rhs) = operand_types
+        if isinstance(node.operator, ast.RelativeOperator):
+            self.validate(lhs, ast.INT_TYPE, node)
+            self.validate(rhs, ast.INT_TYPE, node)
+            return ast.BOOL_TYPE
+        self.validate(lhs, rhs, node)
+        return rhs
+
+    @node_handlers.register(ast.AtomAccess)
+    def type_check_atomAccess(self, env: TypeEnv, node: ast.AtomAccess, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        classInfo = env.getClass(operand_types[0])
+        self.depend(env, ('field', str(classInfo.name), node.rhs.get_name()))
+        if node.rhs.get_symbol() in classInfo.fields:
+            type = classInfo.fields[node.rhs.get_symbol()]
         else:
             self.assertion(False, node)
-        node.annotate_type(type)
         return type
 
-    def type_check_atomCall(self, env: TypeEnv, node: ast.AtomCall) -> str:
-        if isinstance(node.call, ast.Identifier) or isinstance(node.call, ast.This):
+    # the argument types come last in operand_types, after the type of the object for a global call
+    @node_handlers.register(ast.AtomCall)
+    def type_check_atomCall(self, env: TypeEnv, node: ast.AtomCall, operand_types: List[ast.TypeId]) -> ast.TypeId:
+        if isinstance(node.call, ast.Identifier):
             # local call
-            methodInfos = env.getLocalMethod(str(node.call))
+            method = node.call.get_symbol()
+            env.getLocalMethod(method)
+            classInfo = env.getClass(env.getLocal(SYMBOL_THIS))
+        elif isinstance(node.call, ast.This):
+            method = SYMBOL_THIS
+            env.getLocalMethod(method)
+            classInfo = env.getClass(env.getLocal(SYMBOL_THIS))
         else:
             # global call
-            classname = self.type_check_atom(env, node.call.lhs)
-            classInfo = env.getClass(classname)
-            if not node.call.rhs.get_name() in classInfo.methods:
-                TypeCheckException(f"Unable to find method '{node.call.rhs.get_name()}' in class '{classInfo.name}' near '{node}'")
-            methodInfos = classInfo.methods[node.call.rhs.get_name()]
-
-
-        match = 0
-        ret_type : str
-        match_info : ast.MethodInfo
-        for methodInfo in methodInfos:
-            valid = True
-            if len(node.args) != len(methodInfo.args):
-                valid = False
-                continue
-            for arg in range(len(node.args)):
-                type = self.type_check_expr(env, node.args[arg])
-                if type != methodInfo.args[arg]:
-                    valid = False
-            if valid == True:
-                match += 1
-                match_info = methodInfo
-                ret_type = methodInfo.ret_type
-
-        if match > 1:
-            TypeCheckException(f"type_check_atomCall(): unable to resolve ambiguous function signature for {node}")
-        if match == 0:
-            TypeCheckException(f"type_check_atomCall(): unable to find function signature for {node}")
-        node.annotate_type(ret_type)
-        node.call.annotate_type(ret_type)
+            classInfo = env.getClass(operand_types[0])
+            method = node.call.rhs.get_symbol()
+            self.depend(env, ('methods', str(classInfo.name), node.call.rhs.get_name()))
+            if not method in classInfo.methods:
+                raise TypeCheckException(f"Unable to find method '{node.call.rhs.get_name()}' in class '{classInfo.name}' near '{node}'")
+        arg_types = tuple(operand_types[len(operand_types) - len(node.args):])
+
+        # the overload is looked up by its exact signature, a null argument is passed to a parameter of
+        # any class type so that the overloads of the same arity are scanned instead
+        if ast.NULL_TYPE in arg_types:
+            matches = [methodInfo for methodInfo in classInfo.arities.get((method, len(arg_types)), [])
+                       if all(arg == param or (arg == ast.NULL_TYPE and env.types.assignable(arg, param))
+                              for (arg, param) in zip(arg_types, methodInfo.args))]
+        else:
+            matches = classInfo.dispatch.get((method, len(arg_types), arg_types), [])
+        if len(matches) > 1:
+            raise TypeCheckException(f"type_check_atomCall(): unable to resolve ambiguous function signature for {node}")
+        if len(matches) == 0:
+            raise TypeCheckException(f"type_check_atomCall(): unable to find function signature for {node}")
+        match_info = matches[0]
+        node.call.annotate_type(match_info.ret_type)
         node.annotate_callInfo(match_info)
-        return ret_type
+        return match_info.ret_type
+
+
+# MethodInfo annotations pickled as their place (class name, method name, overload index) in the signature
+# table, so that a call is annotated with the MethodInfo object of the table the annotations are loaded against.
+# Class types are pickled by name and get the ids of the TypeTable they are loaded against, the builtin types
+# by their fixed ids
+class InfoPickler(pickle.Pickler):
+    def __init__(self, file, places: Dict[int, Tuple[str, str, int]]):
+        super().__init__(file)
+        self.places = places
+
+    # the places of the MethodInfo objects of a signature table keyed by object id
+    @staticmethod
+    def places(classDes: Dict[ast.TypeId, ast.ClassInfo]) -> Dict[int, Tuple[str, str, int]]:
+        return {id(info): (str(name), info.name, i) for (name, classInfo) in classDes.items()
+                for infos in classInfo.methods.values() for (i, info) in enumerate(infos)}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, ast.MethodInfo):
+            return self.places.get(id(obj))
+        if isinstance(obj, ast.TypeId):
+            return int(obj) if obj < len(ast.BUILTIN_TYPES) else obj.name
+        return None
+
+
+class InfoUnpickler(CacheUnpickler):
+    def __init__(self, file, infos: Dict[Tuple[str, str, int], ast.MethodInfo], types: ast.TypeTable):
+        super().__init__(file)
+        self.infos = infos
+        self.types = types
+
+    # the MethodInfo objects of a signature table keyed by place
+    @staticmethod
+    def infos(classDes: Dict[ast.TypeId, ast.ClassInfo]) -> Dict[Tuple[str, str, int], ast.MethodInfo]:
+        return {(str(name), info.name, i): info for (name, classInfo) in classDes.items()
+                for infos in classInfo.methods.values() for (i, info) in enumerate(infos)}
+
+    def persistent_load(self, pid):
+        if isinstance(pid, int):
+            return ast.BUILTIN_TYPES[pid]
+        if isinstance(pid, str):
+            return self.types.of_name(pid)
+        return self.infos[pid]
+
+
+# digests of the source text of the methods of a program lexed into a TokenStore keyed by node id, a method
+# runs from its first token to the first token of the next method or class. Empty for the legacy lexer,
+# whose methods are hashed by their printed form instead
+def method_digests(program: ast.Program) -> Dict[int, str]:
+    starts = []
+    for node in [program.main_class] + program.classes:
+        starts.append((None, node.first_token()))
+        starts.extend((method, method.first_token()) for method in node.methods)
+    if not all(isinstance(token, TokenView) for (_, token) in starts):
+        return {}
+    store = starts[0][1].store
+    digests = {}
+    for (i, (method, token)) in enumerate(starts):
+        if method is not None:
+            end = store.starts[starts[i + 1][1].index] if i + 1 < len(starts) else len(store.source_code)
+            text = store.source_code[store.starts[token.index]:end]
+            digests[id(method)] = hashlib.sha256(text.encode() if store.is_text else text).hexdigest()
+    return digests
+
+
+# the annotations the Checker set under node, keyed by the preorder position of their node
+def annotations_of(node: ast.ASTNode) -> List[Tuple[int, Dict[str, Any]]]:
+    annotations = []
+    for (position, child) in enumerate(node.nodes()):
+        slots = {slot: getattr(child, slot) for slot in ast.ANNOTATION_SLOTS if hasattr(child, slot)}
+        if slots:
+            annotations.append((position, slots))
+    return annotations
+
+
+# sets the annotations of annotations_of on a copy of the node they were taken from
+def annotate(node: ast.ASTNode, annotations: List[Tuple[int, Dict[str, Any]]]):
+    if annotations:
+        nodes = list(node.nodes())
+        for (position, slots) in annotations:
+            for (slot, value) in slots.items():
+                setattr(nodes[position], slot, value)
+
+
+# the program and the signature table, inherited by the worker processes
+check_worker_args = None
+
+
+def init_check_worker(program: ast.Program, classDes: Dict[ast.TypeId, ast.ClassInfo], classInfos: List[ast.ClassInfo]):
+    global check_worker_args
+    check_worker_args = (program, classDes, classInfos, InfoPickler.places(classDes))
+
+
+# checks the class at `index` of the program against the signature table and returns the result, the
+# diagnostics and the annotations it set, keyed by the preorder position of their node in the class
+def check_class(index: int) -> bytes:
+    (program, classDes, classInfos, places) = check_worker_args
+    node = program.classes[index - 1] if index else program.main_class
+    checker = Checker()
+    checker.types = program.types
+    env = TypeEnv(program.symbols, program.types, checker.diagnostics)
+    env.classDes = classDes
+    isOK = checker.type_check_class(env, node, classInfos[index])
+    data = io.BytesIO()
+    with paused_gc():
+        InfoPickler(data, places).dump((isOK, checker.diagnostics.items, annotations_of(node)))
+    return data.getvalue()
+
+
+# Checker().check() with the class bodies checked in `jobs` worker processes once the signatures of all
+# classes are known. The diagnostics and annotations of the classes are merged in source order, so that
+# the checked program and its diagnostics are those of a serial check
+def check_parallel(astRoot: ast.Program, jobs: int, diagnostics: Diagnostics = None) -> Diagnostics:
+    checker = Checker(diagnostics)
+    astRoot.types = checker.types = ast.TypeTable(astRoot.symbols)
+    env = TypeEnv(astRoot.symbols, astRoot.types, checker.diagnostics)
+    classInfos = checker.type_check_signatures(env, astRoot)
+    classes = [astRoot.main_class] + astRoot.classes
+    chunksize = max(1, len(classes) // (jobs * 4))
+    infos = InfoUnpickler.infos(env.classDes)
+    with ProcessPoolExecutor(jobs, initializer=init_check_worker, initargs=(astRoot, env.classDes, classInfos)) as executor:
+        with paused_gc():
+            for (node, data) in zip(classes, executor.map(check_class, range(len(classes)), chunksize=chunksize)):
+                (_, items, annotations) = InfoUnpickler(io.BytesIO(data), infos, astRoot.types).load()
+                checker.diagnostics.items.extend(items)
+                annotate(node, annotations)
+    return checker.diagnostics
 
 
 if __name__ == '__main__':
     source_file = sys.argv[1]
     with open(source_file) as f:
         source_code = f.read()
-    lexer = Lexer(source_code)
-    parser = Parser(lexer)
+    diagnostics = Diagnostics()
+    lexer = Lexer(source_code, diagnostics=diagnostics)
+    parser = Parser(lexer, diagnostics=diagnostics)
     astree = parser.parse()
-    checker = Checker().check(astree)
+    exit_on_errors(diagnostics)
+    exit_on_errors(Checker(diagnostics).check(astree))
     argparser = argparse.ArgumentParser()
     argparser.add_argument('input', help='input file')
     argparser.add_argument('-O', '--optimize', help='optimize program', action='store_true')
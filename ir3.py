@@ -1,22 +1,78 @@
 # Ye Guoquan, A0188947A
+import io
+import json
+import pickle
 import ast
-from typing import List, Tuple
+from typing import List, Tuple, Union, Optional, Dict
+from visitor import Dispatch
+from cache import paused_gc
 
 
 class IR3Exception(Exception):
     pass
 
+
+# -----------------------------------------------------------------------------------------------
+# IR3 operands
+# -----------------------------------------------------------------------------------------------
+
+class Operand(str):
+    # an operand is classified once when the IR3 is generated, so that the later stages switch on its
+    # class instead of parsing its text. It is compared, hashed and printed as that text
+    __slots__ = ()
+
+class Const(Operand):
+    __slots__ = ()
+
+class IntConst(Const):
+    __slots__ = ()
+
+class BoolConst(Const):
+    __slots__ = ()
+
+    @property
+    def value(self) -> bool:
+        return self == "true"
+
+class StrConst(Const):
+    __slots__ = ()
+
+class NullConst(Const):
+    __slots__ = ()
+
+class Temp(Operand):
+    __slots__ = ()
+
+class Local(Operand):
+    __slots__ = ()
+
+class This(Operand):
+    __slots__ = ()
+
+class Field(Operand):
+    # the field of obj, or of this if obj is None, which is printed without it
+    def __new__(cls, obj : Optional[Operand], field : str):
+        self = super().__new__(cls, field if obj is None else obj + "." + field)
+        self.obj = obj
+        self.field = field
+        return self
+
+    def __reduce__(self):
+        return (Field, (self.obj, self.field))
+
+THIS = This("this")
+
 # -----------------------------------------------------------------------------------------------
 # IR3 AST
 # -----------------------------------------------------------------------------------------------
 
 class IR3ASTNode():
-    pass
+    __slots__ = ()
 
 class CData3(IR3ASTNode):
 
     def __init__(self, class_name, varDecls):
-        self.class_name : str = class_name
+        self.class_name : ast.TypeId = class_name
         self.varDecls : List[VarDecl3] = varDecls
 
     def addVarDecl(self, type, id):
@@ -30,7 +86,7 @@ class CData3(IR3ASTNode):
 
 class CMethod3(IR3ASTNode):
     def __init__(self, type, id, formals, body):
-        self.type :str = type
+        self.type : ast.TypeId = type
         self.id :str = id
         self.formals : List[Formal3] = formals
         self.body : Block3 = body
@@ -63,7 +119,7 @@ class Program3(IR3ASTNode):
 
 class VarDecl3(IR3ASTNode):
     def __init__(self, type, id):
-        self.type :str = type
+        self.type : ast.TypeId = type
         self.id : str = id
     
     def __str__(self):
@@ -73,7 +129,7 @@ class VarDecl3(IR3ASTNode):
 class Formal3(IR3ASTNode):
     # TODO: merge with vardecl
     def __init__(self, type, id):
-        self.type :str = type
+        self.type : ast.TypeId = type
         self.id : str = id
     
     def __str__(self):
@@ -97,10 +153,23 @@ class Block3(IR3ASTNode):
 
 
 
+# the fields of a node in the order of its constructor arguments
+def nodeFields(cls : type) -> Tuple[str, ...]:
+    code = cls.__init__.__code__
+    return code.co_varnames[1:code.co_argcount]
+
+# statements are slotted, a method body holds one per instruction and the optimizer rewrites
+# their fields in place
 class Stmt3(IR3ASTNode):
-    pass
+    __slots__ = ()
+
+    # pickled as its constructor arguments rather than a dict of its slots
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, i) for i in nodeFields(type(self))))
 
 class Label3(Stmt3):
+    __slots__ = ("label",)
+
     def __init__(self, label : str):
         self.label : str = label
 
@@ -109,6 +178,8 @@ class Label3(Stmt3):
         return string
 
 class Goto3(Stmt3):
+    __slots__ = ("label",)
+
     def __init__(self, label : str):
         self.label : str = label
 
@@ -117,6 +188,8 @@ class Goto3(Stmt3):
         return string
 
 class IfGoto3(Stmt3):
+    __slots__ = ("cond", "label")
+
     def __init__(self, cond : str, label : str):
         self.cond : str = cond
         self.label : str = label
@@ -126,6 +199,8 @@ class IfGoto3(Stmt3):
         return string
 
 class Readln3(Stmt3):
+    __slots__ = ("id",)
+
     def __init__(self, id:str):
         self.id : str = id
 
@@ -134,6 +209,8 @@ class Readln3(Stmt3):
         return string
 
 class Println3(Stmt3):
+    __slots__ = ("id",)
+
     def __init__(self, id:str):
         self.id :str = id
 
@@ -143,6 +220,8 @@ class Println3(Stmt3):
 
 
 class Return3(Stmt3):
+    __slots__ = ("id",)
+
     def __init__(self, id:str):
         self.id : str = id
 
@@ -155,6 +234,8 @@ class Return3(Stmt3):
 
 
 class TypeAssign3(Stmt3):
+    __slots__ = ("type", "id", "value")
+
     def __init__(self, type:str, id:str, value: str):
         self.type = type
         self.id = id
@@ -165,6 +246,8 @@ class TypeAssign3(Stmt3):
         return string
 
 class TypeAssignAtomAccess3(TypeAssign3):
+    __slots__ = ("obj", "field")
+
     def __init__(self, type:str, id:str, obj: str, field: str):
         self.type = type
         self.id = id
@@ -176,7 +259,9 @@ class TypeAssignAtomAccess3(TypeAssign3):
         return string
 
 class TypeAssignNew3(TypeAssign3):
-    def __init__(self, type:str, id:str, cname: str):
+    __slots__ = ("cname",)
+
+    def __init__(self, type: ast.TypeId, id:str, cname: ast.TypeId):
         self.type = type
         self.id = id
         self.cname = cname
@@ -186,6 +271,8 @@ class TypeAssignNew3(TypeAssign3):
         return string
 
 class TypeAssignCall3(TypeAssign3):
+    __slots__ = ("call", "args")
+
     def __init__(self, type:str, id:str, call: str, args: List[str]):
         self.type = type
         self.id = id
@@ -198,6 +285,8 @@ class TypeAssignCall3(TypeAssign3):
         return string
 
 class Assign3(Stmt3):
+    __slots__ = ("id", "result")
+
     def __init__(self, id:str, result: str):
         self.id = id
         self.result = result
@@ -208,6 +297,8 @@ class Assign3(Stmt3):
         
 
 class BinaryOp3(Stmt3):
+    __slots__ = ("type", "target", "lhs", "op", "rhs")
+
     def __init__(self, type:str, target:str, lhs: str, op : str, rhs : str):
         self.type = type
         self.target = target
@@ -220,6 +311,8 @@ class BinaryOp3(Stmt3):
         return string
 
 class UnaryOp3(Stmt3):
+    __slots__ = ("target", "op", "operand")
+
     def __init__(self, target:str, op : str, operand : str):
         self.target = target
         self.op = op
@@ -229,12 +322,34 @@ class UnaryOp3(Stmt3):
         string = f'    {self.target} = {self.op} {self.operand};'
         return string
 
+# only in the SSA form of a method, args holds one operand per predecessor of the block in their order
+class Phi3(Stmt3):
+    __slots__ = ("type", "id", "args")
+
+    def __init__(self, type : ast.TypeId, id : Operand, args : List[Operand]):
+        self.type = type
+        self.id = id
+        self.args = args
+
+    def __str__(self):
+        args = ",".join(str(i) for i in self.args)
+        string = f'    {self.type} {self.id} = phi({args});'
+        return string
+
 
 # -----------------------------------------------------------------------------------------------
 # IR3 generator
 # -----------------------------------------------------------------------------------------------
 
 class IR3:
+    # type(node) dispatch of the statements in a block, the statements other than if and while,
+    # the children of an expression, the statements of an expression node and the operand of an atom
+    blockHandlers3 = Dispatch()
+    stmtHandlers3 = Dispatch()
+    operandHandlers3 = Dispatch()
+    nodeHandlers3 = Dispatch()
+    idcHandlers3 = Dispatch()
+
     def __init__(self, ast : ast.Program):
         self.label = 0
         self.tmp = 0
@@ -246,14 +361,19 @@ class IR3:
         self.label += 1
         return result
 
-    def newTmp(self) -> str:
-        result = "_v" + str(self.tmp)
+    def newTmp(self) -> Temp:
+        result = Temp("_v" + str(self.tmp))
         self.tmp += 1
         return result
 
+    # a name is a local of the method being generated, or else a field of this
+    def genName3(self, name : str) -> Operand:
+        return Local(name) if name in self.locals else Field(None, name)
+
     def generateIR3(self) -> IR3ASTNode:
         self.label = 0
         self.tmp = 0
+        self.types = self.ast.types
         return self.genProgram3(self.ast)
 
     def genProgram3(self, astNode : ast.Program) -> Program3:
@@ -270,275 +390,397 @@ class IR3:
         varDecl3List : List[VarDecl3] = []
         for i in astNode.fields:
             varDecl3List.append(self.genVarDecl3(i))
-        return CData3(astNode.class_type.get_name(), varDecl3List)
+        return CData3(self.types.of_symbol(astNode.class_type.get_symbol()), varDecl3List)
 
     def genVarDecl3(self, astNode : ast.VarDecl) -> VarDecl3:
-        return VarDecl3(astNode.get_type(), astNode.get_name())
+        return VarDecl3(self.types.of_symbol(astNode.type.get_symbol()), astNode.get_name())
 
     def genCMethod3(self, astNode : ast.Class) -> List[CMethod3]:
-        class_name = astNode.class_type.get_name()
+        class_type = self.types.of_symbol(astNode.class_type.get_symbol())
         cMethod3List : List[CMethod3] = []
         for method in astNode.methods:
-            type_name = method.ret_type.get_name()
-            method_name = class_name + "_" + method.name.get_name() + "_" + "_".join(i.get_type() for i in method.formals)
-            formals3 : List[Formal3] = [Formal3(class_name, "this")]
+            type = self.types.of_symbol(method.ret_type.get_symbol())
+            method_name = str(class_type) + "_" + method.name.get_name() + "_" + "_".join(i.get_type() for i in method.formals)
+            formals3 : List[Formal3] = [Formal3(class_type, "this")]
             for i in method.formals:
                 formals3.append(self.genFormal3(i))
+            self.locals = {i.get_name() for i in method.formals + method.body.vars}
             body = self.genBlock3(method.body)
-            cMethod3List.append(CMethod3(type_name, method_name, formals3, body))
+            cMethod3List.append(CMethod3(type, method_name, formals3, body))
         return cMethod3List
 
     def genFormal3(self, astNode : ast.Formal) -> Formal3:
-        return Formal3(astNode.get_type(), astNode.get_name())
+        return Formal3(self.types.of_symbol(astNode.type.get_symbol()), astNode.get_name())
 
+    # the statements of a method are appended to one buffer, self.stmts, in the order they run. Nested if
+    # and while blocks are generated from an explicit stack of work items, which holds the statements still
+    # to generate and the labels and jumps to emit between them
     def genBlock3(self, astNode : ast.Block) -> Block3:
         varDecl3List : List[VarDecl3] = []
         for i in astNode.vars:
             varDecl3List.append(self.genVarDecl3(i))
-        stmt3List : List[Stmt3] = []
-        for i in astNode.stmts:
-            stmt3List += self.genStmt3(i)
-        return Block3(varDecl3List, stmt3List)
-
-    def genStmt3(self, astNode : ast.Statement) -> List[Stmt3]:
-        if isinstance(astNode, ast.IfThenElse):
-            return self.genIfThenElse3(astNode)
-        elif isinstance(astNode, ast.While):
-            return self.genWhile3(astNode)
-        elif isinstance(astNode, ast.Readln):
-            return self.genReadln3(astNode)
-        elif isinstance(astNode, ast.Println):
-            return self.genPrintln3(astNode)
-        elif isinstance(astNode, ast.Return):
-            return self.genReturn3(astNode)
-        elif isinstance(astNode, ast.Assignment):
-            return self.genAssignment3(astNode)
-        elif isinstance(astNode, ast.MethodCall):
-            return self.genMethodCall3(astNode)
-
-    def genIfThenElse3(self, astNode : ast.IfThenElse) -> List[Stmt3]:
-        statements : List[Stmt3] = []
+        self.stmts : List[Stmt3] = []
+        work : List[Union[ast.Statement, Stmt3]] = list(reversed(astNode.stmts))
+        while work:
+            item = work.pop()
+            self.blockHandlers3[type(item)](self, item, work)
+        return Block3(varDecl3List, self.stmts)
+
+    @blockHandlers3.register(Stmt3)
+    def emitStmt3(self, stmt : Stmt3, work : List[Union[ast.Statement, Stmt3]]):
+        self.stmts.append(stmt)
+
+    @blockHandlers3.register(ast.IfThenElse)
+    def genIfThenElse3(self, astNode : ast.IfThenElse, work : List[Union[ast.Statement, Stmt3]]):
         B_true = self.newLabel()
         B_false = self.newLabel()
         S_next = self.newLabel()
 
-        statements += self.genBranchExpr3(astNode.cond, B_true, B_false)
-        statements.append(Label3(B_true))
-        statements += self.genBlock3(astNode.true_branch).get_statements()
-        statements.append(Goto3(S_next))
-        statements.append(Label3(B_false))
-        statements += self.genBlock3(astNode.false_branch).get_statements()
-        statements.append(Label3(S_next))
-        return statements
-
-    def genWhile3(self, astNode : ast.While) -> List[Stmt3]:
-        statements : List[Stmt3] = []
+        self.genBranchExpr3(astNode.cond, B_true, B_false)
+        work.append(Label3(S_next))
+        work += reversed(astNode.false_branch.stmts)
+        work.append(Label3(B_false))
+        work.append(Goto3(S_next))
+        work += reversed(astNode.true_branch.stmts)
+        work.append(Label3(B_true))
+
+    @blockHandlers3.register(ast.While)
+    def genWhile3(self, astNode : ast.While, work : List[Union[ast.Statement, Stmt3]]):
         B_true = self.newLabel()
         S_begin = self.newLabel()
         S_next = self.newLabel()
 
-        statements.append(Label3(S_begin))
-        statements += self.genBranchExpr3(astNode.cond, B_true, S_next)
-        statements.append(Label3(B_true))
-        statements += self.genBlock3(astNode.body).get_statements()
-        statements.append(Goto3(S_begin))
-        statements.append(Label3(S_next))
-        return statements
-
-    def genReadln3(self, astNode : ast.Readln) -> List[Stmt3]:
-        statements : List[Stmt3] = []
-        statements.append(Readln3(astNode.identifier.get_name()))
-        return statements
-
-    def genPrintln3(self, astNode : ast.Println) -> List[Stmt3]:
-        statements : List[Stmt3] = []
+        self.stmts.append(Label3(S_begin))
+        self.genBranchExpr3(astNode.cond, B_true, S_next)
+        work.append(Label3(S_next))
+        work.append(Goto3(S_begin))
+        work += reversed(astNode.body.stmts)
+        work.append(Label3(B_true))
+
+    # statements other than if and while
+    @blockHandlers3.register(ast.Statement)
+    def genStmt3(self, astNode : ast.Statement, work : List[Union[ast.Statement, Stmt3]]):
+        self.stmtHandlers3[type(astNode)](self, astNode)
+
+    @stmtHandlers3.register(ast.Statement)
+    @nodeHandlers3.register(ast.ASTNode)
+    def genUnexpected3(self, astNode : ast.ASTNode, *operand_results : List[Operand]):
+        raise IR3Exception(f"genExpr3() error, unexpected {astNode}")
+
+    @stmtHandlers3.register(ast.Readln)
+    def genReadln3(self, astNode : ast.Readln):
+        self.stmts.append(Readln3(self.genName3(astNode.identifier.get_name())))
+
+    @stmtHandlers3.register(ast.Println)
+    def genPrintln3(self, astNode : ast.Println):
         v = self.newTmp()
-        (expr_stmts, result) = self.genExpr3(astNode.expr)
-        statements += expr_stmts
-        statements.append(TypeAssign3(astNode.expr.get_type(), v, result))
-        statements.append(Println3(v))
-        return statements
-
-    def genReturn3(self, astNode : ast.Return) -> List[Stmt3]:
-        statements : List[Stmt3] = []
+        result = self.genExpr3(astNode.expr)
+        self.stmts.append(TypeAssign3(astNode.expr.get_type(), v, result))
+        self.stmts.append(Println3(v))
+
+    @stmtHandlers3.register(ast.Return)
+    def genReturn3(self, astNode : ast.Return):
         if astNode.ret_expr == None:
-            statements.append(Return3(None))
-            return statements
+            self.stmts.append(Return3(None))
         else:
             v = self.newTmp()
-            (expr_stmts, result) = self.genExpr3(astNode.ret_expr)
-            statements += expr_stmts
-            statements.append(TypeAssign3(astNode.ret_expr.get_type(), v, result))
-            statements.append(Return3(v))
-        return statements
-
-    def genAssignment3(self, astNode : ast.Assignment) -> List[Stmt3]:
-        statements : List[Stmt3] = []
-        (expr_stmts, result) = self.genExpr3(astNode.rhs)
-        statements += expr_stmts
+            result = self.genExpr3(astNode.ret_expr)
+            self.stmts.append(TypeAssign3(astNode.ret_expr.get_type(), v, result))
+            self.stmts.append(Return3(v))
+
+    @stmtHandlers3.register(ast.Assignment)
+    def genAssignment3(self, astNode : ast.Assignment):
+        result = self.genExpr3(astNode.rhs)
         if isinstance(astNode.lhs, ast.AtomAccess):
-            (atom_stmts, atom_result) = self.genAtomAcess3(astNode.lhs, newVar=False)
+            if isinstance(astNode.lhs.lhs, ast.Identifier):
+                atom_result = self.genAtomAcess3(astNode.lhs, None, newVar=False)
+            else:
+                atom_result = self.genAtomAcess3(astNode.lhs, self.genExpr3(astNode.lhs.lhs), newVar=False)
         else:
-            (atom_stmts, atom_result) = self.genAtom3(astNode.lhs)
-        statements += atom_stmts
-        statements.append(Assign3(atom_result, result))
-        return statements
+            atom_result = self.genExpr3(astNode.lhs)
+        self.stmts.append(Assign3(atom_result, result))
+
+    @stmtHandlers3.register(ast.MethodCall)
+    def genMethodCall3(self, astNode : ast.MethodCall):
+        self.genExpr3(astNode.call)
+
+    def genBranchExpr3(self, astNode : ast.Expr, B_true : str, B_false : str):
+        result = self.genExpr3(astNode)
+        self.stmts.append(IfGoto3(result, B_true))
+        self.stmts.append(Goto3(B_false))
+
+    # expressions and atoms are generated bottom-up from an explicit stack, in the order their statements
+    # run. Every node appends its statements and yields the name that holds its value
+    def genExpr3(self, astNode : ast.Expr) -> Operand:
+        results : List[Operand] = []
+        work : List[Tuple[ast.Expr, bool]] = [(astNode, False)]
+        while work:
+            (node, visited) = work.pop()
+            operands = self.operandHandlers3[type(node)](self, node)
+            if not visited and operands:
+                work.append((node, True))
+                for operand in reversed(operands):
+                    work.append((operand, False))
+                continue
+            operand_results = results[len(results) - len(operands):]
+            del results[len(results) - len(operands):]
+            results.append(self.nodeHandlers3[type(node)](self, node, operand_results))
+        return results.pop()
+
+    # the children of an expression whose statements are generated before its own, in the order they run
+    @operandHandlers3.register(ast.ASTNode)
+    def noOperands3(self, astNode : ast.Expr) -> List[ast.Expr]:
+        return []
+
+    # the right operand of a binary operation is evaluated first
+    @operandHandlers3.register(ast.BinaryOp)
+    def binaryOpOperands3(self, astNode : ast.BinaryOp) -> List[ast.Expr]:
+        return [astNode.right_operand, astNode.left_operand]
+
+    @operandHandlers3.register(ast.UnaryOp)
+    def unaryOpOperands3(self, astNode : ast.UnaryOp) -> List[ast.Expr]:
+        if isinstance(astNode.operand, ast.Boolean) or isinstance(astNode.operand, ast.Integer):
+            return []
+        return [astNode.operand]
+
+    @operandHandlers3.register(ast.AtomCall)
+    def atomCallOperands3(self, astNode : ast.AtomCall) -> List[ast.Expr]:
+        if isinstance(astNode.call, ast.Identifier) or isinstance(astNode.call.lhs, ast.Identifier):
+            return astNode.args
+        return [astNode.call.lhs] + astNode.args
+
+    @operandHandlers3.register(ast.AtomExpr)
+    def atomExprOperands3(self, astNode : ast.AtomExpr) -> List[ast.Expr]:
+        return [astNode.expr]
+
+    @operandHandlers3.register(ast.AtomAccess)
+    def atomAccessOperands3(self, astNode : ast.AtomAccess) -> List[ast.Expr]:
+        if isinstance(astNode.lhs, ast.Identifier):
+            return []
+        return [astNode.lhs]
+
+    @nodeHandlers3.register(ast.AtomExpr)
+    def genAtomExpr3(self, astNode : ast.AtomExpr, operand_results : List[Operand]) -> Operand:
+        return operand_results[0]
 
-    def genMethodCall3(self, astNode : ast.MethodCall) -> List[Stmt3]:
-        (statements, result) = self.genAtomCall3(astNode.call)
-        return statements
+    # the object of an access to a field of an identifier has no statements and is not an operand
+    @nodeHandlers3.register(ast.AtomAccess)
+    def genAtomAccessExpr3(self, astNode : ast.AtomAccess, operand_results : List[Operand]) -> Operand:
+        return self.genAtomAcess3(astNode, operand_results[0] if operand_results else None)
 
-    def genAtomCall3(self, astNode : ast.AtomCall) -> Tuple[List[Stmt3], str]:
-        statements : List[Stmt3] = []
+    # the result of the object comes first in operand_results for a global call on a computed object
+    @nodeHandlers3.register(ast.AtomCall)
+    def genAtomCall3(self, astNode : ast.AtomCall, operand_results : List[Operand]) -> Operand:
+        arg_results = operand_results[len(operand_results) - len(astNode.args):]
 
         if isinstance(astNode.call, ast.Identifier):
             # local call
             #class_name = astNode.call.get_name()
             class_name = "this"
-            obj_name = "this"
+            obj_name = THIS
         else:
             # global call
-            class_name = astNode.call.lhs.get_type()
+            class_name = str(astNode.call.lhs.get_type())
             if isinstance(astNode.call.lhs, ast.Identifier):
-                obj_name = astNode.call.lhs.get_name()
-            else:            
-                (atom_stmts, atom_result) = self.genAtom3(astNode.call.lhs)
-                statements += atom_stmts
-                obj_name = atom_result
-
-        args : List[str] = [obj_name]
-        for i in astNode.args:
-            (expr_stmts, result) = self.genExpr3(i)
-            statements += expr_stmts
-            args.append(result)
+                obj_name = self.genName3(astNode.call.lhs.get_name())
+            else:
+                obj_name = operand_results[0]
+
+        args : List[Operand] = [obj_name] + arg_results
 
         v = self.newTmp()
         methodInfo : ast.MethodInfo = astNode.get_callInfo()
-        mangling = class_name + "_" + methodInfo.name + "_" + "_".join([i for i in methodInfo.args])
-        statements.append(TypeAssignCall3(methodInfo.ret_type, v, mangling, args))
-        return (statements, v)
-
-    def genBranchExpr3(self, astNode : ast.Expr, B_true : str, B_false : str) -> List[Stmt3]:
-        (statements, result) = self.genExpr3(astNode)
-        statements.append(IfGoto3(result, B_true))
-        statements.append(Goto3(B_false))
-        return statements
-
-    def genExpr3(self, astNode : ast.Expr) -> Tuple[List[Stmt3], str]:
-        if isinstance(astNode, ast.BinaryOp):
-            return self.genBinaryOp3(astNode)
-        elif isinstance(astNode, ast.UnaryOp):
-            return self.genUnaryOp3(astNode)
-        elif isinstance(astNode, ast.String):
-            return self.genIDC3(astNode)
-        elif isinstance(astNode, ast.Atom):
-            print(astNode)
-            return self.genAtom3(astNode)
-        else:
-            raise IR3Exception(f"genExpr3() error, unexpected {astNode}")
-
-    def genBinaryOp3(self, astNode : ast.BinaryOp) -> Tuple[List[Stmt3], str]:
-        statements : List[Stmt3] = []
-        if isinstance(astNode.left_operand, ast.BinaryOp):
-            (lhs_stmts, lhs_result) = self.genBinaryOp3(astNode.left_operand)
-        elif isinstance(astNode.left_operand, ast.UnaryOp):
-            (lhs_stmts, lhs_result) = self.genUnaryOp3(astNode.left_operand)
-        elif isinstance(astNode.left_operand, ast.String):
-            (lhs_stmts, lhs_result) = self.genIDC3(astNode.left_operand)
-        elif isinstance(astNode.left_operand, ast.Atom):
-            (lhs_stmts, lhs_result) = self.genAtom3(astNode.left_operand)
-        else:
-            raise IR3Exception(f"genBranchBinaryOp3() error, unexpected {astNode}")
-
-        if isinstance(astNode.right_operand, ast.BinaryOp):
-            (rhs_stmts, rhs_result) = self.genBinaryOp3(astNode.right_operand)
-        elif isinstance(astNode.right_operand, ast.UnaryOp):
-            (rhs_stmts, rhs_result) = self.genUnaryOp3(astNode.right_operand)
-        elif isinstance(astNode.right_operand, ast.String):
-            (rhs_stmts, rhs_result) = self.genIDC3(astNode.right_operand)
-        elif isinstance(astNode.right_operand, ast.Atom):
-            (rhs_stmts, rhs_result) = self.genAtom3(astNode.right_operand)
-        else:
-            raise IR3Exception(f"genBranchBinaryOp3() error, unexpected {astNode}")
+        mangling = class_name + "_" + methodInfo.name + "_" + "_".join([str(i) for i in methodInfo.args])
+        self.stmts.append(TypeAssignCall3(methodInfo.ret_type, v, mangling, args))
+        return v
 
-        statements += rhs_stmts
-        statements += lhs_stmts
+    @nodeHandlers3.register(ast.BinaryOp)
+    def genBinaryOp3(self, astNode : ast.BinaryOp, operand_results : List[Operand]) -> Operand:
+        (rhs_result, lhs_result) = operand_results
         v = self.newTmp()
         type = astNode.get_type()
-        statements.append(BinaryOp3(type, v, lhs_result, astNode.operator.get_name(), rhs_result))
-        return (statements, v)
+        self.stmts.append(BinaryOp3(type, v, lhs_result, astNode.operator.get_name(), rhs_result))
+        return v
 
-    def genUnaryOp3(self, astNode : ast.UnaryOp) -> Tuple[List[Stmt3], str]:
-        statements : List[Stmt3] = []
+    @nodeHandlers3.register(ast.UnaryOp)
+    def genUnaryOp3(self, astNode : ast.UnaryOp, operand_results : List[Operand]) -> Operand:
         if isinstance(astNode.operand, ast.Boolean) or isinstance(astNode.operand, ast.Integer):
-            (stmts, result) = self.genIDC3(astNode.operand)
+            result = self.genIDC3(astNode.operand, [])
         elif isinstance(astNode.operand, ast.Atom):
-            (stmts, result) = self.genAtom3(astNode.operand)
+            result = operand_results[0]
         else:
             raise IR3Exception(f"genUnaryOp3() error, unexpected {astNode.operand}")
 
-        statements += stmts
-
         v = self.newTmp()
         type = astNode.operand.get_type()
-        statements.append(TypeAssign3(type, v, result))
+        self.stmts.append(TypeAssign3(type, v, result))
 
         for i in range(astNode.repeat):
-            statements.append(UnaryOp3(v, astNode.operator.get_name(), v))
-        return (statements, v)
-
-
-    def genAtom3(self, astNode : ast.Atom) -> Tuple[List[Stmt3], str]:
-        if isinstance(astNode, ast.AtomCall):
-            #print(astNode)
-            #print("atomcall")
-            return self.genAtomCall3(astNode)
-        elif isinstance(astNode, ast.Null) or isinstance(astNode, ast.This) or isinstance(astNode, ast.Identifier):
-            #print(astNode)
-            #print("null/this/id")
-            return self.genIDC3(astNode)
-        elif isinstance(astNode, ast.NewClass):
-            #print(astNode)
-            #print("new")
-            return self.genAtomNew(astNode)
-        elif isinstance(astNode, ast.AtomExpr):
-            #print(astNode)
-            #print("atom expr")
-            return self.genExpr3(astNode.expr)
-        elif isinstance(astNode, ast.AtomAccess):
-            #print(astNode)
-            #print("access")
-            return self.genAtomAcess3(astNode)
-        else:
-            raise IR3Exception(f"genAtom3() error, unexpected {astNode}")
+            self.stmts.append(UnaryOp3(v, astNode.operator.get_name(), v))
+        return v
+
+    # the atoms with no statements, and the integer and boolean operands of a unary operation
+    @nodeHandlers3.register(ast.String, ast.Null, ast.This, ast.Identifier)
+    def genIDC3(self, astNode : ast.ASTNode, operand_results : List[Operand]) -> Operand:
+        return self.idcHandlers3[type(astNode)](self, astNode)
+
+    @idcHandlers3.register(ast.String)
+    def genString3(self, astNode : ast.String) -> Operand:
+        self.stringList.append(str(astNode))
+        return StrConst(str(astNode))
+
+    @idcHandlers3.register(ast.Integer)
+    def genInteger3(self, astNode : ast.Integer) -> Operand:
+        return IntConst(str(astNode))
 
-    def genIDC3(self, astNode : ast.ASTNode) -> Tuple[List[Stmt3], str]:
-        if isinstance(astNode, ast.String):
-            self.stringList.append(str(astNode))
-        return ([], str(astNode))
+    @idcHandlers3.register(ast.Boolean)
+    def genBoolean3(self, astNode : ast.Boolean) -> Operand:
+        return BoolConst(str(astNode))
 
-    def genAtomNew(self, astNode : ast.NewClass) -> Tuple[List[Stmt3], str]:
-        statements : List[Stmt3] = []
+    @idcHandlers3.register(ast.Null)
+    def genNull3(self, astNode : ast.Null) -> Operand:
+        return NullConst(str(astNode))
+
+    @idcHandlers3.register(ast.This)
+    def genThis3(self, astNode : ast.This) -> Operand:
+        return THIS
+
+    @idcHandlers3.register(ast.Identifier)
+    def genIdentifier3(self, astNode : ast.Identifier) -> Operand:
+        return self.genName3(astNode.get_name())
+
+    @nodeHandlers3.register(ast.NewClass)
+    def genAtomNew(self, astNode : ast.NewClass, operand_results : List[Operand]) -> Operand:
         type = astNode.get_type()
         v = self.newTmp()
-        statements.append(TypeAssignNew3(type, v, astNode.get_name()))
-        return (statements, v)
+        self.stmts.append(TypeAssignNew3(type, v, type))
+        return v
 
-    def genAtomAcess3(self, astNode : ast.AtomAccess, newVar = True) -> Tuple[List[Stmt3], str]:
-        statements : List[Stmt3] = []
-        if isinstance(astNode.lhs, ast.Identifier):
-            obj_name = astNode.get_obj_name()
+    # lhs is the result of the object, None if the object is an identifier
+    def genAtomAcess3(self, astNode : ast.AtomAccess, lhs : Optional[Operand], newVar = True) -> Operand:
+        if lhs is None:
+            obj_name = self.genName3(astNode.get_obj_name())
         else:
-            (stmts, result) = self.genAtom3(astNode.lhs)
-            statements += stmts
-            obj_name = result
+            obj_name = lhs
 
         if newVar:
             type = astNode.get_type()
             v = self.newTmp()
-            statements.append(TypeAssignAtomAccess3(type, v, obj_name, astNode.get_attr_name()))
-            return (statements, v)
+            self.stmts.append(TypeAssignAtomAccess3(type, v, obj_name, astNode.get_attr_name()))
+            return v
         else:
-            return (statements, obj_name + "." + astNode.get_attr_name())
-        
+            return Field(obj_name, astNode.get_attr_name())
+
+
+# -----------------------------------------------------------------------------------------------
+# IR3 serialization
+# -----------------------------------------------------------------------------------------------
 
+# A Program3 is written as pickle data after IR3_MAGIC, or as text: IR3_TEXT_HEADER, the types and the
+# strings of the program, then one JSON array per node, the name of its class followed by its fields.
+# A CData3 or CMethod3 line is followed by the lines of its declarations and statements. Both formats
+# keep the class of every operand and the id of every type
+IR3_MAGIC = b"IR3\x00\x01"
+IR3_TEXT_HEADER = "IR3 text 1"
+
+STMT3_CLASSES = {cls.__name__: cls for cls in [Label3, Goto3, IfGoto3, Readln3, Println3, Return3, TypeAssign3,
+    TypeAssignAtomAccess3, TypeAssignNew3, TypeAssignCall3, Assign3, BinaryOp3, UnaryOp3, Phi3]}
+OPERAND_CLASSES = {cls.__name__: cls for cls in [IntConst, BoolConst, StrConst, NullConst, Temp, Local, This]}
+
+def encodeValue3(value, types : Dict[int, str]):
+    if isinstance(value, ast.TypeId):
+        types[int(value)] = value.name
+        return int(value)
+    elif isinstance(value, Field):
+        return {"Field": [encodeValue3(value.obj, types), value.field]}
+    elif isinstance(value, Operand):
+        return {type(value).__name__: str(value)}
+    elif isinstance(value, list):
+        return [encodeValue3(i, types) for i in value]
+    return value # a name, a label or None
+
+def decodeValue3(value, types : Dict[int, ast.TypeId]):
+    if isinstance(value, int):
+        return types[value]
+    elif isinstance(value, dict):
+        ((kind, text),) = value.items()
+        if kind == "Field":
+            return Field(decodeValue3(text[0], types), text[1])
+        return OPERAND_CLASSES[kind](text)
+    elif isinstance(value, list):
+        return [decodeValue3(i, types) for i in value]
+    return value
+
+def encodeNode3(node : IR3ASTNode, fields : Tuple[str, ...], types : Dict[int, str]) -> str:
+    return json.dumps([type(node).__name__] + [encodeValue3(getattr(node, i), types) for i in fields])
+
+def dumpIR3Text(program : Program3) -> str:
+    types : Dict[int, str] = {}
+    lines : List[str] = [json.dumps(["strings", program.stringList])]
+    for cData in program.cData3List:
+        lines.append(encodeNode3(cData, ("class_name",), types))
+        lines += [encodeNode3(var, ("type", "id"), types) for var in cData.varDecls]
+    for method in program.cMethod3List:
+        lines.append(encodeNode3(method, ("type", "id"), types))
+        for node in method.formals + method.body.varDecls:
+            lines.append(encodeNode3(node, ("type", "id"), types))
+        for stmt in method.body.stmts:
+            lines.append(encodeNode3(stmt, nodeFields(type(stmt)), types))
+    header = [IR3_TEXT_HEADER, json.dumps(["types", sorted(types.items())])]
+    return "\n".join(header + lines) + "\n"
+
+def loadIR3Text(text : str) -> Program3:
+    lines = text.splitlines()
+    if not lines or lines[0] != IR3_TEXT_HEADER:
+        raise IR3Exception("not an IR3 file")
+    program = Program3([], [], [])
+    types : Dict[int, ast.TypeId] = {}
+    owner : Union[CData3, CMethod3, None] = None
+    for (i, line) in enumerate(lines[1:], 2):
+        try:
+            (kind, *values) = json.loads(line)
+            if kind == "types":
+                types = {id: ast.TypeId(id, name) for (id, name) in values[0]}
+            elif kind == "strings":
+                program.stringList = values[0]
+            elif kind == "CData3":
+                owner = CData3(decodeValue3(values[0], types), [])
+                program.cData3List.append(owner)
+            elif kind == "CMethod3":
+                owner = CMethod3(*[decodeValue3(j, types) for j in values], [], Block3([], []))
+                program.cMethod3List.append(owner)
+            elif kind == "Formal3":
+                owner.formals.append(Formal3(*[decodeValue3(j, types) for j in values]))
+            elif kind == "VarDecl3":
+                varDecls = owner.varDecls if isinstance(owner, CData3) else owner.body.varDecls
+                varDecls.append(VarDecl3(*[decodeValue3(j, types) for j in values]))
+            else:
+                stmt = STMT3_CLASSES[kind](*[decodeValue3(j, types) for j in values])
+                owner.body.stmts.append(stmt)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise IR3Exception(f"line {i}: malformed IR3 ({type(e).__name__}: {e})")
+    return program
+
+class IR3Unpickler(pickle.Unpickler):
+    # only the nodes, operands and types of IR3 are loaded, so an IR3 file cannot run other code
+    allowed = {("ir3", name) for name in ["Program3", "CData3", "CMethod3", "VarDecl3", "Formal3", "Block3", "Field"]
+        + list(STMT3_CLASSES) + list(OPERAND_CLASSES)} | {("ast", "TypeId")}
+
+    def find_class(self, module : str, name : str):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f"{module}.{name} is not part of IR3")
+        return super().find_class(module, name)
+
+def dumpIR3(program : Program3) -> bytes:
+    with paused_gc():
+        return IR3_MAGIC + pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+
+# loads either format
+def loadIR3(data : bytes) -> Program3:
+    if not data.startswith(IR3_MAGIC):
+        return loadIR3Text(data.decode("utf-8", errors="replace"))
+    try:
+        with paused_gc():
+            return IR3Unpickler(io.BytesIO(data[len(IR3_MAGIC):])).load()
+    except Exception as e:
+        raise IR3Exception(f"malformed IR3 ({type(e).__name__}: {e})")
@@ -1,8 +1,14 @@
 # Ye Guoquan, A0188947A
-from typing import Tuple
+from typing import Tuple, Iterator, Optional, Union, List, Dict
+from bisect import bisect_left, bisect_right
 from enum import Enum, auto
+from array import array
 import re
+import os
 import sys
+import mmap
+import argparse
+from diagnostics import Diagnostics
 
 
 class LexerException(Exception):
@@ -103,25 +109,261 @@ TYPE_KEYWORDS = {
 }
 
 
+# one alternative per token class, matched in place by Lexer.get_next_token
+TOKEN_PATTERN = re.compile(r'''
+      (?P<ignored>[\t\n\v\f\r ]+)
+    | (?P<comment>//[^\n]*)
+    | (?P<multicomment>/\*)
+    | (?P<name>[a-z][a-zA-Z0-9_]*)
+    | (?P<cname>[A-Z][a-zA-Z0-9_]*)
+    | (?P<digits>\d+)
+    | (?P<string>"[^"]*(?:(?<=\\)"[^"]*)*(?<!\\)")
+    | (?P<operator>==|>=|<=|!=|&&|\|\||[-+*/(){};,.=<>!])
+''', re.VERBOSE)
+
+PATTERN_TOKENS = {
+    'comment': TokenType.TOKEN_COMMENT,
+    'digits': TokenType.TOKEN_DIGITS,
+    'string': TokenType.TOKEN_STRING,
+}
+
+OPERATORS = {
+    '+': TokenType.TOKEN_PLUS,
+    '-': TokenType.TOKEN_MINUS,
+    '*': TokenType.TOKEN_TIMES,
+    '/': TokenType.TOKEN_DIVIDE,
+    '(': TokenType.TOKEN_LEFT_PARAM,
+    ')': TokenType.TOKEN_RIGHT_PARAM,
+    '{': TokenType.TOKEN_LEFT_BRACKET,
+    '}': TokenType.TOKEN_RIGHT_BRACKET,
+    ';': TokenType.TOKEN_SEMICOLON,
+    ',': TokenType.TOKEN_COMMA,
+    '.': TokenType.TOKEN_DOT,
+    '=': TokenType.TOKEN_ASSIGN,
+    '==': TokenType.TOKEN_EQUAL,
+    '>': TokenType.TOKEN_LARGER,
+    '>=': TokenType.TOKEN_LARGER_EQUAL,
+    '<': TokenType.TOKEN_SMALLER,
+    '<=': TokenType.TOKEN_SMALLER_EQUAL,
+    '&&': TokenType.TOKEN_AND,
+    '||': TokenType.TOKEN_OR,
+    '!': TokenType.TOKEN_NEGATE,
+    '!=': TokenType.TOKEN_NOT_EQUAL,
+}
+
+COMMENT_TOKENS = {TokenType.TOKEN_COMMENT, TokenType.TOKEN_MULTICOMMENT}
+
+# \r\n and \n\r count as a single line break
+NEW_LINE_PATTERN = re.compile(r'\r\n|\n\r|\r|\n')
+
+# the same tables for lexing bytes, such as a memory-mapped source file
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode(), re.VERBOSE)
+BYTES_NEW_LINE_PATTERN = re.compile(NEW_LINE_PATTERN.pattern.encode())
+BYTES_KEYWORDS = {keyword.encode(): token_type for keyword, token_type in KEYWORDS.items()}
+BYTES_TYPE_KEYWORDS = {keyword.encode(): token_type for keyword, token_type in TYPE_KEYWORDS.items()}
+BYTES_OPERATORS = {operator.encode(): token_type for operator, token_type in OPERATORS.items()}
+
+
+# identifiers and type names, interned into the SymbolTable by the lexer
+SYMBOL_TOKENS = {TokenType.TOKEN_NAME, TokenType.TOKEN_CNAME, TokenType.TOKEN_MAIN, TokenType.TOKEN_TYPE_INT,
+                 TokenType.TOKEN_TYPE_BOOL, TokenType.TOKEN_TYPE_STRING, TokenType.TOKEN_TYPE_VOID}
+
+# names the later stages refer to without a token, at fixed ids
+SYMBOL_THIS = 0
+SYMBOL_RETURN = 1
+BUILTIN_SYMBOLS = ['this', 'return']
+
+
+class SymbolTable:
+    # one canonical string and one small integer id per distinct name of a compilation
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in BUILTIN_SYMBOLS:
+            self.intern(name)
+
+    def intern(self, name: str) -> int:
+        symbol = self.ids.get(name)
+        if symbol is None:
+            symbol = len(self.names)
+            self.names.append(name)
+            self.ids[name] = symbol
+        return symbol
+
+    def name(self, symbol: int) -> str:
+        return self.names[symbol]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
 class TokenInfo:
 
-    def __init__(self, line_num: int, token_type: TokenType, value: str):
+    def __init__(self, line_num: int, token_type: TokenType, value: str, symbol: Optional[int] = None):
         self.line_num = line_num
         self.token_type = token_type
         self.value = value
+        self.symbol = symbol
+
+    def __repr__(self) -> str:
+        return str((self.line_num, self.token_type, self.value))
+
+
+# TokenType of every TokenStore kind code
+TOKEN_TYPES = {token_type.value: token_type for token_type in TokenType}
+
+
+class TokenStore:
+    # tokens of one source kept as parallel arrays instead of one object per token,
+    # the token text is only sliced from the source when it is asked for
+
+    def __init__(self, source_code: Union[str, bytes, mmap.mmap], symbols: SymbolTable):
+        self.source_code = source_code
+        self.symbols = symbols
+        self.is_text = isinstance(source_code, str)
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.symbol_ids = array('i')  # -1 for tokens that are not in SYMBOL_TOKENS
+        self.line_starts: Optional[array] = None
+
+    # a mapped source is pickled as its bytes, and the line table is rebuilt on demand
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if isinstance(self.source_code, mmap.mmap):
+            state['source_code'] = self.source_code[:]
+        state['line_starts'] = None
+        return state
+
+    def append(self, token_type: TokenType, start: int, end: int, symbol: int = -1) -> 'TokenView':
+        self.kinds.append(token_type.value)
+        self.starts.append(start)
+        self.lengths.append(end - start)
+        self.symbol_ids.append(symbol)
+        return TokenView(self, len(self.kinds) - 1)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> 'TokenView':
+        return TokenView(self, index)
+
+    def __iter__(self) -> Iterator['TokenView']:
+        for index in range(len(self.kinds)):
+            yield TokenView(self, index)
+
+    def value(self, index: int) -> str:
+        symbol = self.symbol_ids[index]
+        if symbol >= 0:
+            return self.symbols.names[symbol]
+        if self.kinds[index] == TokenType.TOKEN_EOF.value:
+            return 'EOF'
+        start = self.starts[index]
+        value = self.source_code[start:start + self.lengths[index]]
+        return value if self.is_text else value.decode('utf-8')
+
+    # sorted offsets at which the 2nd, 3rd, ... line begin, only built once a position is asked for
+    def get_line_starts(self) -> array:
+        if self.line_starts is None:
+            pattern = NEW_LINE_PATTERN if self.is_text else BYTES_NEW_LINE_PATTERN
+            self.line_starts = array('I', map(re.Match.end, pattern.finditer(self.source_code)))
+        return self.line_starts
+
+    # 1-based (line, column) of a source offset, columns count bytes for bytes sources
+    def position(self, offset: int) -> Tuple[int, int]:
+        line_starts = self.get_line_starts()
+        line = bisect_right(line_starts, offset)
+        line_start = line_starts[line - 1] if line else 0
+        return line + 1, offset - line_start + 1
+
+
+class TokenView:
+    # drop-in replacement of TokenInfo backed by a TokenStore row
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: TokenStore, index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def token_type(self) -> TokenType:
+        return TOKEN_TYPES[self.store.kinds[self.index]]
+
+    @property
+    def line_num(self) -> int:
+        return self.store.position(self.store.starts[self.index])[0]
+
+    @property
+    def column(self) -> int:
+        return self.store.position(self.store.starts[self.index])[1]
+
+    @property
+    def value(self) -> str:
+        return self.store.value(self.index)
+
+    @property
+    def symbol(self) -> Optional[int]:
+        symbol = self.store.symbol_ids[self.index]
+        return symbol if symbol >= 0 else None
 
     def __repr__(self) -> str:
         return str((self.line_num, self.token_type, self.value))
 
 
+class TokenRange:
+    # the part of the Lexer interface the Parser uses, over the rows [start, end) of an already lexed TokenStore
+
+    def __init__(self, store: TokenStore, start: int, end: int):
+        self.store = store
+        self.symbols = store.symbols
+        self.start = start
+        self.end = end
+
+    def generate_tokens(self, skip_comments: bool = True) -> Iterator[TokenView]:
+        comment_kinds = {token_type.value for token_type in COMMENT_TOKENS} if skip_comments else set()
+        for index in range(self.start, self.end):
+            if self.store.kinds[index] not in comment_kinds:
+                yield TokenView(self.store, index)
+
+
+# read-only mapping of a source file, for lexing large inputs without reading and decoding them upfront
+def map_source(source_file: str) -> Union[bytes, mmap.mmap]:
+    with open(source_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''  # empty files cannot be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 class Lexer:
 
-    def __init__(self, source_code: str):
+    # source_code may also be bytes or an mmap, the table driven engine then lexes the raw bytes
+    # and only decodes the token text that is asked for
+    # a SymbolTable is created for the compilation unless one is shared in
+    # errors are raised as LexerException, or reported to diagnostics and skipped when a sink is given
+    def __init__(self, source_code: Union[str, bytes, mmap.mmap], legacy: bool = False,
+                 symbols: Optional[SymbolTable] = None, diagnostics: Optional[Diagnostics] = None):
         self.source_code = source_code
+        self.diagnostics = diagnostics
         self.length = len(source_code)
         self.head = 0
         self.line_num = 1
         self.next_token_info = None
+        self.legacy = legacy
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.store = TokenStore(source_code, self.symbols)
+        if self.store.is_text:
+            self.token_pattern = TOKEN_PATTERN
+            self.keywords = KEYWORDS
+            self.type_keywords = TYPE_KEYWORDS
+            self.operators = OPERATORS
+        elif legacy:
+            raise LexerException('Lexer(): the legacy lexer only supports str sources')
+        else:
+            self.token_pattern = BYTES_TOKEN_PATTERN
+            self.keywords = BYTES_KEYWORDS
+            self.type_keywords = BYTES_TYPE_KEYWORDS
+            self.operators = BYTES_OPERATORS
 
     def scan_pattern(self, pattern) -> str:
         result = re.findall(pattern, self.source_code[self.head:])
@@ -140,72 +382,149 @@ class Lexer:
     def scan_cname(self) -> str:
         return self.scan_pattern(r'^[A-Z][a-zA-Z0-9_]*')
 
-    def scan_string(self) -> str:
+    # span of the string literal at head, up to the first quote that is not preceded by a backslash
+    def scan_string(self) -> Tuple[int, int]:
         pos = self.head + 1
-        result = '"'
-        while (pos != self.length):
-            result += self.source_code[pos]
-            if self.source_code[pos] == '"' and self.source_code[pos-1] != '\\':
-                return result
+        while True:
+            pos = self.source_code.find('"', pos)
+            if pos == -1:
+                raise LexerException('scan_string(): reach the end of line')
+            if self.source_code[pos-1] != '\\':
+                return (self.head, pos + 1)
             pos += 1
-        raise LexerException('scan_string(): reach the end of line')
 
     def scan_ignored(self) -> str:
         return self.scan_pattern(r'^[\t\n\v\f\r ]+')
 
-    def scan_comment(self) -> str:
-        head = self.head
-        result = ''
-        while (self.source_code[head] != '\n' and head != self.length):
-            result += self.source_code[head]
-            head += 1
-        return result
-
-    def scan_multicomment(self, head : int) -> str:
+    # span of the line comment at head, excluding the line break
+    def scan_comment(self) -> Tuple[int, int]:
+        end = self.source_code.find('\n', self.head)
+        if end == -1:
+            end = self.length
+        return (self.head, end)
+
+    # span of the comment opened at head, every nested /* needs its own */
+    def scan_multicomment(self, head : int) -> Tuple[int, int]:
+        source_code = self.source_code
+        (opener, closer) = ('/*', '*/') if self.store.is_text else (b'/*', b'*/')
+        depth = 1
         pos = head + 2
-        result = '/*'
-        while pos < self.length - 1:
-            if (self.source_code[pos:pos+2] == '/*'):
-                # comment within comment, not added as token
-                multi_comment = self.scan_multicomment(pos)
-                pos += len(multi_comment)
-                result += multi_comment
-            elif (self.source_code[pos:pos+2] == '*/'):
-                result += self.source_code[pos:pos+2]
-                return result
-            result += self.source_code[pos]
-            pos += 1
-        raise LexerException('scan_multicomment(): reach the end of file')
+        close = -1
+        while True:
+            if close < pos:
+                close = source_code.find(closer, pos)
+                if close == -1:
+                    raise LexerException('scan_multicomment(): reach the end of file')
+            # an opener sharing its '*' with the closer still comes first, as in '/*/'
+            opening = source_code.find(opener, pos, close + 1)
+            if opening != -1:
+                depth += 1
+                pos = opening + 2
+            else:
+                depth -= 1
+                pos = close + 2
+                if depth == 0:
+                    return (head, pos)
 
+    # line counting of the legacy engine, the table driven one resolves lines through TokenStore.position
     def process_new_line(self, ignored) -> None:
-        i = 0
-        while i < len(ignored):
-            if ignored[i:][:2] in ['\r\n', '\n\r']:
-                i += 2
-                self.line_num += 1
-            else:
-                if ignored[i] in ['\r', '\n']:
-                    self.line_num += 1
-                i += 1
+        if '\n' in ignored or '\r' in ignored:
+            self.line_num += len(NEW_LINE_PATTERN.findall(ignored))
 
-    def get_next_token(self) -> TokenInfo:
+    def get_next_token(self) -> TokenView:
         if self.next_token_info is not None:
             next_token_info = self.next_token_info
             self.next_token_info = None
             return next_token_info
-
+        if self.legacy:
+            token = None
+            while token is None:
+                token = self.get_next_token_legacy()
+            return token
+
+        source_code = self.source_code
+        while self.head < self.length:
+            start = self.head
+            match = self.token_pattern.match(source_code, start)
+            if match is None:
+                symbol = source_code[start:start+1]
+                if not self.store.is_text:
+                    symbol = symbol.decode('utf-8', 'replace')
+                (line, column) = self.store.position(start)
+                if symbol == '"':
+                    # the rest of the line is skipped
+                    self.error(f'scan_string(): reach the end of line {line}, column {column}', start, self.line_end(start))
+                else:
+                    self.error(f'get_next_token(): unexpected symbol {symbol} at line {line}, column {column}', start, start + 1)
+                continue
+            kind = match.lastgroup
+            end = match.end()
+            if kind == 'ignored':
+                self.head = end
+                continue
+            symbol = -1
+            if kind == 'name':
+                name = match.group()
+                token_type = self.keywords.get(name, TokenType.TOKEN_NAME)
+                if token_type is TokenType.TOKEN_NAME or token_type is TokenType.TOKEN_MAIN:
+                    symbol = self.symbols.intern(name if self.store.is_text else name.decode())
+            elif kind == 'cname':
+                cname = match.group()
+                token_type = self.type_keywords.get(cname, TokenType.TOKEN_CNAME)
+                symbol = self.symbols.intern(cname if self.store.is_text else cname.decode())
+            elif kind == 'operator':
+                token_type = self.operators[match.group()]
+            elif kind == 'multicomment':
+                # nesting cannot be expressed in the pattern, fall back to the scanner
+                try:
+                    end = self.scan_multicomment(start)[1]
+                except LexerException as e:
+                    self.error(str(e), start, self.length)
+                    end = self.length  # the comment runs to the end of the file
+                token_type = TokenType.TOKEN_MULTICOMMENT
+            else:
+                token_type = PATTERN_TOKENS[kind]
+            self.head = end
+            return self.store.append(token_type, start, end, symbol)
+        return self.store.append(TokenType.TOKEN_EOF, self.length, self.length)
+
+    # raises the error at source offset start, or reports it to the diagnostics sink and resumes lexing at resume
+    def error(self, message: str, start: int, resume: int) -> None:
+        if self.diagnostics is None:
+            raise LexerException(message)
+        self.diagnostics.report('lex', message, *self.store.position(start))
+        self.head = resume
+
+    def line_end(self, start: int) -> int:
+        end = self.source_code.find('\n' if self.store.is_text else b'\n', start)
+        return self.length if end == -1 else end
+
+    def symbol_token_info(self, token_type: TokenType, name: str) -> TokenInfo:
+        if token_type in SYMBOL_TOKENS:
+            symbol = self.symbols.intern(name)
+            return TokenInfo(self.line_num, token_type, self.symbols.name(symbol), symbol)
+        return TokenInfo(self.line_num, token_type, name)
+
+    # character-by-character engine, kept for cross-checking the token stream of the table driven one
+    # None once an error is reported to the diagnostics sink
+    def get_next_token_legacy(self) -> Optional[TokenInfo]:
         if self.head >= self.length:
             return TokenInfo(self.line_num, TokenType.TOKEN_EOF, 'EOF')
 
         next_chr = self.source_code[self.head]
         if next_chr == '/':
             if self.head + 1 < self.length and self.source_code[self.head+1] == '/':
-                comment = self.scan_comment()
-                self.head += len(comment)
-                return TokenInfo(self.line_num, TokenType.TOKEN_COMMENT, comment)
+                (start, end) = self.scan_comment()
+                self.head = end
+                return TokenInfo(self.line_num, TokenType.TOKEN_COMMENT, self.source_code[start:end])
             if self.head + 1 < self.length and self.source_code[self.head+1] == '*':
-                multi_comment = self.scan_multicomment(self.head)
-                self.head += len(multi_comment)
+                try:
+                    (start, end) = self.scan_multicomment(self.head)
+                except LexerException as e:
+                    self.error(str(e), self.head, self.length)
+                    return None
+                multi_comment = self.source_code[start:end]
+                self.head = end
                 line_num = self.line_num
                 self.process_new_line(multi_comment)
                 return TokenInfo(line_num, TokenType.TOKEN_MULTICOMMENT, multi_comment)
@@ -278,46 +597,137 @@ class Lexer:
             name = self.scan_name()
             if name in KEYWORDS:
                 self.head += len(name)
-                return TokenInfo(self.line_num, KEYWORDS[name], name)
+                return self.symbol_token_info(KEYWORDS[name], name)
             self.head += len(name)
-            return TokenInfo(self.line_num, TokenType.TOKEN_NAME, name)
+            return self.symbol_token_info(TokenType.TOKEN_NAME, name)
         if next_chr.isupper():
             cname = self.scan_cname()
             if cname in TYPE_KEYWORDS:
                 self.head += len(cname)
-                return TokenInfo(self.line_num, TYPE_KEYWORDS[cname], cname)
+                return self.symbol_token_info(TYPE_KEYWORDS[cname], cname)
             self.head += len(cname)
-            return TokenInfo(self.line_num, TokenType.TOKEN_CNAME, cname)
+            return self.symbol_token_info(TokenType.TOKEN_CNAME, cname)
         if next_chr.isnumeric():
             digits = self.scan_digits()
             self.head += len(digits)
             return TokenInfo(self.line_num, TokenType.TOKEN_DIGITS, digits)
         if next_chr == '"':
-            string = self.scan_string()
-            self.head += len(string)
-            return TokenInfo(self.line_num, TokenType.TOKEN_STRING, string)
+            try:
+                (start, end) = self.scan_string()
+            except LexerException as e:
+                self.error(str(e), self.head, self.length)
+                return None
+            self.head = end
+            return TokenInfo(self.line_num, TokenType.TOKEN_STRING, self.source_code[start:end])
         if next_chr in ['\t', '\n', '\v', '\f', '\r', ' ']:
             ignored = self.scan_ignored()
             line_num = self.line_num
             self.head += len(ignored)
             self.process_new_line(ignored)
             return self.get_next_token()
-        raise LexerException('get_next_token(): unexpected symbol {}'.format(next_chr))
-
-    def get_all_tokens(self) -> [TokenInfo]:
-        result = []
-        while True: 
-            token = self.get_next_token()
-            result.append(token)
+        (line, column) = self.store.position(self.head)
+        self.error(f'get_next_token(): unexpected symbol {next_chr} at line {line}, column {column}', self.head, self.head + 1)
+        return None
+
+    # lazily produce tokens up to and including EOF, so that lexing is interleaved with parsing
+    # tokens already in the store, such as those kept by relex, are replayed before lexing further
+    def generate_tokens(self, skip_comments: bool = True) -> Iterator[TokenView]:
+        index = 0
+        while True:
+            if index < len(self.store):
+                token = self.store[index]
+            else:
+                token = self.get_next_token()
+            index += 1
+            if skip_comments and token.token_type in COMMENT_TOKENS:
+                continue
+            yield token
             if token.token_type == TokenType.TOKEN_EOF:
-                return result
+                return
+
+    def get_all_tokens(self) -> [TokenView]:
+        return list(self.generate_tokens(skip_comments=False))
+
+    # lexer of the source with `removed` characters at `offset` replaced by `inserted`, sharing the SymbolTable
+    # only the tokens from the last boundary before the edit up to the first token that starts at a shifted
+    # old token start are lexed again, the tokens before and after are copied from this lexer's store
+    def relex(self, offset: int, removed: int, inserted: Union[str, bytes]) -> 'Lexer':
+        if self.legacy:
+            raise LexerException('relex(): the legacy lexer keeps no token store')
+        if offset < 0 or removed < 0 or offset + removed > self.length:
+            raise LexerException('relex(): edit out of range')
+        old = self.store
+        while len(old) == 0 or old.kinds[-1] != TokenType.TOKEN_EOF.value:
+            self.get_next_token()
+
+        source_code = self.source_code[:offset] + inserted + self.source_code[offset + removed:]
+        lexer = Lexer(source_code, symbols=self.symbols)
+        new = lexer.store
+        delta = len(inserted) - removed
+        edit_end = offset + len(inserted)
+
+        # a token is kept if it ends before the edit, as the character after it decided where it ends
+        keep = bisect_left(old.starts, offset)
+        if keep and old.starts[keep - 1] + old.lengths[keep - 1] >= offset:
+            keep -= 1
+        new.kinds = old.kinds[:keep]
+        new.starts = old.starts[:keep]
+        new.lengths = old.lengths[:keep]
+        new.symbol_ids = old.symbol_ids[:keep]
+        lexer.head = old.starts[keep - 1] + old.lengths[keep - 1] if keep else 0
+
+        # comments are single tokens, so an edit opening or closing a /* keeps the relexing going
+        # until the comment has been scanned to its matching */ and the token boundaries agree again
+        while True:
+            token = lexer.get_next_token()
+            start = new.starts[token.index]
+            if start >= edit_end:
+                resync = bisect_left(old.starts, start - delta)
+                if resync < len(old) and old.starts[resync] == start - delta:
+                    # the token just lexed is the old one at resync
+                    new.kinds.pop()
+                    new.starts.pop()
+                    new.lengths.pop()
+                    new.symbol_ids.pop()
+                    new.kinds.extend(old.kinds[resync:])
+                    new.lengths.extend(old.lengths[resync:])
+                    new.symbol_ids.extend(old.symbol_ids[resync:])
+                    new.starts.extend(start + delta for start in old.starts[resync:])
+                    break
+            if new.kinds[token.index] == TokenType.TOKEN_EOF.value:
+                break
+        lexer.head = lexer.length
+
+        if old.line_starts is not None:
+            new.line_starts = self.relex_line_starts(source_code, offset, removed, delta)
+        return lexer
+
+    # the line table of the edited source, line breaks are only searched again in the run of
+    # line break characters around the edit, as \r\n and \n\r pair up within such a run
+    def relex_line_starts(self, source_code: Union[str, bytes], offset: int, removed: int, delta: int) -> array:
+        line_breaks = '\r\n' if self.store.is_text else b'\r\n'
+        pattern = NEW_LINE_PATTERN if self.store.is_text else BYTES_NEW_LINE_PATTERN
+        head = offset
+        while head > 0 and self.source_code[head - 1:head] in line_breaks:
+            head -= 1
+        tail = offset + removed
+        while tail < self.length and self.source_code[tail:tail + 1] in line_breaks:
+            tail += 1
+        old_line_starts = self.store.line_starts
+        line_starts = old_line_starts[:bisect_left(old_line_starts, head)]
+        line_starts.extend(map(re.Match.end, pattern.finditer(source_code, head, tail + delta)))
+        line_starts.extend(line_start + delta for line_start in old_line_starts[bisect_right(old_line_starts, tail):])
+        return line_starts
 
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
-    source_file = sys.argv[1]
-    with open(source_file) as f:
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('input', help='input file')
+    argparser.add_argument('--legacy', help='use the character-by-character lexer', action='store_true')
+    args = argparser.parse_args()
+    with open(args.input) as f:
         source_code = f.read()
-    lex = Lexer(source_code).get_all_tokens()
+    lex = Lexer(source_code, args.legacy).get_all_tokens()
     for token in lex:
         print(token)
@@ -1,8 +1,12 @@
 # Ye Guoquan, A0188947A
+import ast
 from ir3 import *
-from typing import Dict, List, Tuple, Set
+from typing import Dict, List, Tuple, Set, Union
+from visitor import Dispatch
 
 class ProgramPoint:
+    __slots__ = ("inst", "alive")
+
     def __init__(self, inst : IR3ASTNode):
         self.inst = inst
         self.alive = set()
@@ -37,6 +41,11 @@ class BlockInfo:
 
 
 class Optimizer:
+    # type(stmt) dispatch of constant propagation, dead code elimination and liveness analysis
+    propagationHandlers = Dispatch()
+    deadHandlers = Dispatch()
+    liveHandlers = Dispatch()
+
     def __init__(self, program : Program3):
         self.program = program
 
@@ -77,100 +86,120 @@ class Optimizer:
     def isBotoom(self, str : str):
         return str == "$" 
 
-    def newAssignStmt(self, type :str, id : str, var : str, valMap : Dict[str, str]):
+    # whether an operand is the field of an object other than this
+    def isAccess(self, var : Operand) -> bool:
+        return isinstance(var, Field) and var.obj is not None
+
+    # assigns the known value of var to stmt.id, a plain TypeAssign3 is rewritten in place
+    def assignKnownValue(self, point : ProgramPoint, stmt : TypeAssign3, var : Operand, valMap : Dict[str, Operand]):
         if var in valMap and not self.isTop(valMap[var]):
-            valMap[id] = valMap[var]
-            if "." not in valMap[var]:
-                return TypeAssign3(type, id, valMap[var])
+            value = valMap[stmt.id] = valMap[var]
+            if self.isAccess(value):
+                point.inst = TypeAssignAtomAccess3(stmt.type, stmt.id, value.obj, value.field)
+            elif type(stmt) is TypeAssign3:
+                stmt.value = value
             else:
-                obj, field = valMap[var].split(".")
-                return TypeAssignAtomAccess3(type, id, obj, field)
-        return None
+                point.inst = TypeAssign3(stmt.type, stmt.id, value)
 
     def constantPropagation(self, block : BlockInfo):
         valMap = {}
         # update value map sequentially
         for i,point in enumerate(block.points):
-            stmt = point.inst
-            if isinstance(stmt, TypeAssignNew3):
-                valMap[stmt.id] = self.top()
-            elif isinstance(stmt, TypeAssignAtomAccess3):
-                rhs = stmt.obj + "." + stmt.field
-                valMap[stmt.id] = rhs
-                newStmt = self.newAssignStmt(stmt.type, stmt.id, rhs, valMap)
-                point.inst = newStmt if newStmt else point.inst
-            elif isinstance(stmt, TypeAssignCall3):
-                valMap[stmt.id] = self.top()
-            elif isinstance(stmt, TypeAssign3):
-                valMap[stmt.id] = stmt.value
-                newStmt = self.newAssignStmt(stmt.type, stmt.id, stmt.value, valMap)
-                point.inst = newStmt if newStmt else point.inst
-            elif isinstance(stmt, Assign3):
-                valMap[stmt.id] = stmt.result
-                if stmt.result in valMap and not self.isTop(valMap[stmt.result]):
-                    valMap[stmt.id] = valMap[stmt.result]
-                    point.inst = Assign3(stmt.id, valMap[stmt.result])
-            elif isinstance(stmt, BinaryOp3):
-                # replace
-                if stmt.lhs in valMap and not self.isTop(valMap[stmt.lhs]):
-                    lhs = valMap[stmt.lhs]
-                else:
-                    lhs = stmt.lhs
-
-                if stmt.rhs in valMap and not self.isTop(valMap[stmt.rhs]):
-                    rhs = valMap[stmt.rhs]
-                else:
-                    rhs = stmt.rhs
-
-                if (lhs != stmt.lhs or rhs != stmt.rhs) and "." not in lhs and "." not in rhs:
-                    point.inst = BinaryOp3(stmt.type, stmt.target, lhs, stmt.op, rhs)
-
-                # evaluate
-                if lhs.isdigit() and rhs.isdigit():
-                    if stmt.op == "+" or stmt.op == "-" or stmt.op == "*" or stmt.op == ".":
-                        op = "//" if stmt.op == "/" else stmt.op
-                        valMap[stmt.target] = str(eval(lhs + op + rhs)) # yo, have fun with command injection bypass
-                        point.inst = TypeAssign3("Int", stmt.target, valMap[stmt.target])
-                    elif stmt.op == ">" or stmt.op == ">=" or stmt.op == "==" or stmt.op == "<" or stmt.op == "<=":
-                        valMap[stmt.target] = str(eval(lhs+stmt.op+rhs)).lower()
-                        point.inst = TypeAssign3("Bool", stmt.target, valMap[stmt.target])
-                elif lhs.startswith("\"") and rhs.startswith("\""):
-                    if stmt.op == "+":
-                        valMap[stmt.target] = lhs[:-1] + rhs[1:]
-                        point.inst = TypeAssign3("String", stmt.target, valMap[stmt.target])
-                elif (lhs == "true" or lhs == "false") and (rhs == "true" or rhs == "false"):
-                    if stmt.op == "&&":
-                        lhs = lhs[0].upper() + lhs[1:]
-                        rhs = rhs[0].upper() + rhs[1:]
-                        valMap[stmt.target] = str(eval(lhs + " and " + rhs)).lower()
-                        point.inst = TypeAssign3("Bool", stmt.target, valMap[stmt.target])
-                    elif stmt.op == "||":
-                        lhs = lhs[0].upper() + lhs[1:]
-                        rhs = rhs[0].upper() + rhs[1:]
-                        valMap[stmt.target] = str(eval(lhs + " or " + rhs)).lower()
-                        point.inst = TypeAssign3("Bool", stmt.target, valMap[stmt.target])
-                    else:
-                        assert False
-            elif isinstance(stmt, Return3):
-                if stmt.id and stmt.id in valMap:
-                    point.inst = Return3(valMap[stmt.id])
-            elif isinstance(stmt, Println3):
-                if stmt.id in valMap:
-                    point.inst = Println3(valMap[stmt.id])
-            elif isinstance(stmt, Readln3):
-                if stmt.id in valMap:
-                    point.inst = Readln3(valMap[stmt.id])
-            elif isinstance(stmt, IfGoto3):
-                if stmt.cond in valMap:
-                    point.inst = IfGoto3(valMap[stmt.cond], stmt.label)
-                    if valMap[stmt.cond] == "true":
-                        point.inst = Goto3(stmt.label)
-            elif isinstance(stmt, UnaryOp3):
-                if stmt.operand in valMap:
-                    valMap[stmt.operand] = self.top() #
+            self.propagationHandlers[type(point.inst)](self, point, point.inst, valMap)
             # TODO: optimize unaryOp3 now
             # point.varMap = valMap.copy() # only needed in global constant propagation
 
+    @propagationHandlers.register(Stmt3)
+    def propagateNothing(self, point : ProgramPoint, stmt : Stmt3, valMap : Dict[str, str]):
+        pass
+
+    @propagationHandlers.register(TypeAssignNew3, TypeAssignCall3)
+    def propagateTop(self, point : ProgramPoint, stmt : TypeAssign3, valMap : Dict[str, str]):
+        valMap[stmt.id] = self.top()
+
+    @propagationHandlers.register(TypeAssignAtomAccess3)
+    def propagateTypeAssignAtomAccess(self, point : ProgramPoint, stmt : TypeAssignAtomAccess3, valMap : Dict[str, str]):
+        rhs = Field(stmt.obj, stmt.field)
+        valMap[stmt.id] = rhs
+        self.assignKnownValue(point, stmt, rhs, valMap)
+
+    @propagationHandlers.register(TypeAssign3)
+    def propagateTypeAssign(self, point : ProgramPoint, stmt : TypeAssign3, valMap : Dict[str, str]):
+        valMap[stmt.id] = stmt.value
+        self.assignKnownValue(point, stmt, stmt.value, valMap)
+
+    @propagationHandlers.register(Assign3)
+    def propagateAssign(self, point : ProgramPoint, stmt : Assign3, valMap : Dict[str, str]):
+        valMap[stmt.id] = stmt.result
+        if stmt.result in valMap and not self.isTop(valMap[stmt.result]):
+            valMap[stmt.id] = stmt.result = valMap[stmt.result]
+
+    @propagationHandlers.register(BinaryOp3)
+    def propagateBinaryOp(self, point : ProgramPoint, stmt : BinaryOp3, valMap : Dict[str, str]):
+        # replace
+        if stmt.lhs in valMap and not self.isTop(valMap[stmt.lhs]):
+            lhs = valMap[stmt.lhs]
+        else:
+            lhs = stmt.lhs
+
+        if stmt.rhs in valMap and not self.isTop(valMap[stmt.rhs]):
+            rhs = valMap[stmt.rhs]
+        else:
+            rhs = stmt.rhs
+
+        if (lhs != stmt.lhs or rhs != stmt.rhs) and not self.isAccess(lhs) and not self.isAccess(rhs):
+            (stmt.lhs, stmt.rhs) = (lhs, rhs)
+
+        # evaluate
+        if isinstance(lhs, IntConst) and isinstance(rhs, IntConst):
+            if stmt.op == "+" or stmt.op == "-" or stmt.op == "*" or stmt.op == ".":
+                op = "//" if stmt.op == "/" else stmt.op
+                valMap[stmt.target] = IntConst(eval(lhs + op + rhs)) # yo, have fun with command injection bypass
+                point.inst = TypeAssign3(ast.INT_TYPE, stmt.target, valMap[stmt.target])
+            elif stmt.op == ">" or stmt.op == ">=" or stmt.op == "==" or stmt.op == "<" or stmt.op == "<=":
+                valMap[stmt.target] = BoolConst(str(eval(lhs+stmt.op+rhs)).lower())
+                point.inst = TypeAssign3(ast.BOOL_TYPE, stmt.target, valMap[stmt.target])
+        elif isinstance(lhs, StrConst) and isinstance(rhs, StrConst):
+            if stmt.op == "+":
+                valMap[stmt.target] = StrConst(lhs[:-1] + rhs[1:])
+                point.inst = TypeAssign3(ast.STRING_TYPE, stmt.target, valMap[stmt.target])
+        elif isinstance(lhs, BoolConst) and isinstance(rhs, BoolConst):
+            if stmt.op == "&&":
+                valMap[stmt.target] = BoolConst(str(lhs.value and rhs.value).lower())
+                point.inst = TypeAssign3(ast.BOOL_TYPE, stmt.target, valMap[stmt.target])
+            elif stmt.op == "||":
+                valMap[stmt.target] = BoolConst(str(lhs.value or rhs.value).lower())
+                point.inst = TypeAssign3(ast.BOOL_TYPE, stmt.target, valMap[stmt.target])
+            else:
+                assert False
+
+    @propagationHandlers.register(Return3)
+    def propagateReturn(self, point : ProgramPoint, stmt : Return3, valMap : Dict[str, str]):
+        if stmt.id and stmt.id in valMap:
+            stmt.id = valMap[stmt.id]
+
+    @propagationHandlers.register(Println3)
+    def propagatePrintln(self, point : ProgramPoint, stmt : Println3, valMap : Dict[str, str]):
+        if stmt.id in valMap:
+            stmt.id = valMap[stmt.id]
+
+    @propagationHandlers.register(Readln3)
+    def propagateReadln(self, point : ProgramPoint, stmt : Readln3, valMap : Dict[str, str]):
+        if stmt.id in valMap:
+            stmt.id = valMap[stmt.id]
+
+    @propagationHandlers.register(IfGoto3)
+    def propagateIfGoto(self, point : ProgramPoint, stmt : IfGoto3, valMap : Dict[str, str]):
+        if stmt.cond in valMap:
+            stmt.cond = valMap[stmt.cond]
+            if isinstance(stmt.cond, BoolConst) and stmt.cond.value:
+                point.inst = Goto3(stmt.label)
+
+    @propagationHandlers.register(UnaryOp3)
+    def propagateUnaryOp(self, point : ProgramPoint, stmt : UnaryOp3, valMap : Dict[str, str]):
+        if stmt.operand in valMap:
+            valMap[stmt.operand] = self.top() #
+
 
     def deadCodeElimination(self, blocks : Dict[int, BlockInfo], symbols : Set[str]):
         self.livenessAnalysis(blocks, symbols)
@@ -183,29 +212,7 @@ class Optimizer:
                 else:
                     aliveOut = block.outAlive
 
-                if isinstance(stmt, TypeAssignNew3):
-                    if stmt.id not in aliveOut:
-                        valid[i] = False
-                elif isinstance(stmt, TypeAssignCall3):
-                    pass
-                elif isinstance(stmt, TypeAssignAtomAccess3):
-                    if stmt.id not in aliveOut:
-                        valid[i] = False
-                elif isinstance(stmt, TypeAssign3):
-                    if stmt.id not in aliveOut:
-                        valid[i] = False
-                elif isinstance(stmt, Assign3):
-                    if (stmt.id not in aliveOut) and (stmt.id in symbols):
-                        valid[i] = False
-                elif isinstance(stmt, BinaryOp3):
-                    if stmt.target not in aliveOut:
-                        valid[i] = False
-                elif isinstance(stmt, UnaryOp3):
-                    if stmt.target not in aliveOut:
-                        valid[i] = False
-                elif isinstance(stmt, IfGoto3):
-                    if stmt.cond == "false":
-                        valid[i] = False
+                valid[i] = not self.deadHandlers[type(stmt)](self, stmt, aliveOut, symbols)
 
             new_sequence = []
             for i,point in enumerate(block.points):
@@ -215,6 +222,27 @@ class Optimizer:
 
 
 
+    # whether a statement can be removed given the variables alive after it
+    @deadHandlers.register(Stmt3, TypeAssignCall3)
+    def neverDead(self, stmt : Stmt3, aliveOut : Set[str], symbols : Set[str]) -> bool:
+        return False
+
+    @deadHandlers.register(TypeAssign3)
+    def deadTypeAssign(self, stmt : TypeAssign3, aliveOut : Set[str], symbols : Set[str]) -> bool:
+        return stmt.id not in aliveOut
+
+    @deadHandlers.register(Assign3)
+    def deadAssign(self, stmt : Assign3, aliveOut : Set[str], symbols : Set[str]) -> bool:
+        return (stmt.id not in aliveOut) and (stmt.id in symbols)
+
+    @deadHandlers.register(BinaryOp3, UnaryOp3)
+    def deadOp(self, stmt : Union[BinaryOp3, UnaryOp3], aliveOut : Set[str], symbols : Set[str]) -> bool:
+        return stmt.target not in aliveOut
+
+    @deadHandlers.register(IfGoto3)
+    def deadIfGoto(self, stmt : IfGoto3, aliveOut : Set[str], symbols : Set[str]) -> bool:
+        return isinstance(stmt.cond, BoolConst) and not stmt.cond.value
+
     def livenessAnalysis(self, blocks : Dict[int, BlockInfo], symbols : Set[str]):
         update = True
         while update:
@@ -248,49 +276,71 @@ class Optimizer:
         # rule 3: if refered, then live
         die = set()
         live = set()
+        self.liveHandlers[type(stmt)](self, stmt, symbols, die, live)
+        return (die, live)
 
-        def liveAddVar(var):
-            if var in symbols: # local variable
-                live.add(var)
-            elif not (var.isdigit() or var.startswith("\"") or var == "true" or var == "false"):
-                live.add("this")
-
-        if isinstance(stmt, IfGoto3):
-            liveAddVar(stmt.cond)
-        elif isinstance(stmt, Readln3):
-            liveAddVar(stmt.id)
-        elif isinstance(stmt, Println3):
-            liveAddVar(stmt.id)
-        elif isinstance(stmt, Return3):
-            if stmt.id:
-                liveAddVar(stmt.id)
-        elif isinstance(stmt, TypeAssignAtomAccess3):
-            die.add(stmt.id)
-            liveAddVar(stmt.obj)
-        elif isinstance(stmt, TypeAssignNew3):
-            die.add(stmt.id)
-        elif isinstance(stmt, TypeAssignCall3):
+    def liveAddVar(self, var : Operand, symbols : Set[str], live : Set[str]):
+        if var in symbols: # local variable
+            live.add(var)
+        elif not isinstance(var, Const):
+            live.add("this")
+
+    @liveHandlers.register(Stmt3)
+    def liveNothing(self, stmt : Stmt3, symbols : Set[str], die : Set[str], live : Set[str]):
+        pass
+
+    @liveHandlers.register(IfGoto3)
+    def liveIfGoto(self, stmt : IfGoto3, symbols : Set[str], die : Set[str], live : Set[str]):
+        self.liveAddVar(stmt.cond, symbols, live)
+
+    @liveHandlers.register(Readln3, Println3)
+    def liveReadPrint(self, stmt : Union[Readln3, Println3], symbols : Set[str], die : Set[str], live : Set[str]):
+        self.liveAddVar(stmt.id, symbols, live)
+
+    @liveHandlers.register(Return3)
+    def liveReturn(self, stmt : Return3, symbols : Set[str], die : Set[str], live : Set[str]):
+        if stmt.id:
+            self.liveAddVar(stmt.id, symbols, live)
+
+    @liveHandlers.register(TypeAssignAtomAccess3)
+    def liveTypeAssignAtomAccess(self, stmt : TypeAssignAtomAccess3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.id)
+        self.liveAddVar(stmt.obj, symbols, live)
+
+    @liveHandlers.register(TypeAssignNew3)
+    def liveTypeAssignNew(self, stmt : TypeAssignNew3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.id)
+
+    @liveHandlers.register(TypeAssignCall3)
+    def liveTypeAssignCall(self, stmt : TypeAssignCall3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.id)
+        for arg in stmt.args:
+            self.liveAddVar(arg, symbols, live)
+
+    @liveHandlers.register(Assign3)
+    def liveAssign(self, stmt : Assign3, symbols : Set[str], die : Set[str], live : Set[str]):
+        if stmt.id in symbols:
             die.add(stmt.id)
-            for arg in stmt.args:
-                liveAddVar(arg)
-        elif isinstance(stmt, Assign3):
-            if stmt.id in symbols:
-                die.add(stmt.id)
-            else:
-                # implicit refer to global
-                live.add("this")
-            live.add(stmt.result)
-        elif isinstance(stmt, TypeAssign3):
-            die.add(stmt.id)
-            liveAddVar(stmt.value)
-        elif isinstance(stmt, BinaryOp3):
-            die.add(stmt.target)
-            liveAddVar(stmt.lhs)
-            liveAddVar(stmt.rhs)
-        elif isinstance(stmt, UnaryOp3):
-            die.add(stmt.target)
-            liveAddVar(stmt.operand)
-        return (die, live)
+        else:
+            # implicit refer to global
+            live.add("this")
+        live.add(stmt.result)
+
+    @liveHandlers.register(TypeAssign3)
+    def liveTypeAssign(self, stmt : TypeAssign3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.id)
+        self.liveAddVar(stmt.value, symbols, live)
+
+    @liveHandlers.register(BinaryOp3)
+    def liveBinaryOp(self, stmt : BinaryOp3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.target)
+        self.liveAddVar(stmt.lhs, symbols, live)
+        self.liveAddVar(stmt.rhs, symbols, live)
+
+    @liveHandlers.register(UnaryOp3)
+    def liveUnaryOp(self, stmt : UnaryOp3, symbols : Set[str], die : Set[str], live : Set[str]):
+        die.add(stmt.target)
+        self.liveAddVar(stmt.operand, symbols, live)
 
     # get all symbols of a method
     def buildSymbols(self, method : CMethod3) -> Set[str]:
@@ -1,45 +1,227 @@
 # Ye Guoquan, A0188947A
-from lex import TokenType, Lexer, TokenInfo
-from typing import List, Callable, Any, Collection
+from lex import TokenType, Lexer, TokenView, SymbolTable, TokenStore, TokenRange, LexerException, COMMENT_TOKENS
+from diagnostics import Diagnostics
+from typing import List, Callable, Any, Collection, Iterator, Optional, Deque, Tuple
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from cache import paused_gc
+import functools
+import pickle
+import io
 import ast
 import sys
 
 
 class ParseException(Exception):
-    pass
+    # line of the token the error is found at, if known
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(message)
+        self.line = line
+
+    def __reduce__(self):
+        return (ParseException, (str(self), self.line))
+
+
+# binding power of the binary operators for parse_binary, relational operators do not chain
+BINDING_POWERS = {
+    TokenType.TOKEN_OR: 1,
+    TokenType.TOKEN_AND: 2,
+    TokenType.TOKEN_SMALLER: 3,
+    TokenType.TOKEN_SMALLER_EQUAL: 3,
+    TokenType.TOKEN_LARGER: 3,
+    TokenType.TOKEN_LARGER_EQUAL: 3,
+    TokenType.TOKEN_EQUAL: 3,
+    TokenType.TOKEN_NOT_EQUAL: 3,
+    TokenType.TOKEN_PLUS: 4,
+    TokenType.TOKEN_MINUS: 4,
+    TokenType.TOKEN_TIMES: 5,
+    TokenType.TOKEN_DIVIDE: 5,
+}
+
+# which of <BExp>, <AExp> and <SExp> an expression of parse_binary belongs to, the grammar wraps
+# the atoms of <AExp> and <BExp> into a UnaryOp but not those of <SExp>
+EXP_ATOM = 0    # a lone atom, kept bare until its expression is known
+EXP_SUM = 1     # atoms joined by +, an <AExp> unless a string is added to it
+EXP_ARITH = 2
+EXP_STRING = 3
+EXP_BOOL = 4
+
+# kinds of left operand each operator continues
+OPERAND_KINDS = {
+    TokenType.TOKEN_OR: (EXP_ATOM, EXP_BOOL),
+    TokenType.TOKEN_AND: (EXP_ATOM, EXP_BOOL),
+    TokenType.TOKEN_PLUS: (EXP_ATOM, EXP_SUM, EXP_ARITH, EXP_STRING),
+    TokenType.TOKEN_MINUS: (EXP_ATOM, EXP_SUM, EXP_ARITH),
+    TokenType.TOKEN_TIMES: (EXP_ATOM, EXP_ARITH),
+    TokenType.TOKEN_DIVIDE: (EXP_ATOM, EXP_ARITH),
+}
+RELATIVE_OPERAND_KINDS = (EXP_ATOM, EXP_SUM, EXP_ARITH)
+
+# what parse_binary reads next
+READ_OPERAND = 0
+READ_ATOM = 1
+READ_POSTFIX = 2
+READ_ARGUMENT = 3
+READ_OPERATOR = 4
+
+
+class ExpressionFrame:
+    # an expression parse_binary is in the middle of. Its operand may wait on the frame of a parenthesised
+    # expression or of a call argument, the frame is resumed once that one is complete
+
+    def __init__(self, parent: Optional['ExpressionFrame']):
+        self.parent: Optional[ExpressionFrame] = parent
+        self.operands: List[Tuple[ast.Expr, int]] = []
+        self.operators: List[Tuple[int, ast.BinaryOperator]] = []
+        self.prefix: Optional[Tuple[int, Optional[ast.UnaryOperator], int]] = None  # kind, operator, repeat
+        self.atom: Optional[ast.Atom] = None
+        self.args: Optional[List[ast.Expr]] = None  # arguments read so far of the call on atom
+
+    # a literal or atom, under the prefix operators read before it
+    def push_operand(self, operand: ast.Expr) -> None:
+        if self.prefix is None:
+            self.operands.append((operand, EXP_ATOM))
+        else:
+            (kind, operator, repeat) = self.prefix
+            self.operands.append((ast.UnaryOp(operator, repeat, operand), kind))
+            self.prefix = None
+
+
+class TokenBuffer:
+    # window over the token stream, indexed by absolute token position. Tokens before the oldest
+    # position the parser may still return to are dropped, so the window only spans the lookahead
+    # and the backtracking range instead of the whole file
+
+    def __init__(self, tokens: Iterator[TokenView]):
+        self.tokens: Iterator[TokenView] = tokens
+        self.window: Deque[TokenView] = deque()
+        self.base: int = 0  # absolute position of window[0]
+        self.exhausted: bool = False
+
+    def get(self, pos: int) -> Optional[TokenView]:
+        offset = pos - self.base
+        while offset >= len(self.window):
+            if self.exhausted:
+                return None
+            token = next(self.tokens, None)
+            if token is None:
+                self.exhausted = True
+                return None
+            self.window.append(token)
+        return self.window[offset]
+
+    def discard_before(self, pos: int) -> None:
+        while self.base < pos and self.window:
+            self.window.popleft()
+            self.base += 1
+
+
+class PackratMemo:
+    # bounded table of rule results by (rule, token position), the least recently used entry is evicted first
+
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.entries: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, key: Tuple[str, int]) -> Optional[Tuple[Any, int]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple[str, int], entry: Tuple[Any, int]) -> None:
+        self.entries[key] = entry
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+
+# packrat memoization of a rule: the node and the end position, or the ParseException, of every
+# position the rule was tried at. Rules are only memoized if the parser was created with a memo
+def memoized(rule: Callable[['Parser'], ast.ASTNode]) -> Callable[['Parser'], ast.ASTNode]:
+    name = rule.__name__
+
+    @functools.wraps(rule)
+    def memoized_rule(self: 'Parser') -> ast.ASTNode:
+        if self.memo is None:
+            return rule(self)
+        key = (name, self.head)
+        entry = self.memo.get(key)
+        if entry is None:
+            self.memo.misses += 1
+            try:
+                node = rule(self)
+            except ParseException as e:
+                self.memo.put(key, (e, self.head))
+                raise
+            self.memo.put(key, (node, self.head))
+            return node
+        self.memo.hits += 1
+        (node, end) = entry
+        if isinstance(node, ParseException):
+            raise node.with_traceback(None)
+        self.head = end
+        if not self.marks:
+            self.tokens.discard_before(self.head)
+        return node
+
+    return memoized_rule
 
 
 class Parser:
 
-    def __init__(self, lexer):
-        self.tokens: List[TokenInfo] = lexer.get_all_tokens()
-        # clear comments
-        tokens: List[TokenInfo] = []
-        for token in self.tokens:
-            if not (token.token_type == TokenType.TOKEN_COMMENT or token.token_type == TokenType.TOKEN_MULTICOMMENT):
-                tokens.append(token)
-        self.tokens: List[TokenInfo] = tokens
+    # legacy parses expressions by trying every alternative through longest_of, for cross-checking
+    # packrat is the capacity of the memo table of the expression rules, 0 parses without one
+    # syntax errors are raised as ParseException, or reported to diagnostics when a sink is given
+    def __init__(self, lexer, legacy: bool = False, packrat: int = 0, diagnostics: Optional[Diagnostics] = None):
+        self.tokens: TokenBuffer = TokenBuffer(lexer.generate_tokens(skip_comments=True))
+        self.diagnostics: Optional[Diagnostics] = diagnostics
+        self.legacy: bool = legacy
+        self.memo: Optional[PackratMemo] = PackratMemo(packrat) if packrat > 0 else None
+        self.symbols: SymbolTable = lexer.symbols
         self.head: int = 0
-        self.length: int = len(self.tokens)
+        self.marks: List[int] = []  # heads that longest_of/parse_rexp may backtrack to
+
+    def mark(self) -> int:
+        self.marks.append(self.head)
+        return self.head
+
+    def release(self) -> None:
+        self.marks.pop()
+        if not self.marks:
+            self.tokens.discard_before(self.head)
 
-    def next_token_is(self, t: TokenType) -> TokenInfo:
-        if self.head != self.length and self.tokens[self.head].token_type == t:
-            token: TokenInfo = self.tokens[self.head]
+    def next_token_is(self, t: TokenType) -> TokenView:
+        token = self.tokens.get(self.head)
+        if token is not None and token.token_type == t:
             self.head += 1
+            if not self.marks:
+                self.tokens.discard_before(self.head)
             return token
+        elif token is None:
+            raise ParseException(f"next_token_is(): unexpected end of file")
         else:
-            raise ParseException(f"next_token_is(): unexpected symbol {self.tokens[self.head].value} at line {self.tokens[self.head].line_num}")
+            raise ParseException(f"next_token_is(): unexpected symbol {token.value} at line {token.line_num}", token.line_num)
 
     def peek_token_is(self, t: TokenType) -> bool:
-        if self.tokens[self.head].token_type == t:
+        token = self.tokens.get(self.head)
+        if token is not None and token.token_type == t:
             return True
         return False
 
 
     def peek_token_at_offset(self, t: int) -> TokenType:
-        if (self.head + t) >= self.length:
+        token = self.tokens.get(self.head + t)
+        if token is None:
             return None
-        return self.tokens[self.head + t].token_type
+        return token.token_type
 
     def expect_type(self) -> bool:
         return self.peek_token_is(TokenType.TOKEN_TYPE_INT) or \
@@ -54,35 +236,67 @@ class Parser:
         return token_type == TokenType.TOKEN_NAME
 
     def longest_of(self, rules: Collection[Callable[[], Any]]) -> ast.ASTNode:
-        prev_head = self.head
+        prev_head = self.mark()
         max_consumed: int = 0
         best_node: ast.ASTNode = None
         best_head: int = 0
-        for rule in rules:
-            try:
-                node = rule()
-                consumed = self.head - prev_head
-                if (consumed > max_consumed):
-                    max_consumed = consumed
-                    best_node = node
-                    best_head = self.head
-            except ParseException:
-                pass
-            finally:
-                self.head = prev_head
+        try:
+            for rule in rules:
+                try:
+                    node = rule()
+                    consumed = self.head - prev_head
+                    if (consumed > max_consumed):
+                        max_consumed = consumed
+                        best_node = node
+                        best_head = self.head
+                except ParseException:
+                    pass
+                finally:
+                    self.head = prev_head
+        finally:
+            self.release()
         if best_node is None:
             rule_names: List[str] = list(map(lambda x: x.__name__, rules))
             raise ParseException(f"No rule matched. Tried {rule_names}.")
         self.head = best_head
+        if not self.marks:
+            self.tokens.discard_before(self.head)
         return best_node
 
     # <Program> -> <MainClass> <ClassDecl>*
+    # a class with a syntax error is left out of the program when the error is reported to diagnostics
     def parse_program(self) -> ast.Program:
-        main_class = self.parse_mainClass()
+        main_class = self.parse_recovering(self.parse_mainClass)
         classes: List[ast.Class] = []
         while self.peek_token_is(TokenType.TOKEN_CLASS):
-            classes.append(self.parse_classDecl())
-        return ast.Program(main_class, classes)
+            node = self.parse_recovering(self.parse_classDecl)
+            if node is not None:
+                classes.append(node)
+        return ast.Program(main_class, classes, self.symbols)
+
+    # the class parsed by rule, or None after its syntax error is reported and the tokens up to the
+    # next class keyword are skipped, the keyword cannot occur inside a class
+    def parse_recovering(self, rule: Callable[[], ast.Class]) -> Optional[ast.Class]:
+        if self.diagnostics is None:
+            return rule()
+        start = self.head
+        try:
+            return rule()
+        except ParseException as e:
+            self.report(e)
+        if self.head == start:
+            self.head += 1
+        while self.peek_token_at_offset(0) not in [None, TokenType.TOKEN_EOF, TokenType.TOKEN_CLASS]:
+            self.head += 1
+        self.tokens.discard_before(self.head)
+        return None
+
+    def report(self, e: ParseException) -> None:
+        line = e.line
+        if line is None:
+            token = self.tokens.get(self.head)
+            line = token.line_num if token is not None else None
+        self.diagnostics.report('parse', str(e), line)
 
     # <MainClass> -> class <CNAME> {Void main ( <fmlist> ) <MdBody> }
     def parse_mainClass(self) -> ast.Class:
@@ -171,44 +385,58 @@ class Parser:
         return ast.Block(varDecls, statements)
 
     # <Stmt> -> 
+    # nested if and while bodies are kept on an explicit stack of open blocks instead of recursing
     def parse_stmt(self) -> ast.Statement:
+        # [token type, condition, statements of the open block, statements of the then branch]
+        blocks: List[list] = []
+        while True:
+            token_type = self.peek_token_at_offset(0)
+            # if ( Exp ) { <Stmt>+ } else { <Stmt>+ }
+            if token_type == TokenType.TOKEN_IF:
+                self.next_token_is(TokenType.TOKEN_IF)
+                self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
+                condition = self.parse_exp()
+                self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
+                self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
+                blocks.append([token_type, condition, [], None])
+                continue
+            # while ( <Exp> ) { <Stmt>+ }
+            elif token_type == TokenType.TOKEN_WHILE:
+                self.next_token_is(TokenType.TOKEN_WHILE)
+                self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
+                condition = self.parse_exp()
+                self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
+                self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
+                blocks.append([token_type, condition, [], None])
+                continue
+            statement = self.parse_simple_stmt()
+            # a closing bracket completes the innermost block, which may complete its parent in turn
+            while blocks:
+                block = blocks[-1]
+                block[2].append(statement)
+                if not self.peek_token_is(TokenType.TOKEN_RIGHT_BRACKET):
+                    break
+                self.next_token_is(TokenType.TOKEN_RIGHT_BRACKET)
+                if block[0] == TokenType.TOKEN_IF and block[3] is None:
+                    self.next_token_is(TokenType.TOKEN_ELSE)
+                    self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
+                    block[3] = block[2]
+                    block[2] = []
+                    break
+                blocks.pop()
+                if block[0] == TokenType.TOKEN_IF:
+                    # although specificatio does not allow variable declaration in if branch, it is a block after all
+                    statement = ast.IfThenElse(block[1], ast.Block([], block[3]), ast.Block([], block[2]))
+                else:
+                    statement = ast.While(block[1], ast.Block([], block[2]))
+            else:
+                return statement
+
+    # <Stmt> other than if and while
+    def parse_simple_stmt(self) -> ast.Statement:
         token_type = self.peek_token_at_offset(0)
-        # if ( Exp ) { <Stmt>+ } { <Stmt>+ }
-        if token_type == TokenType.TOKEN_IF:
-            self.next_token_is(TokenType.TOKEN_IF)
-            self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
-            condition = self.parse_exp()
-            self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
-            self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
-            true_stmts: List[ast.Statement] = []
-            true_stmts.append(self.parse_stmt())
-            while not self.peek_token_is(TokenType.TOKEN_RIGHT_BRACKET):
-                true_stmts.append(self.parse_stmt())
-            self.next_token_is(TokenType.TOKEN_RIGHT_BRACKET)
-            self.next_token_is(TokenType.TOKEN_ELSE)
-            self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
-            false_stmts: List[ast.Statement] = []
-            false_stmts.append(self.parse_stmt())
-            while not self.peek_token_is(TokenType.TOKEN_RIGHT_BRACKET):
-                false_stmts.append(self.parse_stmt())
-            self.next_token_is(TokenType.TOKEN_RIGHT_BRACKET)
-            # although specificatio does not allow variable declaration in if branch, it is a block after all
-            return ast.IfThenElse(condition, ast.Block([], true_stmts), ast.Block([], false_stmts))
-        # while ( <Exp> ) { <Stmt>+ }
-        elif token_type == TokenType.TOKEN_WHILE:
-            self.next_token_is(TokenType.TOKEN_WHILE)
-            self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
-            condition = self.parse_exp()
-            self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
-            self.next_token_is(TokenType.TOKEN_LEFT_BRACKET)
-            statements: List[ast.Statement] = []
-            statements.append(self.parse_stmt())
-            while not self.peek_token_is(TokenType.TOKEN_RIGHT_BRACKET):
-                statements.append(self.parse_stmt())
-            self.next_token_is(TokenType.TOKEN_RIGHT_BRACKET)
-            return ast.While(condition, ast.Block([], statements))
         # readln ( id ) ;
-        elif token_type == TokenType.TOKEN_READLN:
+        if token_type == TokenType.TOKEN_READLN:
             self.next_token_is(TokenType.TOKEN_READLN)
             self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
             identifier = self.parse_id()
@@ -252,10 +480,166 @@ class Parser:
             # else error needed?
 
     # <Exp> -> <BExp> | <AExp> | <SExp>
+    @memoized
     def parse_exp(self) -> ast.Expr:
-        return self.longest_of([self.parse_boolExp, self.parse_arithExp, self.parse_stringExp])
+        if self.legacy:
+            return self.longest_of([self.parse_boolExp, self.parse_arithExp, self.parse_stringExp])
+        return self.parse_binary()
+
+    # precedence climbing over all three expression grammars at once, building the trees longest_of picks.
+    # Pending operators wait on the operator stack of the frame and every parenthesised expression or call
+    # argument is read in a frame of its own, so neither nesting nor operator chains recurse
+    def parse_binary(self) -> ast.Expr:
+        frame = ExpressionFrame(None)
+        state = READ_OPERAND
+        while True:
+            if state == READ_OPERAND:
+                token_type = self.peek_token_at_offset(0)
+                # <BGrd> -> !<BGrd> | true | false | <Atom>
+                if token_type == TokenType.TOKEN_NEGATE or token_type == TokenType.TOKEN_TRUE or \
+                        token_type == TokenType.TOKEN_FALSE:
+                    frame.prefix = self.parse_prefix(TokenType.TOKEN_NEGATE, EXP_BOOL)
+                    if self.peek_token_is(TokenType.TOKEN_TRUE):
+                        frame.push_operand(ast.Boolean(self.next_token_is(TokenType.TOKEN_TRUE)))
+                        state = READ_OPERATOR
+                    elif self.peek_token_is(TokenType.TOKEN_FALSE):
+                        frame.push_operand(ast.Boolean(self.next_token_is(TokenType.TOKEN_FALSE)))
+                        state = READ_OPERATOR
+                    else:
+                        state = READ_ATOM
+                # <Ftr> -> DIGITS | -<Ftr> | <Atom>
+                elif token_type == TokenType.TOKEN_MINUS or token_type == TokenType.TOKEN_DIGITS:
+                    frame.prefix = self.parse_prefix(TokenType.TOKEN_MINUS, EXP_ARITH)
+                    if self.peek_token_is(TokenType.TOKEN_DIGITS):
+                        frame.push_operand(ast.Integer(self.next_token_is(TokenType.TOKEN_DIGITS)))
+                        state = READ_OPERATOR
+                    else:
+                        state = READ_ATOM
+                elif token_type == TokenType.TOKEN_STRING:
+                    frame.operands.append((ast.String(self.next_token_is(TokenType.TOKEN_STRING)), EXP_STRING))
+                    state = READ_OPERATOR
+                else:
+                    state = READ_ATOM
+            elif state == READ_ATOM:
+                # ( <Exp> )
+                if self.peek_token_is(TokenType.TOKEN_LEFT_PARAM):
+                    self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
+                    frame = ExpressionFrame(frame)
+                    state = READ_OPERAND
+                else:
+                    frame.atom = self.parse_primary()
+                    state = READ_POSTFIX
+            elif state == READ_POSTFIX:
+                # <Atom> . <id>
+                if self.peek_token_is(TokenType.TOKEN_DOT):
+                    self.next_token_is(TokenType.TOKEN_DOT)
+                    frame.atom = ast.AtomAccess(frame.atom, self.parse_id())
+                # <Atom> ( <ExpList> )
+                elif self.peek_token_is(TokenType.TOKEN_LEFT_PARAM):
+                    self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
+                    frame.args = []
+                    state = READ_ARGUMENT
+                else:
+                    frame.push_operand(frame.atom)
+                    frame.atom = None
+                    state = READ_OPERATOR
+            elif state == READ_ARGUMENT:
+                if self.peek_token_is(TokenType.TOKEN_RIGHT_PARAM):
+                    self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
+                    frame.atom = ast.AtomCall(frame.atom, frame.args)
+                    frame.args = None
+                    state = READ_POSTFIX
+                else:
+                    frame = ExpressionFrame(frame)
+                    state = READ_OPERAND
+            else:
+                token_type = self.peek_token_at_offset(0)
+                power = BINDING_POWERS.get(token_type)
+                if power is not None:
+                    self.reduce(frame, power)
+                    relative = token_type not in OPERAND_KINDS
+                    # as with the longest match, an operator that cannot continue the expression ends it
+                    if frame.operands[-1][1] in (RELATIVE_OPERAND_KINDS if relative else OPERAND_KINDS[token_type]):
+                        if relative:
+                            operator = self.parse_BOp()
+                        else:
+                            operator = ast.BinaryOperator(self.next_token_is(token_type))
+                        frame.operators.append((power, operator))
+                        state = READ_OPERAND
+                        continue
+                self.reduce(frame, 0)
+                expr = self.wrap_operand(*frame.operands.pop())
+                frame = frame.parent
+                if frame is None:
+                    return expr
+                if frame.args is None:
+                    self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
+                    frame.atom = ast.AtomExpr(expr)
+                    state = READ_POSTFIX
+                else:
+                    frame.args.append(expr)
+                    if self.peek_token_is(TokenType.TOKEN_COMMA):
+                        self.next_token_is(TokenType.TOKEN_COMMA)
+                    state = READ_ARGUMENT
+
+    # the operator of a run of prefix operators and its length
+    def parse_prefix(self, token_type: TokenType, kind: int) -> Tuple[int, Optional[ast.UnaryOperator], int]:
+        operator: ast.UnaryOperator = None
+        repeat = 0
+        while self.peek_token_is(token_type):
+            operator = ast.UnaryOperator(self.next_token_is(token_type))
+            repeat += 1
+        return (kind, operator, repeat)
+
+    # applies the pending operators that bind at least as tightly as min_power
+    def reduce(self, frame: 'ExpressionFrame', min_power: int) -> None:
+        while frame.operators and frame.operators[-1][0] >= min_power:
+            operator = frame.operators.pop()[1]
+            (rhs, rhs_kind) = frame.operands.pop()
+            (lhs, kind) = frame.operands.pop()
+            frame.operands.append(self.combine(lhs, kind, operator, rhs, rhs_kind))
+
+    def combine(self, lhs: ast.Expr, kind: int, operator: ast.BinaryOperator, rhs: ast.Expr,
+                rhs_kind: int) -> Tuple[ast.Expr, int]:
+        token_type = operator.operator.token_type
+        if token_type == TokenType.TOKEN_OR or token_type == TokenType.TOKEN_AND:
+            if rhs_kind not in (EXP_ATOM, EXP_BOOL):
+                raise ParseException(f"combine(): expected a boolean operand at line {operator.operator.line_num}",
+                                     operator.operator.line_num)
+            return (ast.BinaryOp(self.wrap_operand(lhs, kind), operator, self.wrap_operand(rhs, rhs_kind)), EXP_BOOL)
+        if isinstance(operator, ast.RelativeOperator):
+            if rhs_kind not in RELATIVE_OPERAND_KINDS:
+                raise ParseException(f"combine(): expected an arithmetic operand at line {operator.operator.line_num}",
+                                     operator.operator.line_num)
+            return (ast.BinaryOp(self.wrap_operand(lhs, kind), operator, self.wrap_operand(rhs, rhs_kind)), EXP_BOOL)
+        if token_type == TokenType.TOKEN_PLUS and (kind == EXP_STRING or rhs_kind == EXP_STRING):
+            if kind not in (EXP_ATOM, EXP_SUM, EXP_STRING) or rhs_kind not in (EXP_ATOM, EXP_STRING):
+                raise ParseException(f"combine(): expected a string operand at line {operator.operator.line_num}",
+                                     operator.operator.line_num)
+            return (ast.BinaryOp(lhs, operator, rhs), EXP_STRING)
+        if token_type == TokenType.TOKEN_PLUS and kind != EXP_ARITH and rhs_kind == EXP_ATOM:
+            return (ast.BinaryOp(lhs, operator, rhs), EXP_SUM)
+        if rhs_kind not in (EXP_ATOM, EXP_ARITH):
+            raise ParseException(f"combine(): expected an arithmetic operand at line {operator.operator.line_num}",
+                                     operator.operator.line_num)
+        return (ast.BinaryOp(self.wrap_operand(lhs, kind), operator, self.wrap_operand(rhs, rhs_kind)), EXP_ARITH)
+
+    # the atoms of an <AExp> or <BExp> are operands of a UnaryOp without operator
+    def wrap_operand(self, node: ast.Expr, kind: int) -> ast.Expr:
+        if kind == EXP_ATOM:
+            return ast.UnaryOp(None, 0, node)
+        if kind == EXP_SUM:
+            # a left-deep chain of bare atoms, wrapped in place without recursing down the chain
+            sum_node = node
+            while isinstance(sum_node.left_operand, ast.BinaryOp):
+                sum_node.right_operand = ast.UnaryOp(None, 0, sum_node.right_operand)
+                sum_node = sum_node.left_operand
+            sum_node.right_operand = ast.UnaryOp(None, 0, sum_node.right_operand)
+            sum_node.left_operand = ast.UnaryOp(None, 0, sum_node.left_operand)
+        return node
 
     # <AExp> -> <AExp> + <Term> | <AExp> - <Term> | <Term>
+    @memoized
     def parse_arithExp(self) -> ast.Expr:
         arithExp = self.parse_term()
         while self.peek_token_is(TokenType.TOKEN_PLUS) or self.peek_token_is(TokenType.TOKEN_MINUS):
@@ -294,6 +678,7 @@ class Parser:
             return ast.UnaryOp(operator, negative, atom)
 
     # <SExp> + <SExp> | STRING_LITERAL | <Atom>
+    @memoized
     def parse_stringExp(self) -> ast.Expr:
         stringExp: ast.Expr
         if self.peek_token_is(TokenType.TOKEN_STRING):
@@ -310,6 +695,7 @@ class Parser:
         return stringExp
 
     # <BExp> -> <BExp> || <Conj> | <Conj>
+    @memoized
     def parse_boolExp(self) -> ast.Expr:
         boolExp = self.parse_conj()
         while self.peek_token_is(TokenType.TOKEN_OR):
@@ -328,8 +714,9 @@ class Parser:
         return conj
 
     # <RExp> -> <AExp> <BOp> <AExp> | <BGrd>
+    @memoized
     def parse_rexp(self) -> ast.Expr:
-        save_head = self.head
+        save_head = self.mark()
         try:
             lhs_exp = self.parse_arithExp()
             op = self.parse_BOp()
@@ -337,7 +724,9 @@ class Parser:
             return ast.BinaryOp(lhs_exp, op, rhs_exp)
         except:
             self.head = save_head
-            return self.parse_BGrd()
+        finally:
+            self.release()
+        return self.parse_BGrd()
 
     # <BGrd> -> !<BGrd> | true | false | <Atom>
     def parse_BGrd(self) -> ast.UnaryOp:
@@ -371,34 +760,17 @@ class Parser:
             return ast.RelativeOperator(self.next_token_is(TokenType.TOKEN_NOT_EQUAL))
 
     # <Atom> ->
+    @memoized
     def parse_atom(self) -> ast.Atom:
-        token_type = self.peek_token_at_offset(0)
         atom: ast.Atom
-        # this
-        if token_type == TokenType.TOKEN_THIS:
-            # Note: the specification allows sth like "this(explist)" but in real language should not allow
-            self.next_token_is(TokenType.TOKEN_THIS)
-            atom = ast.This()
-        # new <cname> ()
-        elif token_type == TokenType.TOKEN_NEW:
-            self.next_token_is(TokenType.TOKEN_NEW)
-            cname = self.next_token_is(TokenType.TOKEN_CNAME)
-            self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
-            self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
-            atom = ast.NewClass(cname)
         # ( <Exp> )
-        elif token_type == TokenType.TOKEN_LEFT_PARAM:
+        if self.peek_token_is(TokenType.TOKEN_LEFT_PARAM):
             self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
             expr = self.parse_exp()
             self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
             atom = ast.AtomExpr(expr)
-        # null
-        elif token_type == TokenType.TOKEN_NULL:
-            self.next_token_is(TokenType.TOKEN_NULL)
-            atom = ast.Null()
-        # id
         else:
-            atom = self.parse_id()
+            atom = self.parse_primary()
         while self.peek_token_is(TokenType.TOKEN_DOT) or self.peek_token_is(TokenType.TOKEN_LEFT_PARAM):
             # <Atom> . <id>
             if self.peek_token_is(TokenType.TOKEN_DOT):
@@ -417,19 +789,158 @@ class Parser:
                 atom = ast.AtomCall(atom, exprList)
         return atom
 
+    # this | new <cname> () | null | id
+    def parse_primary(self) -> ast.Atom:
+        token_type = self.peek_token_at_offset(0)
+        # this
+        if token_type == TokenType.TOKEN_THIS:
+            # Note: the specification allows sth like "this(explist)" but in real language should not allow
+            self.next_token_is(TokenType.TOKEN_THIS)
+            return ast.This()
+        # new <cname> ()
+        elif token_type == TokenType.TOKEN_NEW:
+            self.next_token_is(TokenType.TOKEN_NEW)
+            cname = self.next_token_is(TokenType.TOKEN_CNAME)
+            self.next_token_is(TokenType.TOKEN_LEFT_PARAM)
+            self.next_token_is(TokenType.TOKEN_RIGHT_PARAM)
+            return ast.NewClass(cname)
+        # null
+        elif token_type == TokenType.TOKEN_NULL:
+            self.next_token_is(TokenType.TOKEN_NULL)
+            return ast.Null()
+        # id
+        else:
+            return self.parse_id()
+
     def parse_id(self) -> ast.Identifier:
         if (self.peek_token_is(TokenType.TOKEN_MAIN)):
             return ast.Identifier(self.next_token_is(TokenType.TOKEN_MAIN))
         return ast.Identifier(self.next_token_is(TokenType.TOKEN_NAME))
 
     def parse(self) -> ast.ASTNode:
-        self.head = 0
         out = self.parse_program()
-        if self.head < self.length - 2:
-            raise ParseException("Unable to consume all tokens")
+        # at most one stray token is tolerated before EOF
+        if self.peek_token_at_offset(1) not in [None, TokenType.TOKEN_EOF]:
+            e = ParseException("Unable to consume all tokens")
+            if self.diagnostics is None:
+                raise e
+            self.report(e)
         return out
 
 
+# top level classes of a lexed source as [start, end) rows of its TokenStore, from the class keyword to the
+# matching closing brace. None unless the source is such classes up to EOF, the sequential parser reports why
+def class_boundaries(store: TokenStore) -> Optional[List[Tuple[int, int]]]:
+    comment_kinds = {token_type.value for token_type in COMMENT_TOKENS}
+    (class_kind, eof_kind) = (TokenType.TOKEN_CLASS.value, TokenType.TOKEN_EOF.value)
+    (left_kind, right_kind) = (TokenType.TOKEN_LEFT_BRACKET.value, TokenType.TOKEN_RIGHT_BRACKET.value)
+    boundaries: List[Tuple[int, int]] = []
+    start: Optional[int] = None
+    depth = 0
+    for (index, kind) in enumerate(store.kinds):
+        if kind in comment_kinds:
+            continue
+        if start is None:
+            if kind == eof_kind:
+                return boundaries
+            if kind != class_kind:
+                return None
+            start = index
+        elif kind == left_kind:
+            depth += 1
+        elif kind == right_kind:
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                boundaries.append((start, index + 1))
+                start = None
+    return None
+
+
+class StorePickler(pickle.Pickler):
+    # the nodes of a class parsed by a worker, the TokenStore their tokens refer to is held by both
+    # processes, so a token is only pickled as its row
+
+    def __init__(self, file, store: TokenStore):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.store = store
+
+    def persistent_id(self, obj: Any) -> Optional[int]:
+        if type(obj) is TokenView and obj.store is self.store:
+            return obj.index
+        return None
+
+
+class StoreUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, store: TokenStore):
+        super().__init__(file)
+        self.store = store
+
+    def persistent_load(self, pid: int) -> TokenView:
+        return TokenView(self.store, pid)
+
+
+# TokenStore and Parser options of a parse_parallel worker process, set once by its initializer
+worker_args: Tuple[TokenStore, bool, int] = None
+
+
+def init_worker(store: TokenStore, legacy: bool, packrat: int) -> None:
+    global worker_args
+    worker_args = (store, legacy, packrat)
+
+
+# the pickled class, or the ParseException it raises for the main process to raise or report in source order
+def parse_class(boundary: Tuple[int, int]) -> Any:
+    (store, legacy, packrat) = worker_args
+    try:
+        node = Parser(TokenRange(store, *boundary), legacy, packrat).parse_classDecl()
+    except ParseException as e:
+        return e
+    data = io.BytesIO()
+    with paused_gc():
+        StorePickler(data, store).dump(node)
+    return data.getvalue()
+
+
+# parse() with the classes after the main class parsed in `jobs` worker processes and put back in source order.
+# The whole source is lexed first and the workers parse rows of its TokenStore, so tokens, symbols and
+# the line numbers of nodes and errors are those of a sequential parse
+def parse_parallel(lexer: Lexer, jobs: int, legacy: bool = False, packrat: int = 0,
+                   diagnostics: Optional[Diagnostics] = None) -> ast.Program:
+    # the source is lexed up front, the errors found are put in source order as a serial parse reports them
+    start = len(diagnostics) if diagnostics is not None else 0
+    boundaries = None
+    if not lexer.legacy:
+        try:
+            lexer.get_all_tokens()
+            boundaries = class_boundaries(lexer.store)
+        except LexerException:
+            pass  # the parser reports the parse errors before it, then replays the stored tokens up to it
+    if not boundaries:
+        program = Parser(lexer, legacy, packrat, diagnostics).parse()
+    else:
+        store = lexer.store
+        chunksize = max(1, len(boundaries) // (jobs * 4))
+        with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(store, legacy, packrat)) as executor:
+            results = executor.map(parse_class, boundaries[1:], chunksize=chunksize)
+            main_parser = Parser(TokenRange(store, *boundaries[0]), legacy, packrat, diagnostics)
+            main_class = main_parser.parse_recovering(main_parser.parse_mainClass)
+            classes = []
+            with paused_gc():
+                for data in results:
+                    if isinstance(data, ParseException):
+                        if diagnostics is None:
+                            raise data
+                        diagnostics.report('parse', str(data), data.line)
+                    else:
+                        classes.append(StoreUnpickler(io.BytesIO(data), store).load())
+        program = ast.Program(main_class, classes, lexer.symbols)
+    if diagnostics is not None:
+        diagnostics.sort(start)
+    return program
+
 if __name__ == '__main__':
     source_file = sys.argv[1]
     with open(source_file) as f:
@@ -0,0 +1,169 @@
+   .data
+LC0:
+   .asciz    "%d\n"
+LC1:
+   .asciz    "%s\n"
+LC2:
+   .asciz    "%d"
+LC3:
+   .asciz    "\0\0\0\0"
+
+   .text
+   .global   main
+   .type   main, %function
+
+main:
+Main_main_:
+   stmfd   sp!,{fp,lr,v1,v2,v3,v4,v5}
+   mov   fp, sp
+   sub   sp, sp, #132
+   mov   v2, a1
+   mov   a1, #3
+   mov   v2, a1
+   mov   a1, v2
+   mov   v3, a1
+   mov   a1, #2
+   mov   v7, a1
+   mov   a1, #4
+   mov   v6, a1
+   mov   a1, v3
+   mov   v2, a1
+   mov   a1, v2
+   mov   a3, v6
+   mul   a4, a1, a3
+   mov   v2, a4
+   mov   a1, v2
+   mov   a3, v7
+   add   a4, a1, a3
+   mov   v2, a4
+   mov   a1, v2
+   mov   v6, a1
+   mov   a1, v3
+   mov   v7, a1
+   mov   a1, v6
+   mov   v2, a1
+   mov   a1, v2
+   mov   a3, v7
+   sub   a4, a1, a3
+   cmp   a4, #0
+   movlt   a4, #0
+   mov   v2, a4
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, #4
+   bl   malloc
+   mov   v7, a1
+   mov   a1, v7
+   mov   v7, a1
+   mov   a1, v7
+   mov   v7, a1
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   cmp   a1, #0
+   bgt   .L0
+   b   .L1
+.L0:
+   mov   a1, v6
+   mov   v2, a1
+   mov   a1, v7
+   mov   a2, v2
+   stmfd   sp!,{v6, v7}
+   bl   Calc_sq_Int
+   ldmfd   sp!,{v6, v7}
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   mov   v6, a1
+   b   .L2
+.L1:
+   mov   a1, #1
+   mov   v2, a1
+   mov   a1, v2
+   mov   v6, a1
+.L2:
+   mov   a1, v6
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   stmfd   sp!,{v6, v7}
+   mov   a2, v2
+   ldr   a1, =LC0 + 0
+   bl   printf
+   ldmfd   sp!,{v6, v7}
+.L4:
+   mov   a1, #0
+   mov   v7, a1
+   mov   a1, v6
+   mov   v2, a1
+   mov   a1, v2
+   mov   a3, v7
+   sub   a4, a1, a3
+   cmp   a4, #0
+   movlt   a4, #0
+   mov   v2, a4
+   mov   a1, v2
+   cmp   a1, #0
+   bgt   .L3
+   b   .L5
+.L3:
+   mov   a1, #1
+   mov   v2, a1
+   mov   a1, v6
+   mov   v6, a1
+   mov   a1, v6
+   mov   a3, v2
+   sub   a4, a1, a3
+   mov   v2, a4
+   mov   a1, v2
+   mov   v6, a1
+   mov   a1, v6
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   stmfd   sp!,{v6, v7}
+   mov   a2, v2
+   ldr   a1, =LC0 + 0
+   bl   printf
+   ldmfd   sp!,{v6, v7}
+   b   .L4
+.L5:
+   mov   a1, v3
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   stmfd   sp!,{v6, v7}
+   mov   a2, v2
+   ldr   a1, =LC0 + 0
+   bl   printf
+   ldmfd   sp!,{v6, v7}
+   b   Main_main__exit
+Main_main__exit:
+   mov   sp, fp
+   ldmfd   sp!,{fp,pc,v1,v2,v3,v4,v5}
+Calc_sq_Int:
+   stmfd   sp!,{fp,lr,v1,v2,v3,v4,v5}
+   mov   fp, sp
+   sub   sp, sp, #32
+   mov   v2, a1
+   mov   v2, a2
+   mov   a1, v2
+   mov   v3, a1
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   mov   a3, v3
+   mul   a4, a1, a3
+   mov   v2, a4
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   mov   v2, a1
+   mov   a1, v2
+   b   Calc_sq_Int_exit
+Calc_sq_Int_exit:
+   mov   sp, fp
+   ldmfd   sp!,{fp,pc,v1,v2,v3,v4,v5}
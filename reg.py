@@ -1,9 +1,12 @@
 # Ye Guoquan, A0188947A
 from ir3 import *
-from typing import List, Set, Dict, Tuple
+from typing import List, Set, Dict, Tuple, Union
+from visitor import Dispatch
 
 
 class ProgramPoint:
+	__slots__ = ("inst", "alive")
+
 	def __init__(self, inst : Stmt3):
 		self.inst = inst
 		self.alive = set()
@@ -37,6 +40,9 @@ class BlockInfo:
 
 
 class RegisterAllocator:
+	# type(stmt) dispatch of liveness analysis
+	liveHandlers = Dispatch()
+
 	def __init__(self, method : CMethod3):
 		self.method = method
 		self.vars : Set[str] = set()
@@ -81,29 +87,30 @@ class RegisterAllocator:
 				self.points.append(ProgramPoint(stmt))
 				i += 1
 
+	def block(self, num : int) -> BlockInfo:
+		if num not in self.blocks:
+			self.blocks[num] = BlockInfo()
+		return self.blocks[num]
+
+	# a block starts at every label and after every jump, and falls through to the next block unless it
+	# ends with a goto
 	def buildCFG(self):
+		targets = set(self.labels.values())
 		cur = 0
 		for i, point in enumerate(self.points):
-			if i in self.labels.values():
-				self.blocks[cur].addOut(i)
+			if i in targets and i != cur:
+				self.block(cur).addOut(i)
+				self.block(i).addIn(cur)
 				cur = i
-				if cur not in self.blocks:
-					self.blocks[cur] = BlockInfo()
-				self.blocks[cur].addPoint(point)
-			elif point.branch():
-				if cur not in self.blocks:
-					self.blocks[cur] = BlockInfo()
-				self.blocks[cur].addPoint(point)
+			self.block(cur).addPoint(point)
+			if point.branch():
 				dest = self.labels[point.branch()]
-				self.blocks[cur].addOut(dest)
-				if dest not in self.blocks:
-					self.blocks[dest] = BlockInfo()
-				self.blocks[dest].addIn(cur)
+				self.block(cur).addOut(dest)
+				self.block(dest).addIn(cur)
+				if isinstance(point.inst, IfGoto3):
+					self.block(cur).addOut(i + 1)
+					self.block(i + 1).addIn(cur)
 				cur = i + 1
-			else:
-				if cur not in self.blocks:
-					self.blocks[cur] = BlockInfo()
-				self.blocks[cur].addPoint(point)
 
 
 	def livenessAnalysis(self):
@@ -138,59 +145,79 @@ class RegisterAllocator:
 		# rule 3: if refered, then live
 		die = set()
 		live = set()
+		self.liveHandlers[type(stmt)](self, stmt, die, live)
+		return (die, live)
 
-		def liveAddVar(var):
-			if var in self.vars: # local variable
-				live.add(var)
-			elif not (var.isdigit() or var.startswith("\"") or var == "true" or var == "false"):
-				live.add("this")
-
-		if isinstance(stmt, IfGoto3):
-			liveAddVar(stmt.cond)
-		elif isinstance(stmt, Readln3):
-			liveAddVar(stmt.id)
-		elif isinstance(stmt, Println3):
-			liveAddVar(stmt.id)
-		elif isinstance(stmt, Return3):
-			if stmt.id:
-				liveAddVar(stmt.id)
-		elif isinstance(stmt, TypeAssignAtomAccess3):
-			die.add(stmt.id)
-			liveAddVar(stmt.obj)
-		elif isinstance(stmt, TypeAssignNew3):
-			die.add(stmt.id)
-		elif isinstance(stmt, TypeAssignCall3):
+	def liveAddVar(self, var : Operand, live : Set[str]):
+		if var in self.vars: # local variable
+			live.add(var)
+		elif not isinstance(var, Const):
+			live.add("this")
+
+	@liveHandlers.register(Stmt3)
+	def liveNothing(self, stmt : Stmt3, die : Set[str], live : Set[str]):
+		pass
+
+	@liveHandlers.register(IfGoto3)
+	def liveIfGoto(self, stmt : IfGoto3, die : Set[str], live : Set[str]):
+		self.liveAddVar(stmt.cond, live)
+
+	@liveHandlers.register(Readln3, Println3)
+	def liveReadPrint(self, stmt : Union[Readln3, Println3], die : Set[str], live : Set[str]):
+		self.liveAddVar(stmt.id, live)
+
+	@liveHandlers.register(Return3)
+	def liveReturn(self, stmt : Return3, die : Set[str], live : Set[str]):
+		if stmt.id:
+			self.liveAddVar(stmt.id, live)
+
+	@liveHandlers.register(TypeAssignAtomAccess3)
+	def liveTypeAssignAtomAccess(self, stmt : TypeAssignAtomAccess3, die : Set[str], live : Set[str]):
+		die.add(stmt.id)
+		self.liveAddVar(stmt.obj, live)
+
+	@liveHandlers.register(TypeAssignNew3)
+	def liveTypeAssignNew(self, stmt : TypeAssignNew3, die : Set[str], live : Set[str]):
+		die.add(stmt.id)
+
+	@liveHandlers.register(TypeAssignCall3)
+	def liveTypeAssignCall(self, stmt : TypeAssignCall3, die : Set[str], live : Set[str]):
+		die.add(stmt.id)
+		for arg in stmt.args:
+			self.liveAddVar(arg, live)
+
+	@liveHandlers.register(Assign3)
+	def liveAssign(self, stmt : Assign3, die : Set[str], live : Set[str]):
+		if isinstance(stmt.id, Field) and stmt.id.obj is not None:
+			# atom access
+			self.liveAddVar(stmt.id.obj, live)
+		elif stmt.id in self.vars:
 			die.add(stmt.id)
-			for arg in stmt.args:
-				liveAddVar(arg)
-		elif isinstance(stmt, Assign3):
-			if "." in stmt.id:
-				# atom access
-				obj = stmt.id.split(".")[0]
-				liveAddVar(obj)
-			elif stmt.id in self.vars:
-				die.add(stmt.id)
-			else:
-				# implicit refer to global
-				live.add("this")
-
-			if "." in stmt.result:
-				# atom access
-				obj = stmt.result.split(".")[0]
-				liveAddVar(stmt.obj)
-			elif stmt.result in self.vars:
-				live.add(stmt.result)
-		elif isinstance(stmt, TypeAssign3):
-			die.add(stmt.id)
-			liveAddVar(stmt.value)
-		elif isinstance(stmt, BinaryOp3):
-			die.add(stmt.target)
-			liveAddVar(stmt.lhs)
-			liveAddVar(stmt.rhs)
-		elif isinstance(stmt, UnaryOp3):
-			die.add(stmt.target)
-			liveAddVar(stmt.operand)
-		return (die, live)
+		else:
+			# implicit refer to global
+			live.add("this")
+
+		if isinstance(stmt.result, Field) and stmt.result.obj is not None:
+			# atom access
+			self.liveAddVar(stmt.result.obj, live)
+		elif stmt.result in self.vars:
+			live.add(stmt.result)
+
+	@liveHandlers.register(TypeAssign3)
+	def liveTypeAssign(self, stmt : TypeAssign3, die : Set[str], live : Set[str]):
+		die.add(stmt.id)
+		self.liveAddVar(stmt.value, live)
+
+	@liveHandlers.register(BinaryOp3)
+	def liveBinaryOp(self, stmt : BinaryOp3, die : Set[str], live : Set[str]):
+		die.add(stmt.target)
+		self.liveAddVar(stmt.lhs, live)
+		self.liveAddVar(stmt.rhs, live)
+
+	@liveHandlers.register(UnaryOp3)
+	def liveUnaryOp(self, stmt : UnaryOp3, die : Set[str], live : Set[str]):
+		die.add(stmt.target)
+		self.liveAddVar(stmt.operand, live)
 
 
 	def buildInference(self):
@@ -198,9 +225,15 @@ class RegisterAllocator:
 			self.inference[arg] = set()
 
 		for block in self.blocks.values():
-			for point in block.points:
+			for i, point in enumerate(block.points):
 				for var in list(point.alive):
 					self.inference[var] |= (point.alive - {var})
+				# an assigned variable interferes with what lives after it, even if it is never read
+				after = block.points[i+1].alive if i + 1 < len(block.points) else block.outAlive
+				for var in self.liveChange(point.inst)[0]:
+					for other in after - {var}:
+						self.inference[var].add(other)
+						self.inference[other].add(var)
 			for var in block.outAlive:
 				self.inference[var] |= (block.outAlive - {var})
 
@@ -0,0 +1,604 @@
+# Ye Guoquan, A0188947A
+import operator
+import ast
+from ir3 import *
+from typing import Dict, List, Tuple, Set, Optional, Callable
+
+
+# lattice of sparse conditional constant propagation, a variable is TOP until a definition of it is
+# reached, then a constant operand, then BOTTOM once it may hold more than one value
+TOP = "#"
+BOTTOM = "$"
+
+# the fields of a statement whose operands it reads
+USE_FIELDS : Dict[type, Tuple[str, ...]] = {
+    Label3: (), Goto3: (), IfGoto3: ("cond",), Readln3: (), Println3: ("id",), Return3: ("id",),
+    TypeAssign3: ("value",), TypeAssignAtomAccess3: ("obj",), TypeAssignNew3: (), TypeAssignCall3: ("args",),
+    Assign3: ("result",), BinaryOp3: ("lhs", "rhs"), UnaryOp3: ("operand",), Phi3: ("args",)}
+
+# the field of a statement that it assigns to, a variable or the field of an object
+DEF_FIELDS : Dict[type, str] = {
+    Readln3: "id", TypeAssign3: "id", TypeAssignAtomAccess3: "id", TypeAssignNew3: "id", TypeAssignCall3: "id",
+    Assign3: "id", BinaryOp3: "target", UnaryOp3: "target", Phi3: "id"}
+
+# the statements that only compute the variable they define, and can go once it is not used. A call is
+# a TypeAssign3 too, so the type of a statement is looked up rather than tested with isinstance
+PURE_STMTS = {TypeAssign3, TypeAssignAtomAccess3, TypeAssignNew3, BinaryOp3, UnaryOp3, Phi3}
+
+INT_OPS = {"+": operator.add, "-": operator.sub, "*": operator.mul}
+COMPARE_OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne}
+BOOL_OPS = {"&&": operator.and_, "||": operator.or_, "==": operator.eq, "!=": operator.ne}
+
+
+def isVar(operand : Operand) -> bool:
+    return isinstance(operand, (Temp, Local, This))
+
+# the variable a statement defines, None if it stores to a field or defines nothing
+def defOf(stmt : Stmt3) -> Optional[Operand]:
+    field = DEF_FIELDS.get(type(stmt))
+    if field is None:
+        return None
+    var = getattr(stmt, field)
+    return var if isVar(var) else None
+
+# the variables a statement reads, once per occurrence, including the object of a field it stores to
+def usesOf(stmt : Stmt3) -> List[Operand]:
+    operands = []
+    for field in USE_FIELDS[type(stmt)]:
+        value = getattr(stmt, field)
+        operands += value if isinstance(value, list) else [value]
+    field = DEF_FIELDS.get(type(stmt))
+    if field is not None and isinstance(getattr(stmt, field), Field):
+        operands.append(getattr(stmt, field))
+    uses = []
+    for operand in operands:
+        while isinstance(operand, Field):
+            operand = operand.obj
+        if isVar(operand):
+            uses.append(operand)
+    return uses
+
+# replaces every variable the operand reads by fn(variable), the object of a field stays a variable
+def mapOperand(operand : Operand, fn : Callable[[Operand], Operand]) -> Operand:
+    if isinstance(operand, Field) and operand.obj is not None:
+        obj = mapOperand(operand.obj, fn)
+        if obj is operand.obj or not (isVar(obj) or isinstance(obj, Field)):
+            return operand
+        return Field(obj, operand.field)
+    return fn(operand) if isVar(operand) else operand
+
+# rewrites the variables a statement reads in place
+def mapUses(stmt : Stmt3, fn : Callable[[Operand], Operand]):
+    for field in USE_FIELDS[type(stmt)]:
+        value = getattr(stmt, field)
+        if isinstance(value, list):
+            setattr(stmt, field, [mapOperand(i, fn) for i in value])
+        else:
+            setattr(stmt, field, mapOperand(value, fn))
+    field = DEF_FIELDS.get(type(stmt))
+    if field is not None and isinstance(getattr(stmt, field), Field):
+        setattr(stmt, field, mapOperand(getattr(stmt, field), fn))
+
+def boolConst(value : bool) -> BoolConst:
+    return BoolConst("true" if value else "false")
+
+# Int arithmetic wraps around at 32 bits as it does on the target
+def intConst(value : int) -> IntConst:
+    return IntConst(str((value + 2**31) % 2**32 - 2**31))
+
+
+class BasicBlock:
+    __slots__ = ("num", "label", "phis", "stmts", "succs", "preds", "idom", "children", "frontier")
+
+    def __init__(self, num : int, label : Optional[str]):
+        self.num = num
+        self.label = label
+        self.phis : List[Phi3] = []
+        self.stmts : List[Stmt3] = [] # without the label, a jump or return only comes last
+        self.succs : List[int] = []
+        self.preds : List[int] = [] # in the order of the arguments of the phis
+        self.idom : Optional[int] = None
+        self.children : List[int] = [] # in the dominator tree
+        self.frontier : Set[int] = set()
+
+    def terminator(self) -> Optional[Stmt3]:
+        if self.stmts and isinstance(self.stmts[-1], (Goto3, IfGoto3, Return3)):
+            return self.stmts[-1]
+        return None
+
+
+class SSAMethod:
+    # a CMethod3 in SSA form. Its statements are split into basic blocks after an empty entry block, and
+    # every definition of a variable gets a name of its own, the variable with the number of the definition
+    # after a dot. The variable itself stands for its value at the entry of the method. Blocks that cannot
+    # be reached from the entry are dropped, the others keep the order of the method
+
+    def __init__(self, method : CMethod3):
+        self.method = method
+        self.types : Dict[str, ast.TypeId] = {}
+        self.blocks : List[BasicBlock] = []
+        self.labels : Dict[str, int] = {}
+        self.order : List[int] = [] # reverse postorder of the reachable blocks
+        self.defs : Dict[str, Tuple[BasicBlock, Stmt3]] = {}
+        self.uses : Dict[str, List[Tuple[BasicBlock, Stmt3]]] = {}
+        self.buildTypes()
+        self.buildBlocks()
+        self.buildDominators()
+        self.placePhis()
+        self.rename()
+        self.buildDefUse()
+
+    def __str__(self):
+        string = ""
+        for block in self.reachable():
+            string += f'  Block {block.num}' + (f' {block.label}' if block.label else '')
+            string += f' <- {block.preds} idom {block.idom}:\n'
+            string += ''.join(f'{stmt}\n' for stmt in block.phis + block.stmts)
+        return string
+
+    def reachable(self) -> List[BasicBlock]:
+        return [self.blocks[num] for num in sorted(self.order)]
+
+    def buildTypes(self):
+        for var in self.method.formals + self.method.body.varDecls:
+            self.types[var.id] = var.type
+        for stmt in self.method.body.stmts:
+            if isinstance(stmt, TypeAssign3):
+                self.types[stmt.id] = stmt.type
+            elif isinstance(stmt, BinaryOp3):
+                self.types[stmt.target] = stmt.type
+
+    def newBlock(self, label : Optional[str]) -> BasicBlock:
+        block = BasicBlock(len(self.blocks), label)
+        self.blocks.append(block)
+        return block
+
+    def addEdge(self, source : BasicBlock, dest : int):
+        if dest not in source.succs:
+            source.succs.append(dest)
+            self.blocks[dest].preds.append(source.num)
+
+    def buildBlocks(self):
+        self.newBlock(None)
+        block = self.newBlock(None)
+        for stmt in self.method.body.stmts:
+            if isinstance(stmt, Label3):
+                if block.stmts or block.label is not None:
+                    block = self.newBlock(stmt.label)
+                block.label = stmt.label
+                self.labels[stmt.label] = block.num
+            else:
+                block.stmts.append(stmt)
+                if isinstance(stmt, (Goto3, IfGoto3, Return3)):
+                    block = self.newBlock(None)
+
+        for block in self.blocks:
+            last = block.terminator()
+            if isinstance(last, (Goto3, IfGoto3)):
+                self.addEdge(block, self.labels[last.label])
+            if not isinstance(last, (Goto3, Return3)) and block.num + 1 < len(self.blocks):
+                self.addEdge(block, block.num + 1)
+
+    # orders the blocks reachable from the entry, the others lose their edges
+    def buildOrder(self):
+        visited = [False] * len(self.blocks)
+        visited[0] = True
+        postorder : List[int] = []
+        stack = [(0, iter(self.blocks[0].succs))]
+        while stack:
+            (num, succs) = stack[-1]
+            for succ in succs:
+                if not visited[succ]:
+                    visited[succ] = True
+                    stack.append((succ, iter(self.blocks[succ].succs)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(num)
+        self.order = postorder[::-1]
+        for block in self.blocks:
+            if not visited[block.num]:
+                for succ in block.succs:
+                    self.blocks[succ].preds.remove(block.num)
+                block.succs = []
+
+    # the dominator tree by the iteration of Cooper, Harvey and Kennedy over the reverse postorder,
+    # then the dominance frontiers from the join points
+    def buildDominators(self):
+        self.buildOrder()
+        position = {num: i for (i, num) in enumerate(self.order)}
+        idom : Dict[int, int] = {0: 0}
+        changed = True
+        while changed:
+            changed = False
+            for num in self.order[1:]:
+                new = None
+                for pred in self.blocks[num].preds:
+                    if pred not in idom:
+                        continue
+                    runner = pred
+                    while new is not None and runner != new:
+                        while position[runner] > position[new]:
+                            runner = idom[runner]
+                        while position[new] > position[runner]:
+                            new = idom[new]
+                    new = runner
+                if idom.get(num) != new:
+                    idom[num] = new
+                    changed = True
+
+        for block in self.blocks:
+            block.idom = None
+            block.children = []
+            block.frontier = set()
+        for num in self.order[1:]:
+            self.blocks[num].idom = idom[num]
+            self.blocks[idom[num]].children.append(num)
+        for num in self.order:
+            block = self.blocks[num]
+            if len(block.preds) < 2:
+                continue
+            for pred in block.preds:
+                runner = pred
+                while runner != block.idom:
+                    self.blocks[runner].frontier.add(num)
+                    runner = self.blocks[runner].idom
+
+    # phis go to the iterated dominance frontier of the definitions of a variable, only for the variables
+    # read in a block before it is assigned there
+    def placePhis(self):
+        exposed : Set[str] = set()
+        sites : Dict[str, List[int]] = {}
+        for num in self.order:
+            assigned : Set[str] = set()
+            for stmt in self.blocks[num].stmts:
+                for var in usesOf(stmt):
+                    if var not in assigned:
+                        exposed.add(var)
+                var = defOf(stmt)
+                if var is not None:
+                    assigned.add(var)
+                    sites.setdefault(var, []).append(num)
+
+        for (var, blocks) in sites.items():
+            if var not in exposed:
+                continue
+            defined = set(blocks)
+            placed : Set[int] = set()
+            work = list(defined)
+            while work:
+                for num in sorted(self.blocks[work.pop()].frontier):
+                    if num in placed:
+                        continue
+                    placed.add(num)
+                    block = self.blocks[num]
+                    block.phis.append(Phi3(self.types[var], var, [var] * len(block.preds)))
+                    if num not in defined:
+                        work.append(num)
+
+    def newName(self, var : Operand, stacks : Dict[str, List[Operand]], counts : Dict[str, int]) -> Operand:
+        counts[var] = counts.get(var, 0) + 1
+        name = type(var)(f"{var}.{counts[var]}")
+        self.types[name] = self.types[var]
+        stacks.setdefault(var, []).append(name)
+        return name
+
+    # walks the dominator tree with the names of every variable on a stack. The argument of a phi for a
+    # predecessor holds the variable until the predecessor is renamed
+    def rename(self):
+        stacks : Dict[str, List[Operand]] = {}
+        counts : Dict[str, int] = {}
+        current = lambda var: stacks[var][-1] if stacks.get(var) else var
+        work : List[Tuple[int, Optional[List[str]]]] = [(0, None)]
+        while work:
+            (num, pushed) = work.pop()
+            if pushed is not None:
+                for var in pushed:
+                    stacks[var].pop()
+                continue
+            block = self.blocks[num]
+            pushed = []
+            for phi in block.phis:
+                pushed.append(phi.id)
+                phi.id = self.newName(phi.id, stacks, counts)
+            for stmt in block.stmts:
+                mapUses(stmt, current)
+                var = defOf(stmt)
+                if var is not None:
+                    pushed.append(var)
+                    setattr(stmt, DEF_FIELDS[type(stmt)], self.newName(var, stacks, counts))
+            for succ in block.succs:
+                succBlock = self.blocks[succ]
+                j = succBlock.preds.index(num)
+                for phi in succBlock.phis:
+                    phi.args[j] = current(phi.args[j])
+            work.append((num, pushed))
+            work += [(child, None) for child in reversed(block.children)]
+
+    def buildDefUse(self):
+        self.defs = {}
+        self.uses = {}
+        for block in self.reachable():
+            for stmt in block.phis + block.stmts:
+                var = defOf(stmt)
+                if var is not None:
+                    self.defs[var] = (block, stmt)
+                for var in usesOf(stmt):
+                    self.uses.setdefault(var, []).append((block, stmt))
+
+    # -------------------------------------------------------------------------------------------
+    # sparse conditional constant propagation
+    # -------------------------------------------------------------------------------------------
+
+    # a variable without a definition holds its value at the entry, which is unknown
+    def valueOf(self, operand : Operand, values : Dict[str, Operand]) -> Operand:
+        if isinstance(operand, Const):
+            return operand
+        elif isVar(operand) and operand in self.defs:
+            return values.get(operand, TOP)
+        return BOTTOM
+
+    def meet(self, a : Operand, b : Operand) -> Operand:
+        if a == TOP:
+            return b
+        elif b == TOP:
+            return a
+        elif a == BOTTOM or b == BOTTOM or type(a) is not type(b) or a != b:
+            return BOTTOM
+        return a
+
+    def fold(self, op : str, lhs : Operand, rhs : Optional[Operand] = None) -> Operand:
+        if rhs is None:
+            if op == "-" and isinstance(lhs, IntConst):
+                return intConst(-int(lhs))
+            elif op == "!" and isinstance(lhs, BoolConst):
+                return boolConst(not lhs.value)
+        elif isinstance(lhs, IntConst) and isinstance(rhs, IntConst):
+            if op in INT_OPS:
+                return intConst(INT_OPS[op](int(lhs), int(rhs)))
+            elif op in COMPARE_OPS:
+                return boolConst(COMPARE_OPS[op](int(lhs), int(rhs)))
+        elif isinstance(lhs, BoolConst) and isinstance(rhs, BoolConst) and op in BOOL_OPS:
+            return boolConst(BOOL_OPS[op](lhs.value, rhs.value))
+        return BOTTOM
+
+    def evaluate(self, stmt : Stmt3, values : Dict[str, Operand]) -> Operand:
+        if type(stmt) is TypeAssign3:
+            return self.valueOf(stmt.value, values)
+        elif isinstance(stmt, Assign3):
+            return self.valueOf(stmt.result, values)
+        elif isinstance(stmt, (BinaryOp3, UnaryOp3)):
+            operands = [stmt.lhs, stmt.rhs] if isinstance(stmt, BinaryOp3) else [stmt.operand]
+            operands = [self.valueOf(i, values) for i in operands]
+            if BOTTOM in operands:
+                return BOTTOM
+            elif TOP in operands:
+                return TOP
+            return self.fold(stmt.op, *operands)
+        return BOTTOM
+
+    # the successors a reached statement makes reachable
+    def visit(self, block : BasicBlock, stmt : Stmt3, values : Dict[str, Operand], executable : Set[Tuple[int, int]],
+              flow : List[Tuple[int, int]], ssa : List[str]):
+        if isinstance(stmt, Phi3):
+            value = TOP
+            for (j, pred) in enumerate(block.preds):
+                if (pred, block.num) in executable:
+                    value = self.meet(value, self.valueOf(stmt.args[j], values))
+        elif isinstance(stmt, IfGoto3):
+            cond = self.valueOf(stmt.cond, values)
+            if cond != TOP and (cond == BOTTOM or cond.value):
+                flow.append((block.num, self.labels[stmt.label]))
+            if cond != TOP and (cond == BOTTOM or not cond.value) and block.num + 1 < len(self.blocks):
+                flow.append((block.num, block.num + 1))
+            return
+        elif isinstance(stmt, Goto3):
+            flow.append((block.num, self.labels[stmt.label]))
+            return
+        else:
+            value = self.evaluate(stmt, values)
+        var = defOf(stmt)
+        if var is not None:
+            old = values.get(var, TOP)
+            new = self.meet(old, value)
+            if new != old:
+                values[var] = new
+                ssa.append(var)
+
+    # the constants an operand of stmt can be replaced by, the code generator only loads a variable as
+    # the object of a field, prints no Bool constant and has no string operations
+    def constantFor(self, stmt : Stmt3, var : Operand, values : Dict[str, Operand]) -> Operand:
+        value = values.get(var)
+        if not isinstance(value, Const) or isinstance(stmt, TypeAssignAtomAccess3):
+            return var
+        elif isinstance(stmt, Println3) and not isinstance(value, (IntConst, StrConst)):
+            return var
+        elif isinstance(stmt, BinaryOp3) and isinstance(value, StrConst):
+            return var
+        return value
+
+    # Wegman and Zadeck: values flow along the def-use edges, and only from the blocks reached through
+    # the edges that a branch on a known condition can take. The unreached blocks and edges are removed,
+    # known conditions and values replace their branches and definitions
+    def propagateConstants(self):
+        values : Dict[str, Operand] = {}
+        executable : Set[Tuple[int, int]] = set()
+        reached : Set[int] = set()
+        flow : List[Tuple[int, int]] = [(-1, 0)]
+        ssa : List[str] = []
+        while flow or ssa:
+            if flow:
+                (pred, num) = flow.pop()
+                if (pred, num) in executable:
+                    continue
+                executable.add((pred, num))
+                block = self.blocks[num]
+                for phi in block.phis:
+                    self.visit(block, phi, values, executable, flow, ssa)
+                if num in reached:
+                    continue
+                reached.add(num)
+                for stmt in block.stmts:
+                    self.visit(block, stmt, values, executable, flow, ssa)
+                if not isinstance(block.terminator(), (Goto3, IfGoto3, Return3)):
+                    flow += [(num, succ) for succ in block.succs]
+            else:
+                var = ssa.pop()
+                for (block, stmt) in self.uses.get(var, []):
+                    if block.num in reached:
+                        self.visit(block, stmt, values, executable, flow, ssa)
+
+        for block in self.reachable():
+            if block.num not in reached:
+                continue
+            kept = [j for (j, pred) in enumerate(block.preds) if (pred, block.num) in executable]
+            block.preds = [block.preds[j] for j in kept]
+            for phi in block.phis:
+                phi.args = [phi.args[j] for j in kept]
+            block.succs = [succ for succ in block.succs if (block.num, succ) in executable]
+            last = block.terminator()
+            if isinstance(last, IfGoto3) and isinstance(values.get(last.cond, last.cond), BoolConst):
+                if values.get(last.cond, last.cond).value:
+                    block.stmts[-1] = Goto3(last.label)
+                else:
+                    block.stmts.pop()
+
+            constants = [phi for phi in block.phis if isinstance(values.get(phi.id), Const)]
+            block.phis = [phi for phi in block.phis if not isinstance(values.get(phi.id), Const)]
+            stmts = [TypeAssign3(phi.type, phi.id, values[phi.id]) for phi in constants]
+            for stmt in block.stmts:
+                var = defOf(stmt)
+                if var is not None and isinstance(values.get(var), Const) and (type(stmt) in PURE_STMTS or isinstance(stmt, Assign3)):
+                    stmt = TypeAssign3(self.types[var], var, values[var])
+                else:
+                    mapUses(stmt, lambda var: self.constantFor(stmt, var, values))
+                stmts.append(stmt)
+            block.stmts = stmts
+            for phi in block.phis:
+                mapUses(phi, lambda var: self.constantFor(phi, var, values))
+        for block in self.blocks:
+            if block.num not in reached:
+                block.preds = []
+                block.succs = []
+        self.buildDominators()
+        self.buildDefUse()
+
+    # -------------------------------------------------------------------------------------------
+    # copy propagation and dead code elimination
+    # -------------------------------------------------------------------------------------------
+
+    # the readers of a copy read its source, a phi whose arguments other than itself are one variable is a copy
+    def propagateCopies(self):
+        copies : Dict[str, Operand] = {}
+        for block in self.reachable():
+            for phi in block.phis:
+                sources = {i for i in phi.args if i != phi.id}
+                if len(sources) == 1 and isVar(next(iter(sources))):
+                    copies[phi.id] = next(iter(sources))
+            for stmt in block.stmts:
+                if type(stmt) is TypeAssign3 and isVar(stmt.value):
+                    copies[stmt.id] = stmt.value
+                elif isinstance(stmt, Assign3) and isVar(stmt.id) and isVar(stmt.result):
+                    copies[stmt.id] = stmt.result
+
+        def source(var : Operand) -> Operand:
+            chain = []
+            while var in copies and var not in chain:
+                chain.append(var)
+                var = copies[var]
+            for i in chain:
+                copies[i] = var
+            return var
+
+        for block in self.reachable():
+            for stmt in block.phis + block.stmts:
+                mapUses(stmt, source)
+        self.buildDefUse()
+
+    # marks the statements with an effect and, through the def-use edges, the definitions they read.
+    # Unmarked definitions go, including the cycles of phis that only read each other
+    def eliminateDeadCode(self):
+        live : Set[int] = set()
+        work : List[Stmt3] = []
+        for block in self.reachable():
+            for stmt in block.stmts:
+                if type(stmt) not in PURE_STMTS and not (isinstance(stmt, Assign3) and isVar(stmt.id)):
+                    live.add(id(stmt))
+                    work.append(stmt)
+        while work:
+            for var in usesOf(work.pop()):
+                if var in self.defs and id(self.defs[var][1]) not in live:
+                    live.add(id(self.defs[var][1]))
+                    work.append(self.defs[var][1])
+        for block in self.reachable():
+            block.phis = [phi for phi in block.phis if id(phi) in live]
+            block.stmts = [stmt for stmt in block.stmts if id(stmt) in live]
+        self.buildDefUse()
+
+    # -------------------------------------------------------------------------------------------
+    # out of SSA
+    # -------------------------------------------------------------------------------------------
+
+    # writes the method back without phis. Every phi gets a temporary of its own, each predecessor copies
+    # its argument to the temporary before it jumps, and the block copies the temporary to the phi. No copy
+    # overwrites a value another copy reads, so the critical edges need no blocks of their own. The
+    # variables only assigned by copies, unary operations or readln are declared
+    def destruct(self) -> CMethod3:
+        temps : Dict[int, Operand] = {}
+        for block in self.reachable():
+            for phi in block.phis:
+                temps[id(phi)] = Temp(f"_p{len(temps)}")
+
+        stmts : List[Stmt3] = []
+        for block in self.reachable():
+            if block.label is not None:
+                stmts.append(Label3(block.label))
+            stmts += [TypeAssign3(phi.type, phi.id, temps[id(phi)]) for phi in block.phis]
+            last = block.terminator()
+            stmts += block.stmts if last is None else block.stmts[:-1]
+            for succ in block.succs:
+                succBlock = self.blocks[succ]
+                j = succBlock.preds.index(block.num)
+                stmts += [TypeAssign3(phi.type, temps[id(phi)], phi.args[j]) for phi in succBlock.phis]
+            if last is not None:
+                stmts.append(last)
+        # the layout follows the blocks, so many jumps go to the next statement and many labels are only
+        # fallen into
+        stmts = [stmt for (i, stmt) in enumerate(stmts) if not (type(stmt) is Goto3 and i + 1 < len(stmts)
+                 and type(stmts[i + 1]) is Label3 and stmts[i + 1].label == stmt.label)]
+        targets = {stmt.label for stmt in stmts if isinstance(stmt, (Goto3, IfGoto3))}
+        stmts = [stmt for stmt in stmts if type(stmt) is not Label3 or stmt.label in targets]
+
+        referenced : Set[str] = set()
+        for stmt in stmts:
+            referenced.update(usesOf(stmt))
+            if defOf(stmt) is not None:
+                referenced.add(defOf(stmt))
+        varDecls = [var for var in self.method.body.varDecls if var.id in referenced]
+        declared = {var.id for var in self.method.formals + varDecls}
+        declared.update(stmt.id for stmt in stmts if isinstance(stmt, TypeAssign3))
+        declared.update(stmt.target for stmt in stmts if isinstance(stmt, BinaryOp3))
+        for stmt in stmts:
+            var = defOf(stmt)
+            if var is not None and var not in declared:
+                declared.add(var)
+                varDecls.append(VarDecl3(self.types[var], var))
+        self.method.body = Block3(varDecls, stmts)
+        return self.method
+
+
+class SSAOptimizer:
+    # optimizes every method in SSA form, each pass is linear in the size of the method and its SSA
+    # edges, then writes it back for the register allocator and the code generator
+
+    def __init__(self, program : Program3):
+        self.program = program
+
+    def optimize(self) -> Program3:
+        for method in self.program.cMethod3List:
+            ssa = SSAMethod(method)
+            ssa.propagateConstants()
+            ssa.propagateCopies()
+            ssa.eliminateDeadCode()
+            ssa.destruct()
+        return self.program
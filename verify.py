@@ -0,0 +1,293 @@
+# Ye Guoquan, A0188947A
+import os
+import sys
+import random
+import argparse
+from typing import Dict, List, Optional
+from lex import Lexer
+from parse import Parser
+from gen import Checker
+from ir3 import IR3, Program3, CMethod3, Operand, IntConst, BoolConst, StrConst, NullConst, Field, Label3, Goto3, \
+    IfGoto3, Readln3, Println3, Return3, TypeAssign3, TypeAssignAtomAccess3, TypeAssignNew3, TypeAssignCall3, \
+    Assign3, BinaryOp3, UnaryOp3
+from ssa import SSAOptimizer
+from arm import ArmGen
+
+
+class StepLimit(Exception):
+    pass
+
+
+class Object:
+    def __init__(self, cname: str):
+        self.cname = cname
+        self.fields = {}
+
+
+# runs the IR3 of a program and collects what it prints, ints wrap around at 32 bits as on the target.
+# readln reads 0, a program that runs over `limit` statements ends in TIMEOUT and one that fails in its error
+class Interpreter:
+    def __init__(self, program: Program3, limit: int = 200000):
+        self.program = program
+        self.methods: Dict[str, CMethod3] = {method.id: method for method in program.cMethod3List}
+        self.limit = limit
+        self.steps = 0
+        self.output: List[str] = []
+
+    def run(self) -> List[str]:
+        main = self.program.cMethod3List[0]
+        try:
+            self.call(main, [Object(str(main.formals[0].type))] + [0] * (len(main.formals) - 1))
+        except StepLimit:
+            self.output.append('TIMEOUT')
+        except Exception as e:
+            self.output.append(f'{type(e).__name__}')
+        return self.output
+
+    def value(self, operand: Optional[Operand], env: dict):
+        if operand is None or isinstance(operand, NullConst):
+            return None
+        if isinstance(operand, IntConst):
+            return int(operand)
+        if isinstance(operand, BoolConst):
+            return operand.value
+        if isinstance(operand, StrConst):
+            return str(operand)
+        if isinstance(operand, Field):
+            return self.object(operand, env).fields.get(operand.field, 0)
+        return env[operand]
+
+    def object(self, field: Field, env: dict) -> Object:
+        return env['this'] if field.obj is None else self.value(field.obj, env)
+
+    def store(self, target: Operand, value, env: dict):
+        if isinstance(target, Field):
+            self.object(target, env).fields[target.field] = value
+        else:
+            env[target] = value
+
+    def call(self, method: CMethod3, args: list):
+        env = {formal.id: arg for (formal, arg) in zip(method.formals, args)}
+        stmts = method.body.stmts
+        labels = {stmt.label: i for (i, stmt) in enumerate(stmts) if isinstance(stmt, Label3)}
+        pc = 0
+        while pc < len(stmts):
+            self.steps += 1
+            if self.steps > self.limit:
+                raise StepLimit()
+            stmt = stmts[pc]
+            pc += 1
+            kind = type(stmt)
+            if kind is Label3:
+                pass
+            elif kind is Goto3:
+                pc = labels[stmt.label]
+            elif kind is IfGoto3:
+                if self.value(stmt.cond, env) is True:
+                    pc = labels[stmt.label]
+            elif kind is Return3:
+                return self.value(stmt.id, env)
+            elif kind is Println3:
+                value = self.value(stmt.id, env)
+                self.output.append(str(value).lower() if isinstance(value, bool) else str(value))
+            elif kind is Readln3:
+                self.store(stmt.id, 0, env)
+            elif kind is TypeAssign3:
+                env[stmt.id] = self.value(stmt.value, env)
+            elif kind is TypeAssignAtomAccess3:
+                env[stmt.id] = self.value(stmt.obj, env).fields.get(stmt.field, 0)
+            elif kind is TypeAssignNew3:
+                env[stmt.id] = Object(str(stmt.cname))
+            elif kind is TypeAssignCall3:
+                args = [self.value(arg, env) for arg in stmt.args]
+                # calls on this are bound to the class of the object at run time
+                (receiver, _, rest) = stmt.call.partition("_")
+                label = env['this'].cname + "_" + rest if receiver == "this" else stmt.call
+                env[stmt.id] = self.call(self.methods[label], args)
+            elif kind is Assign3:
+                self.store(stmt.id, self.value(stmt.result, env), env)
+            elif kind is BinaryOp3:
+                env[stmt.target] = self.binary(stmt.op, self.value(stmt.lhs, env), self.value(stmt.rhs, env))
+            elif kind is UnaryOp3:
+                operand = self.value(stmt.operand, env)
+                env[stmt.target] = (not operand) if stmt.op == '!' else wrap(-operand)
+            else:
+                raise NotImplementedError(stmt)
+        return None
+
+    def binary(self, op: str, lhs, rhs):
+        if op == '+' and isinstance(lhs, str):
+            return lhs + str(rhs)
+        if op in ('&&', '||'):
+            return (lhs and rhs) if op == '&&' else (lhs or rhs)
+        if op in ('==', '!='):
+            return (lhs == rhs) == (op == '==')
+        return {
+            '+': lambda: wrap(lhs + rhs),
+            '-': lambda: wrap(lhs - rhs),
+            '*': lambda: wrap(lhs * rhs),
+            '/': lambda: wrap(abs(lhs) // abs(rhs) * (1 if (lhs < 0) == (rhs < 0) else -1)),
+            '<': lambda: lhs < rhs,
+            '<=': lambda: lhs <= rhs,
+            '>': lambda: lhs > rhs,
+            '>=': lambda: lhs >= rhs,
+        }[op]()
+
+
+def wrap(value: int) -> int:
+    return (value + 2**31) % 2**32 - 2**31
+
+
+INTS = ['a', 'b', 'c', 'd']
+BOOLS = ['p', 'q']
+
+
+# random JLite programs of nested if and while statements over a few locals, the fields of an object and
+# calls that read and write them. Every local is set before it is read and every loop is bounded
+class ProgramGenerator:
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        self.counters: List[str] = []
+
+    def int_expression(self, depth: int = 0) -> str:
+        r = self.random.random()
+        if depth > 2 or r < 0.3:
+            return self.random.choice(INTS + [str(self.random.randint(0, 9))])
+        if r < 0.4:
+            return 'h.v'
+        if r < 0.45:
+            return f'h.get({self.int_expression(depth + 1)})'
+        if r < 0.55:
+            return f'-({self.int_expression(depth + 1)})'
+        op = self.random.choice(['+', '-', '*'])
+        return f'{self.int_expression(depth + 1)} {op} {self.int_expression(depth + 1)}'
+
+    def bool_expression(self, depth: int = 0) -> str:
+        r = self.random.random()
+        if depth > 2 or r < 0.2:
+            return self.random.choice(BOOLS + ['true', 'false'])
+        if r < 0.55:
+            op = self.random.choice(['<', '<=', '>', '>=', '=='])
+            return f'{self.int_expression(depth + 1)} {op} {self.int_expression(depth + 1)}'
+        if r < 0.65:
+            return f'!({self.bool_expression(depth + 1)})'
+        if r < 0.7:
+            return 'h.w'
+        op = self.random.choice(['&&', '||'])
+        return f'{self.bool_expression(depth + 1)} {op} {self.bool_expression(depth + 1)}'
+
+    def statements(self, depth: int) -> str:
+        return ''.join(self.statement(depth) for _ in range(self.random.randint(1, 3)))
+
+    def statement(self, depth: int) -> str:
+        r = self.random.random()
+        indent = '  ' * (depth + 2)
+        if depth < 3 and r < 0.15:
+            return f'{indent}if ({self.bool_expression()}) {{\n{self.statements(depth + 1)}' \
+                   f'{indent}}} else {{\n{self.statements(depth + 1)}{indent}}}\n'
+        if depth < 3 and r < 0.25:
+            counter = f'i{len(self.counters)}'
+            self.counters.append(counter)
+            return f'{indent}{counter} = 0;\n{indent}while ({counter} < {self.random.randint(0, 4)}) {{\n' \
+                   f'{self.statements(depth + 1)}{indent}  {counter} = {counter} + 1;\n{indent}}}\n'
+        if r < 0.5:
+            return f'{indent}{self.random.choice(INTS)} = {self.int_expression()};\n'
+        if r < 0.62:
+            return f'{indent}{self.random.choice(BOOLS)} = {self.bool_expression()};\n'
+        if r < 0.75:
+            return f'{indent}println({self.random.choice(INTS + BOOLS)});\n'
+        if r < 0.82:
+            return f'{indent}h.v = {self.int_expression()};\n'
+        if r < 0.86:
+            return f'{indent}h.w = {self.bool_expression()};\n'
+        if r < 0.9:
+            return f'{indent}p = h.flip();\n'
+        if r < 0.95:
+            return f'{indent}h.v = h.v + {self.int_expression()};\n'
+        return f'{indent}println({self.int_expression()});\n'
+
+    def program(self) -> str:
+        body = ''.join(self.statement(0) for _ in range(self.random.randint(3, 12)))
+        declarations = ''.join(f'    Int {name};\n' for name in INTS + self.counters) \
+            + ''.join(f'    Bool {name};\n' for name in BOOLS)
+        initial = ''.join(f'    {name} = {self.random.randint(0, 5)};\n' for name in INTS)
+        return f'''class Main {{
+  Void main() {{
+{declarations}    Helper h;
+    h = new Helper();
+    h.v = 1;
+    h.w = false;
+{initial}    p = true;
+    q = false;
+{body}    println(a);
+    println(b);
+    println(h.v);
+    return;
+  }}
+}}
+class Helper {{
+  Int v;
+  Bool w;
+  Int get(Int k) {{
+    Int t;
+    t = k;
+    if (k > 3) {{
+      t = k - v;
+    }} else {{
+      v = v + 1;
+    }}
+    return t * 2;
+  }}
+  Bool flip() {{
+    w = !w;
+    return w;
+  }}
+}}
+'''
+
+
+# the output of the program before and after the SSA optimizer, and the error of the code generator on the
+# optimized program if it fails. The optimizer rewrites its input, so each side gets its own IR3
+def verify(source_code: str) -> Optional[str]:
+    tree = Parser(Lexer(source_code)).parse()
+    diagnostics = Checker().check(tree)
+    if len(diagnostics):
+        return f'check failed: {next(iter(diagnostics))}'
+    expected = Interpreter(IR3(tree).generateIR3()).run()
+    program = SSAOptimizer(IR3(tree).generateIR3()).optimize()
+    actual = Interpreter(program).run()
+    if actual != expected:
+        return f'printed {actual} instead of {expected}'
+    try:
+        ArmGen(program).genArm()
+    except Exception as e:
+        return f'code generation failed: {type(e).__name__} {e}'
+    return None
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('inputs', nargs='*', help='input files, generated programs are used if omitted')
+    argparser.add_argument('--programs', type=int, default=200, help='number of generated programs')
+    argparser.add_argument('--seed', type=int, default=0, help='seed of the first generated program')
+    argparser.add_argument('--save', help='directory the failing generated programs are written to')
+    args = argparser.parse_args()
+    if args.inputs:
+        sources = {}
+        for source_file in args.inputs:
+            with open(source_file) as f:
+                sources[source_file] = f.read()
+    else:
+        sources = {f'seed {seed}': ProgramGenerator(seed).program() for seed in range(args.seed, args.seed + args.programs)}
+    failures = 0
+    for (name, source_code) in sources.items():
+        error = verify(source_code)
+        if error is not None:
+            failures += 1
+            print(f'{name}: {error}')
+            if args.save and not args.inputs:
+                os.makedirs(args.save, exist_ok=True)
+                with open(os.path.join(args.save, name.replace(' ', '_') + '.j'), 'w') as f:
+                    f.write(source_code)
+    print(f'{failures} of {len(sources)} programs differ')
+    sys.exit(1 if failures else 0)
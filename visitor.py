@@ -0,0 +1,22 @@
+# Ye Guoquan, A0188947A
+from typing import Callable
+
+
+class Dispatch(dict):
+    # the handlers of one operation of a stage keyed by node class, called as table[type(node)](self, node, ...)
+    # a class without a handler of its own gets the handler of its nearest base class, looked up on
+    # its first node and kept, so that every later node of the class costs a single dict lookup
+
+    def register(self, *node_types: type) -> Callable[[Callable], Callable]:
+        def register_handler(handler: Callable) -> Callable:
+            for node_type in node_types:
+                self[node_type] = handler
+            return handler
+        return register_handler
+
+    def __missing__(self, node_type: type) -> Callable:
+        for base in node_type.__mro__[1:]:
+            if base in self:
+                handler = self[node_type] = self[base]
+                return handler
+        raise KeyError(node_type)